@@ -4,27 +4,82 @@ Finds replacement options for software
 """
 from typing import Dict, Any, List
 from agents.base_agent import BaseAgent
-import json
-import re
+from llm.json_stream import StreamAborted
+from llm.structured import OutputSchema
 
 
 class AlternativeDiscoveryAgent(BaseAgent):
     """Agent 1B: Find replacement alternatives"""
     
+    # Identical for every software item, so it is sent as the cached prompt prefix
+    DISCOVERY_INSTRUCTIONS = """Find the best replacement alternatives for the enterprise software described after these instructions.
+
+**Requirements:**
+Find 3-5 alternative solutions including:
+1. At least one commercial competitor
+2. At least one open-source option (if viable)
+3. One AI-powered or custom-built option (using Claude API, n8n, Python, etc.)
+
+Return every alternative in the "alternatives" list of the response schema. Fill in every field; use null only when a value is genuinely unknown."""
+    
+    # Streamed alternatives are written in groups of this many (and the rest when the stream ends)
+    SAVE_BATCH_SIZE = 5
+    
+    # Enums and ranges follow the CHECK constraints on alternative_solutions
+    OUTPUT_SCHEMA = OutputSchema("alternatives", {
+        "type": "object",
+        "properties": {
+            "alternatives": {
+                "type": "array",
+                "items": {
+                    "type": "object",
+                    "properties": {
+                        "name": {"type": "string"},
+                        "vendor": {"type": "string"},
+                        "type": {"type": "string", "enum": ["commercial", "open-source", "ai-powered", "custom-built", "hybrid"]},
+                        "annual_cost": {"type": ["number", "null"], "minimum": 0},
+                        "cost_savings_percentage": {"type": ["number", "null"]},
+                        "feature_parity_score": {"type": ["number", "null"], "minimum": 0, "maximum": 1},
+                        "missing_features": {"type": "array", "items": {"type": "string"}},
+                        "additional_capabilities": {"type": "array", "items": {"type": "string"}},
+                        "implementation_complexity": {"type": "string", "enum": ["low", "medium", "high", "very-high"]},
+                        "migration_time_weeks": {"type": ["integer", "null"], "minimum": 1},
+                        "migration_cost": {"type": ["number", "null"], "minimum": 0},
+                        "integration_compatibility": {"type": ["number", "null"], "minimum": 0, "maximum": 1},
+                        "api_quality": {"type": "string", "enum": ["excellent", "good", "limited", "none", "unknown"]},
+                        "replacement_risk": {"type": ["number", "null"], "minimum": 0, "maximum": 1},
+                        "rollback_difficulty": {"type": "string", "enum": ["easy", "moderate", "difficult", "impossible"]},
+                        "recommendation_status": {"type": "string", "enum": [
+                            "strongly-recommend", "recommend", "consider", "not-recommended", "needs-investigation"
+                        ]},
+                        "reasoning": {"type": "string"},
+                        "pilot_feasibility": {"type": "string", "enum": ["ideal", "possible", "difficult", "not-feasible"]},
+                        "payback_period_months": {"type": ["number", "null"], "minimum": 0}
+                    },
+                    "required": ["name", "vendor", "type", "annual_cost", "feature_parity_score",
+                                 "recommendation_status", "reasoning"]
+                }
+            }
+        },
+        "required": ["alternatives"]
+    }, "Record the replacement alternatives found for the software")
+    
     def __init__(self):
         super().__init__("Alternative Discovery Agent")
     
-    def find_alternatives(self, software_id: str) -> List[Dict[str, Any]]:
+    def find_alternatives(self, software_id: str, software: Dict[str, Any] = None) -> List[Dict[str, Any]]:
         """
         Find alternative solutions for a software product
         
         Args:
             software_id: ID of software to find alternatives for
+            software: Preloaded software_assets row (skips the lookup)
             
         Returns:
             List of alternative solutions with analysis
         """
-        software = self.db.get_software_by_id(software_id)
+        if software is None:
+            software = self.db.get_software_by_id(software_id)
         if not software:
             raise ValueError(f"Software not found: {software_id}")
         
@@ -49,9 +104,36 @@ For each alternative, assess:
 
 Prioritize practical, proven solutions over experimental ones."""
 
-        response = self.call_claude(prompt, system_prompt)
-        alternatives = self._parse_alternatives(response, software)
-        self._save_alternatives(software_id, alternatives)
+        alternatives = []
+        unsaved = []
+        
+        def save_alternative(alt):
+            # Collected as the model finishes each (schema-valid) element, written in bulk
+            alt = self._normalize_alternative(alt)
+            alternatives.append(alt)
+            unsaved.append(alt)
+            if len(unsaved) >= self.SAVE_BATCH_SIZE:
+                self._save_alternatives(software_id, unsaved)
+                unsaved.clear()
+        
+        with self.track_usage() as usage:
+            try:
+                self.stream_claude_items(
+                    prompt, system_prompt,
+                    on_item=save_alternative,
+                    prompt_prefix=self.DISCOVERY_INSTRUCTIONS,
+                    output_schema=self.OUTPUT_SCHEMA,
+                    items_key="alternatives"
+                )
+            except StreamAborted as e:
+                # Keep the alternatives that arrived intact before the stream went wrong
+                self.log(f"Raw response: {e.text[:500]}")
+            finally:
+                if unsaved:
+                    self._save_alternatives(software_id, unsaved)
+
+            self.save_usage(usage, "alternative_discovery", subject=software['software_name'],
+                            software_id=software_id)
         
         self.log(f"Found {len(alternatives)} alternatives for {software['software_name']}")
         
@@ -59,7 +141,7 @@ Prioritize practical, proven solutions over experimental ones."""
     
     def _create_discovery_prompt(self, software: Dict[str, Any]) -> str:
         """Create alternative discovery prompt"""
-        prompt = f"""Find the best replacement alternatives for this enterprise software:
+        prompt = f"""Find alternatives for this enterprise software:
 
 **Current Software:**
 - Name: {software['software_name']}
@@ -69,77 +151,9 @@ Prioritize practical, proven solutions over experimental ones."""
 - Users: {software.get('total_licenses', 'N/A')}
 - Use Case: {software.get('primary_use_case', 'Not specified')}
 - Business Criticality: {software['business_criticality']}
-- Integration Complexity: {software.get('integration_complexity', 'Unknown')}
-
-**Requirements:**
-Find 3-5 alternative solutions including:
-1. At least one commercial competitor
-2. At least one open-source option (if viable)
-3. One AI-powered or custom-built option (using Claude API, n8n, Python, etc.)
-
-For each alternative, provide a JSON object with these EXACT fields.
-
-Return ONLY a JSON array of alternatives. No markdown, no explanations, just valid JSON array.
-
-Example format:
-[
-  {{
-    "name": "Alternative Name",
-    "vendor": "Vendor Name",
-    "type": "commercial",
-    "annual_cost": 50000,
-    "cost_savings_percentage": 75.5,
-    "feature_parity_score": 0.85,
-    "missing_features": ["feature1"],
-    "additional_capabilities": ["capability1"],
-    "implementation_complexity": "medium",
-    "migration_time_weeks": 8,
-    "migration_cost": 45000,
-    "integration_compatibility": 0.90,
-    "api_quality": "excellent",
-    "replacement_risk": 0.35,
-    "rollback_difficulty": "moderate",
-    "recommendation_status": "strongly-recommend",
-    "reasoning": "Great alternative with 75% savings",
-    "pilot_feasibility": "ideal",
-    "payback_period_months": 6
-  }}
-]"""
+- Integration Complexity: {software.get('integration_complexity', 'Unknown')}"""
         return prompt
     
-    def _parse_alternatives(self, response: str, software: Dict[str, Any]) -> List[Dict[str, Any]]:
-        """Parse Claude's alternative recommendations"""
-        try:
-            response = response.strip()
-            
-            if "```json" in response:
-                response = response.split("```json")[1].split("```")[0].strip()
-            elif "```" in response:
-                response = response.split("```")[1].split("```")[0].strip()
-            
-            json_match = re.search(r'\[.*\]', response, re.DOTALL)
-            if json_match:
-                json_str = json_match.group(0)
-            else:
-                json_str = response
-            
-            alternatives = json.loads(json_str)
-            
-            if isinstance(alternatives, dict):
-                alternatives = [alternatives]
-            
-            normalized = []
-            for alt in alternatives:
-                if isinstance(alt, dict) and alt.get('name'):
-                    normalized.append(self._normalize_alternative(alt))
-            
-            return normalized
-            
-        except Exception as e:
-            self.log(f"Error parsing alternatives: {e}")
-            self.log(f"Raw response: {response[:500]}")
-            return []
-    
     def _normalize_alternative(self, alt: Dict[str, Any]) -> Dict[str, Any]:
         """Normalize alternative fields to match database schema"""
         return {
@@ -165,49 +179,55 @@ Example format:
         }
     
     def _save_alternatives(self, software_id: str, alternatives: List[Dict[str, Any]]):
-        """Save alternatives to database"""
+        """Save alternatives to database in one bulk insert"""
+        rows = []
         for alt in alternatives:
-            try:
-                if not alt.get('name'):
-                    self.log("Skipping alternative with no name")
-                    continue
-                
-                query = """
-                    INSERT INTO alternative_solutions (
-                        original_software_id, alternative_name, alternative_vendor,
-                        alternative_type, cost_comparison, cost_savings_percentage,
-                        feature_parity_score, implementation_complexity,
-                        estimated_migration_time_weeks, estimated_migration_cost,
-                        integration_compatibility_score, api_quality,
-                        replacement_risk_score, rollback_difficulty,
-                        recommendation_status, recommendation_reasoning,
-                        pilot_feasibility, payback_period_months
-                    ) VALUES (
-                        %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s
-                    )
-                """
-                
-                self.db.execute_update(query, (
-                    software_id,
-                    alt.get('name'),
-                    alt.get('vendor'),
-                    alt.get('type'),
-                    alt.get('annual_cost'),
-                    alt.get('cost_savings_percentage'),
-                    alt.get('feature_parity_score'),
-                    alt.get('implementation_complexity'),
-                    alt.get('migration_time_weeks'),
-                    alt.get('migration_cost'),
-                    alt.get('integration_compatibility'),
-                    alt.get('api_quality'),
-                    alt.get('replacement_risk'),
-                    alt.get('rollback_difficulty'),
-                    alt.get('recommendation_status'),
-                    alt.get('reasoning'),
-                    alt.get('pilot_feasibility'),
-                    alt.get('payback_period_months')
-                ))
-                
-                self.log(f"✓ Saved alternative: {alt.get('name')}")
-            except Exception as e:
-                self.log(f"✗ Error saving alternative: {e}")
+            if not alt.get('name'):
+                self.log("Skipping alternative with no name")
+                continue
+            
+            rows.append((
+                software_id,
+                alt.get('name'),
+                alt.get('vendor'),
+                alt.get('type'),
+                alt.get('annual_cost'),
+                alt.get('cost_savings_percentage'),
+                alt.get('feature_parity_score'),
+                alt.get('implementation_complexity'),
+                alt.get('migration_time_weeks'),
+                alt.get('migration_cost'),
+                alt.get('integration_compatibility'),
+                alt.get('api_quality'),
+                alt.get('replacement_risk'),
+                alt.get('rollback_difficulty'),
+                alt.get('recommendation_status'),
+                alt.get('reasoning'),
+                alt.get('pilot_feasibility'),
+                alt.get('payback_period_months')
+            ))
+        
+        if not rows:
+            return
+        
+        try:
+            # One multi-row insert; if a bad row breaks it, the others are saved row by row
+            _, failed = self.db.bulk_insert_tolerant(
+                "alternative_solutions",
+                [
+                    "original_software_id", "alternative_name", "alternative_vendor",
+                    "alternative_type", "cost_comparison", "cost_savings_percentage",
+                    "feature_parity_score", "implementation_complexity",
+                    "estimated_migration_time_weeks", "estimated_migration_cost",
+                    "integration_compatibility_score", "api_quality",
+                    "replacement_risk_score", "rollback_difficulty",
+                    "recommendation_status", "recommendation_reasoning",
+                    "pilot_feasibility", "payback_period_months"
+                ],
+                rows
+            )
+            for row, error in failed:
+                self.log(f"✗ Skipped alternative {row[1]}: {str(error).strip()}")
+            self.log(f"✓ Saved {len(rows) - len(failed)} alternatives")
+        except Exception as e:
+            self.log(f"✗ Error saving alternatives: {e}")
@@ -2,10 +2,15 @@
 PRISM Base Agent Class
 All agents inherit from this
 """
-import anthropic
-from typing import Dict, Any, List
-from config.settings import ANTHROPIC_API_KEY, CLAUDE_MODEL, MAX_TOKENS
+import json
+from typing import Dict, Any, Callable, List, Tuple
+from agents.governor import get_governor
+from config.settings import CLAUDE_MODEL, MAX_TOKENS
 from database.db import Database
+from llm.client import LLMClient, is_json_response
+from llm.json_stream import JSONArrayStream, StreamAborted
+from llm.structured import OutputSchema, coerce
+from llm.metrics import LLM_USAGE, UsageScope
 
 
 class BaseAgent:
@@ -13,43 +18,214 @@ class BaseAgent:
     
     def __init__(self, name: str):
         self.name = name
-        self.client = anthropic.Anthropic(api_key=ANTHROPIC_API_KEY)
+        self.llm = LLMClient(agent_name=name)
         self.db = Database()
         self.model = CLAUDE_MODEL
     
-    def call_claude(self, prompt: str, system_prompt: str = None) -> str:
+    def call_claude(self,
+                    prompt: str,
+                    system_prompt: str = None,
+                    bypass_cache: bool = False,
+                    prompt_prefix: str = None) -> str:
         """
         Call Claude API with a prompt
         
+        Identical prompts are served from the LLM response cache
+        (see llm/cache.py) until the agent's TTL expires. Live calls wait
+        on the shared rate limiter, so this is safe to call from the
+        workers of llm.executor.get_executor(). Concurrent identical calls
+        (e.g. two runs analysing the same vendor) wait on one request.
+        Near the run budget, a cheaper model is used (see call_limits).
+        
         Args:
             prompt: User prompt
             system_prompt: Optional system prompt
+            bypass_cache: Force a fresh call even if a cached answer exists
+            prompt_prefix: Instructions/output schema shared by every call of
+                this agent; sent before ``prompt`` and cached provider-side
             
         Returns:
             Claude's response text
         """
-        messages = [{"role": "user", "content": prompt}]
+        model, max_tokens = self.call_limits()
+        try:
+            response = self.llm.complete(
+                prompt,
+                system_prompt=system_prompt,
+                model=model,
+                max_tokens=max_tokens,
+                bypass_cache=bypass_cache,
+                prompt_prefix=prompt_prefix
+            )
+            return response.text
+        except Exception as e:
+            print(f"Error calling Claude API: {e}")
+            raise
+    
+    def call_claude_json(self,
+                         prompt: str,
+                         output_schema: OutputSchema,
+                         system_prompt: str = None,
+                         bypass_cache: bool = False,
+                         prompt_prefix: str = None) -> Tuple[Any, str]:
+        """
+        Call Claude for an answer matching ``output_schema``
+        
+        The schema is enforced through a forced tool call; answers that
+        still fail validation get one cheap repair call (see
+        LLMClient.complete_json).
+        
+        Returns:
+            (parsed answer, raw response text)
+            
+        Raises:
+            StructuredOutputError: the answer could not be repaired
+        """
+        model, max_tokens = self.call_limits()
+        value, response = self.llm.complete_json(
+            prompt,
+            output_schema,
+            system_prompt=system_prompt,
+            model=model,
+            max_tokens=max_tokens,
+            bypass_cache=bypass_cache,
+            prompt_prefix=prompt_prefix
+        )
+        return value, response.text
+    
+    def stream_claude_items(self,
+                            prompt: str,
+                            system_prompt: str = None,
+                            on_item: Callable[[Any], None] = None,
+                            bypass_cache: bool = False,
+                            prompt_prefix: str = None,
+                            output_schema: OutputSchema = None,
+                            items_key: str = None) -> Tuple[str, List[Any]]:
+        """
+        Call Claude for a JSON array and handle its elements as they stream in
+        
+        Each element is parsed (and passed to ``on_item``) as soon as it is
+        complete. A response that stops looking like the requested JSON is
+        aborted early instead of being read to the end.
+        
+        Args:
+            prompt: User prompt
+            system_prompt: Optional system prompt
+            on_item: Called with each completed array element
+            bypass_cache: Force a fresh call even if a cached answer exists
+            prompt_prefix: Instructions/output schema shared by every call of this agent
+            output_schema: Enforce this schema; the array is its ``items_key``
+                property and each element is coerced and validated on arrival
+                (elements that fail are repaired one by one after the stream)
+            items_key: Array property of ``output_schema`` to stream
+            
+        Returns:
+            (response text, parsed elements)
+            
+        Raises:
+            StreamAborted: the response was malformed or truncated; its
+                ``text`` and ``items`` hold what arrived before that
+        """
+        parser = JSONArrayStream(nested=output_schema is not None)
+        item_schema = output_schema.item_schema(items_key) if output_schema else None
+        items, invalid = [], []
         
-        kwargs = {
-            "model": self.model,
-            "max_tokens": MAX_TOKENS,
-            "messages": messages
-        }
+        def accept(item):
+            items.append(item)
+            if on_item:
+                on_item(item)
         
-        if system_prompt:
-            kwargs["system"] = system_prompt
+        def on_text(chunk: str):
+            for item in parser.feed(chunk):
+                if item_schema:
+                    item = coerce(item, item_schema.schema)
+                    errors = item_schema.errors(item)
+                    if errors:
+                        invalid.append((item, errors))
+                        continue
+                accept(item)
         
+        def repair_invalid():
+            # Targeted repair: only the elements that failed, not the whole answer
+            for item, errors in invalid:
+                repaired, remaining = self.llm.repair_output(json.dumps(item), item_schema, errors)
+                if remaining:
+                    self.log(f"Dropped invalid item: {remaining[0]}")
+                else:
+                    accept(repaired)
+        
+        model, max_tokens = self.call_limits()
         try:
-            response = self.client.messages.create(**kwargs)
-            return response.content[0].text
-        except Exception as e:
-            print(f"Error calling Claude API: {e}")
+            response = self.llm.complete(
+                prompt,
+                system_prompt=system_prompt,
+                model=model,
+                max_tokens=max_tokens,
+                bypass_cache=bypass_cache,
+                validate=output_schema.accepts if output_schema else is_json_response,
+                prompt_prefix=prompt_prefix,
+                on_text=on_text,
+                output_schema=output_schema
+            )
+            parser.close()
+        except StreamAborted as e:
+            self.log(f"Aborted response after {len(e.text)} characters, {len(e.items)} items: {e}")
+            # Salvage what arrived; a deadline or interrupt gets no more paid calls or writes
+            repair_invalid()
             raise
+        repair_invalid()
+        
+        if response.ttft is not None:
+            self.log(f"First token after {response.ttft:.2f}s, {len(items)} items in {response.wall_time:.2f}s")
+        return response.text, items
+    
+    def call_limits(self) -> Tuple[str, int]:
+        """
+        Model and max_tokens for the next call
+
+        The agent's own unless the run governor (agents/governor.py) has
+        switched to its cheaper settings as the run budget runs low.
+        """
+        return get_governor().call_limits(self.model, MAX_TOKENS)
+    
+    def track_usage(self):
+        """
+        Collect the tokens and time of the LLM calls made inside the block
+
+        Use around one analysis and pass the yielded scope to save_usage (or save_analysis).
+        """
+        return LLM_USAGE.scope()
     
     def log(self, message: str):
         """Log a message"""
         print(f"[{self.name}] {message}")
     
+    def save_usage(self,
+                   usage: UsageScope,
+                   analysis_type: str,
+                   subject: str = None,
+                   software_id: str = None) -> str:
+        """Save the LLM tokens, cost, time, retries and models of one analysis under the current run id"""
+        try:
+            return self.db.save_llm_usage(
+                run_id=LLM_USAGE.run_id,
+                agent_name=self.name,
+                analysis_type=analysis_type,
+                tokens=usage.tokens,
+                calls=usage.calls,
+                cost_usd=usage.cost_usd,
+                llm_time_seconds=usage.llm_time,
+                processing_time_seconds=usage.processing_time_seconds,
+                subject=subject,
+                software_id=software_id,
+                retries=usage.retries,
+                ttft_seconds=usage.ttft_seconds,
+                models=sorted(usage.models)
+            )
+        except Exception as e:
+            self.log(f"Error saving LLM usage: {e}")
+            return None
+    
     def save_analysis(self, 
                      software_id: str,
                      analysis_type: str,
@@ -57,15 +233,22 @@ class BaseAgent:
                      structured_findings: Dict[str, Any],
                      key_insights: List[str],
                      recommendations: List[str],
-                     confidence_score: float) -> str:
-        """Save analysis results to database"""
-        return self.db.save_agent_analysis(
-            software_id=software_id,
-            agent_name=self.name,
-            analysis_type=analysis_type,
-            raw_findings=raw_findings,
-            structured_findings=structured_findings,
-            key_insights=key_insights,
-            recommendations=recommendations,
-            confidence_score=confidence_score
-        )
+                     confidence_score: float,
+                     usage: UsageScope = None) -> str:
+        """Save analysis results to database (with token/time figures from ``usage``)"""
+        try:
+            return self.db.save_agent_analysis(
+                software_id=software_id,
+                agent_name=self.name,
+                analysis_type=analysis_type,
+                raw_findings=raw_findings,
+                structured_findings=structured_findings,
+                key_insights=key_insights,
+                recommendations=recommendations,
+                confidence_score=confidence_score,
+                tokens_used=usage.tokens_used if usage else None,
+                processing_time_seconds=usage.processing_time_seconds if usage else None
+            )
+        except Exception as e:
+            self.log(f"Error saving analysis: {e}")
+            return None
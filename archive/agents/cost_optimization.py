@@ -4,43 +4,129 @@ Finds immediate savings without replacement
 """
 from typing import Dict, Any, List
 from agents.base_agent import BaseAgent
+from llm.structured import OutputSchema, StructuredOutputError
 import json
-import re
 
 
 class CostOptimizationAgent(BaseAgent):
     """Agent 2A: Identify cost optimization opportunities"""
     
+    # Identical for every software item, so it is sent as the cached prompt prefix
+    OPTIMIZATION_INSTRUCTIONS = """**Task:** Identify immediate cost savings opportunities WITHOUT replacing the software described after these instructions.
+
+Analyze these areas:
+
+1. **License Right-Sizing**
+   - How many unused licenses can be removed?
+   - What's the optimal license count?
+   - Immediate savings from license reduction?
+
+2. **Feature Tier Optimization**
+   - Are we on the right tier?
+   - Any underutilized premium features?
+   - Could we downgrade tiers and save money?
+
+3. **Usage Pattern Improvements**
+   - Can we reduce costs through better usage practices?
+   - Training needs to improve utilization?
+
+4. **Contract Negotiation Points**
+   - Leverage points for renewal negotiation
+   - Expected discount percentage
+   - Best timing for negotiation
+
+5. **Total Savings Opportunity**
+   - Immediate savings (license reduction)
+   - Annual recurring savings
+   - One-time savings
+   - Negotiation savings potential
+
+Return the analysis in the response schema, with savings in USD per year unless stated otherwise."""
+    
+    OUTPUT_SCHEMA = OutputSchema("cost_optimization", {
+        "type": "object",
+        "properties": {
+            "license_optimization": {
+                "type": "object",
+                "properties": {
+                    "current_licenses": {"type": ["integer", "null"], "minimum": 0},
+                    "recommended_licenses": {"type": ["integer", "null"], "minimum": 0},
+                    "licenses_to_remove": {"type": ["integer", "null"], "minimum": 0},
+                    "immediate_savings": {"type": ["number", "null"], "minimum": 0}
+                },
+                "required": ["current_licenses", "recommended_licenses", "licenses_to_remove", "immediate_savings"]
+            },
+            "tier_optimization": {
+                "type": "object",
+                "properties": {
+                    "current_tier": {"type": "string"},
+                    "recommended_tier": {"type": "string"},
+                    "annual_savings": {"type": ["number", "null"], "minimum": 0}
+                },
+                "required": ["current_tier", "recommended_tier", "annual_savings"]
+            },
+            "negotiation_leverage": {
+                "type": "object",
+                "properties": {
+                    "leverage_points": {"type": "array", "items": {"type": "string"}},
+                    "target_discount_percentage": {"type": ["number", "null"], "minimum": 0, "maximum": 100},
+                    "estimated_savings": {"type": ["number", "null"], "minimum": 0}
+                },
+                "required": ["leverage_points", "target_discount_percentage", "estimated_savings"]
+            },
+            "total_savings": {
+                "type": "object",
+                "properties": {
+                    "immediate": {"type": ["number", "null"], "minimum": 0},
+                    "annual_recurring": {"type": ["number", "null"], "minimum": 0},
+                    "negotiation_potential": {"type": ["number", "null"], "minimum": 0},
+                    "total": {"type": ["number", "null"], "minimum": 0}
+                },
+                "required": ["immediate", "annual_recurring", "negotiation_potential", "total"]
+            },
+            "recommendations": {"type": "array", "items": {"type": "string"}},
+            "implementation_steps": {"type": "array", "items": {"type": "string"}}
+        },
+        "required": ["license_optimization", "tier_optimization", "negotiation_leverage", "total_savings",
+                     "recommendations", "implementation_steps"]
+    }, "Record the cost optimization analysis")
+    
     def __init__(self):
         super().__init__("Cost Optimization Agent")
     
-    def analyze_costs(self, software_id: str) -> Dict[str, Any]:
+    def analyze_costs(self,
+                      software_id: str,
+                      software: Dict[str, Any] = None,
+                      usage: Dict[str, Any] = None) -> Dict[str, Any]:
         """
         Analyze software for cost optimization opportunities
         
         Args:
             software_id: ID of software to analyze
+            software: Preloaded software_assets row (skips the lookup)
+            usage: Preloaded latest usage_analytics row; only used together
+                with ``software`` (None then means no usage data)
             
         Returns:
             Cost optimization recommendations
         """
-        # Get software and usage data
-        software = self.db.get_software_by_id(software_id)
-        if not software:
-            raise ValueError(f"Software not found: {software_id}")
+        # Get software and usage data unless the caller batch-loaded them
+        if software is None:
+            software = self.db.get_software_by_id(software_id)
+            if not software:
+                raise ValueError(f"Software not found: {software_id}")
+            
+            usage_query = """
+                SELECT * FROM usage_analytics 
+                WHERE software_id = %s 
+                ORDER BY analysis_date DESC 
+                LIMIT 1
+            """
+            usage_data = self.db.execute_query(usage_query, (software_id,))
+            usage = usage_data[0] if usage_data else None
         
         self.log(f"Analyzing costs for: {software['software_name']}")
         
-        # Get usage data if available
-        usage_query = """
-            SELECT * FROM usage_analytics 
-            WHERE software_id = %s 
-            ORDER BY analysis_date DESC 
-            LIMIT 1
-        """
-        usage_data = self.db.execute_query(usage_query, (software_id,))
-        usage = usage_data[0] if usage_data else None
-        
         # Create optimization prompt
         prompt = self._create_optimization_prompt(software, usage)
         
@@ -55,15 +141,22 @@ Your job is to find immediate cost savings WITHOUT replacing the software, throu
 
 Be specific about savings amounts and implementation steps."""
 
-        # Get Claude's analysis
-        response = self.call_claude(prompt, system_prompt)
+        with self.track_usage() as llm_usage:
+            # Get Claude's analysis, structured by OUTPUT_SCHEMA
+            try:
+                optimization, _ = self.call_claude_json(
+                    prompt, self.OUTPUT_SCHEMA, system_prompt, prompt_prefix=self.OPTIMIZATION_INSTRUCTIONS
+                )
+            except StructuredOutputError as e:
+                self.log(f"Error parsing optimization: {e}")
+                optimization = self._fallback_optimization(software)
         
-        # Parse optimization recommendations
-        optimization = self._parse_optimization(response, software, usage)
-        
-        # Save to database
-        if usage:
-            self._update_usage_analytics(software_id, optimization)
+            # Save to database
+            if usage:
+                self._update_usage_analytics(software_id, optimization)
+
+            self.save_usage(llm_usage, "cost_optimization", subject=software.get('software_name'),
+                            software_id=software_id)
         
         total_savings = optimization.get('total_savings', {}).get('total', 0) or 0
         self.log(f"Identified ${total_savings:,.0f} in potential savings")
@@ -99,128 +192,38 @@ Be specific about savings amounts and implementation steps."""
 - Active Users: {software.get('active_users', 'N/A')}
 - Utilization Rate: {software.get('utilization_rate', 'N/A')}%
 
-{usage_info}
-
-**Task:** Identify immediate cost savings opportunities WITHOUT replacing the software.
-
-Analyze these areas:
-
-1. **License Right-Sizing**
-   - How many unused licenses can be removed?
-   - What's the optimal license count?
-   - Immediate savings from license reduction?
-
-2. **Feature Tier Optimization**
-   - Are we on the right tier?
-   - Any underutilized premium features?
-   - Could we downgrade tiers and save money?
-
-3. **Usage Pattern Improvements**
-   - Can we reduce costs through better usage practices?
-   - Training needs to improve utilization?
-
-4. **Contract Negotiation Points**
-   - Leverage points for renewal negotiation
-   - Expected discount percentage
-   - Best timing for negotiation
-
-5. **Total Savings Opportunity**
-   - Immediate savings (license reduction)
-   - Annual recurring savings
-   - One-time savings
-   - Negotiation savings potential
-
-Return ONLY valid JSON with this structure (no markdown, no explanations):
-
-{{
-  "license_optimization": {{
-    "current_licenses": 100,
-    "recommended_licenses": 75,
-    "licenses_to_remove": 25,
-    "immediate_savings": 50000
-  }},
-  "tier_optimization": {{
-    "current_tier": "Enterprise",
-    "recommended_tier": "Professional",
-    "annual_savings": 30000
-  }},
-  "negotiation_leverage": {{
-    "leverage_points": ["usage decline", "competitive alternatives"],
-    "target_discount_percentage": 20,
-    "estimated_savings": 40000
-  }},
-  "total_savings": {{
-    "immediate": 50000,
-    "annual_recurring": 30000,
-    "negotiation_potential": 40000,
-    "total": 120000
-  }},
-  "recommendations": [
-    "Reduce licenses from 100 to 75",
-    "Downgrade to Professional tier",
-    "Negotiate 20% discount at renewal"
-  ],
-  "implementation_steps": [
-    "Step 1: Audit current license usage",
-    "Step 2: Remove inactive users",
-    "Step 3: Contact vendor for tier change"
-  ]
-}}"""
+{usage_info}"""
 
         return prompt
     
-    def _parse_optimization(self, response: str, software: Dict[str, Any], usage: Dict[str, Any]) -> Dict[str, Any]:
-        """Parse optimization recommendations"""
-        try:
-            # Clean up response
-            response = response.strip()
-            
-            # Remove markdown if present
-            if "```json" in response:
-                response = response.split("```json")[1].split("```")[0].strip()
-            elif "```" in response:
-                response = response.split("```")[1].split("```")[0].strip()
-            
-            # Find JSON object
-            json_match = re.search(r'\{.*\}', response, re.DOTALL)
-            if json_match:
-                json_str = json_match.group(0)
-            else:
-                json_str = response
-            
-            optimization = json.loads(json_str)
-            return optimization
-            
-        except Exception as e:
-            self.log(f"Error parsing optimization: {e}")
-
-            # Return fallback optimization structure
-            return {
-                "license_optimization": {
-                    "current_licenses": software.get('total_licenses', 0),
-                    "recommended_licenses": software.get('active_users', 0),
-                    "licenses_to_remove": 0,
-                    "immediate_savings": 0
-                },
-                "tier_optimization": {
-                    "current_tier": "Unknown",
-                    "recommended_tier": "Unknown",
-                    "annual_savings": 0
-                },
-                "negotiation_leverage": {
-                    "leverage_points": [],
-                    "target_discount_percentage": 0,
-                    "estimated_savings": 0
-                },
-                "total_savings": {
-                    "immediate": 0,
-                    "annual_recurring": 0,
-                    "negotiation_potential": 0,
-                    "total": 0
-                },
-                "recommendations": [],
-                "implementation_steps": []
-            }
+    def _fallback_optimization(self, software: Dict[str, Any]) -> Dict[str, Any]:
+        """Zero-savings structure used when the model's answer could not be repaired"""
+        return {
+            "license_optimization": {
+                "current_licenses": software.get('total_licenses', 0),
+                "recommended_licenses": software.get('active_users', 0),
+                "licenses_to_remove": 0,
+                "immediate_savings": 0
+            },
+            "tier_optimization": {
+                "current_tier": "Unknown",
+                "recommended_tier": "Unknown",
+                "annual_savings": 0
+            },
+            "negotiation_leverage": {
+                "leverage_points": [],
+                "target_discount_percentage": 0,
+                "estimated_savings": 0
+            },
+            "total_savings": {
+                "immediate": 0,
+                "annual_recurring": 0,
+                "negotiation_potential": 0,
+                "total": 0
+            },
+            "recommendations": [],
+            "implementation_steps": []
+        }
 
     def _update_usage_analytics(self, software_id: str, optimization: Dict[str, Any]) -> None:
         """Update usage analytics with optimization data"""
@@ -0,0 +1,148 @@
+"""
+PRISM Run Governor
+Keeps an agent run within its token, dollar and wall-time budgets
+"""
+import threading
+import time
+from typing import Dict, Any, List, Tuple
+from config.settings import (
+    AGENT_RUN_TOKEN_BUDGET, AGENT_RUN_COST_BUDGET, AGENT_RUN_TIMEOUT, AGENT_BUDGET_DEGRADE_AT,
+    AGENT_BUDGET_MODEL, AGENT_BUDGET_MAX_TOKENS, AGENT_BUDGET_SKIP_AT, AGENT_BUDGET_LOW_SPEND
+)
+from llm.metrics import LLM_USAGE
+from llm.retry import start_retry_budget
+
+
+class RunGovernor:
+    """
+    Tracks a run's LLM tokens, dollars and wall time against its budgets
+
+    Pressure is the largest share used of any budget. From ``degrade_at``,
+    agent calls switch to ``budget_model`` with at most ``budget_max_tokens``
+    of output; from ``skip_at``, items spending less than ``low_spend`` a
+    year are skipped; once a budget is used up, every remaining item is.
+    Offer items highest spend first so the budget goes to what matters.
+
+    Does nothing until ``start`` is called, so agents used outside a
+    portfolio run are unaffected.
+    """
+
+    def __init__(self,
+                 token_budget: int = AGENT_RUN_TOKEN_BUDGET,
+                 cost_budget: float = AGENT_RUN_COST_BUDGET,
+                 time_budget: float = AGENT_RUN_TIMEOUT,
+                 degrade_at: float = AGENT_BUDGET_DEGRADE_AT,
+                 budget_model: str = AGENT_BUDGET_MODEL,
+                 budget_max_tokens: int = AGENT_BUDGET_MAX_TOKENS,
+                 skip_at: float = AGENT_BUDGET_SKIP_AT,
+                 low_spend: float = AGENT_BUDGET_LOW_SPEND):
+        self.budgets = {'tokens': token_budget, 'cost': cost_budget, 'time': time_budget}
+        self.degrade_at = degrade_at
+        self.budget_model = budget_model
+        self.budget_max_tokens = budget_max_tokens
+        self.skip_at = skip_at
+        self.low_spend = low_spend
+        self._lock = threading.Lock()
+        self.active = False
+        self.started = None
+        self._baseline = (0, 0.0)
+        self.skipped: List[Dict[str, Any]] = []
+        self.degraded_calls = 0
+
+    def start(self):
+        """Begin a run: budgets, including the retry budget (llm/retry.py), count from here"""
+        start_retry_budget()
+        baseline = LLM_USAGE.spend()
+        with self._lock:
+            self.active = True
+            self.started = time.monotonic()
+            self._baseline = baseline
+            self.skipped = []
+            self.degraded_calls = 0
+
+    def usage(self) -> Dict[str, float]:
+        """Tokens, dollars and seconds used since ``start``"""
+        tokens, cost = LLM_USAGE.spend()
+        return {
+            'tokens': tokens - self._baseline[0],
+            'cost': cost - self._baseline[1],
+            'time': time.monotonic() - self.started if self.started is not None else 0.0,
+        }
+
+    def pressure(self) -> Tuple[float, str]:
+        """(largest share of a budget used, that budget's name); (0, None) if nothing is bounded"""
+        used = self.usage()
+        shares = [(used[name] / budget, name) for name, budget in self.budgets.items() if budget]
+        return max(shares) if shares else (0.0, None)
+
+    def call_limits(self, model: str, max_tokens: int) -> Tuple[str, int]:
+        """Model and output limit an agent call should use now"""
+        if not self.active:
+            return model, max_tokens
+        share, budget = self.pressure()
+        if share < self.degrade_at:
+            return model, max_tokens
+        with self._lock:
+            self.degraded_calls += 1
+            first = self.degraded_calls == 1
+        if first:
+            print(f"[Governor] {share:.0%} of the {budget} budget used: switching to {self.budget_model}, "
+                  f"max_tokens {self.budget_max_tokens}")
+        return self.budget_model, min(max_tokens, self.budget_max_tokens)
+
+    def admit(self, label: str, annual_cost: float) -> bool:
+        """
+        Whether to analyse an item, given what it spends a year
+
+        Returns:
+            False if the item is skipped (it is then listed in ``skipped``)
+        """
+        if not self.active:
+            return True
+        share, budget = self.pressure()
+        annual_cost = float(annual_cost or 0)
+        if share >= 1.0:
+            reason = f"{budget} budget used up"
+        elif share >= self.skip_at and annual_cost < self.low_spend:
+            reason = f"low spend with {share:.0%} of the {budget} budget used"
+        else:
+            return True
+        with self._lock:
+            self.skipped.append({'item': label, 'total_annual_cost': annual_cost, 'reason': reason})
+        print(f"[Governor] Skipping {label} (${annual_cost:,.0f}/yr): {reason}")
+        return False
+
+    def summary(self) -> str:
+        """Budget use, degraded calls and skipped items"""
+        used = self.usage()
+        figures = {'tokens': f"{used['tokens']:,} tokens", 'cost': f"${used['cost']:.4f}",
+                   'time': f"{used['time']:.0f}s"}
+        limits = {'tokens': f"{self.budgets['tokens']:,}", 'cost': f"${self.budgets['cost']:.2f}",
+                  'time': f"{self.budgets['time']:.0f}s"}
+        parts = [f"{figures[name]} of {limits[name] if self.budgets[name] else 'unbounded'}" for name in figures]
+        lines = [f"Run budget: {', '.join(parts)}; {self.degraded_calls} calls on {self.budget_model}"]
+        for entry in self.skipped:
+            lines.append(f"  skipped {entry['item']} (${entry['total_annual_cost']:,.0f}/yr): {entry['reason']}")
+        return "\n".join(lines)
+
+    def skipped_markdown(self) -> str:
+        """Report section listing the skipped items ('' if none)"""
+        if not self.skipped:
+            return ""
+        rows = "\n".join(f"| {entry['item']} | ${entry['total_annual_cost']:,.0f} | {entry['reason']} |"
+                         for entry in self.skipped)
+        return ("\n\n## Not Analysed (Run Budget)\n\n"
+                "| Item | Annual cost | Reason |\n|---|---|---|\n" + rows + "\n")
+
+
+_shared_governor = None
+_shared_governor_lock = threading.Lock()
+
+
+def get_governor() -> RunGovernor:
+    """Process-wide governor consulted by every agent"""
+    global _shared_governor
+    with _shared_governor_lock:
+        if _shared_governor is None:
+            _shared_governor = RunGovernor()
+        return _shared_governor
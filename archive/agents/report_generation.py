@@ -43,8 +43,11 @@ Format guidelines:
 
 Executives care about: savings, risk, and action items."""
 
-        # Generate report
-        report = self.call_claude(prompt, system_prompt)
+        with self.track_usage() as usage:
+            # Generate report
+            report = self.call_claude(prompt, system_prompt)
+
+            self.save_usage(usage, "executive_report")
         
         self.log("Executive report generated")
         
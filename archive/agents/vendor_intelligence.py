@@ -4,21 +4,112 @@ Researches vendors for risk, market position, and negotiation leverage
 """
 from typing import Dict, Any, List
 from agents.base_agent import BaseAgent
-import json
+from llm.structured import OutputSchema, StructuredOutputError
 
 
 class VendorIntelligenceAgent(BaseAgent):
     """Agent 1A: Deep research on software vendors"""
     
+    # Identical for every vendor, so it is sent as the cached prompt prefix
+    ANALYSIS_INSTRUCTIONS = """Provide a comprehensive vendor intelligence report on the vendor described after these instructions, with the following sections:
+
+1. **Company Overview**
+   - Current status, ownership, headquarters
+   - Size, revenue, growth trajectory
+   - Recent news (acquisitions, layoffs, leadership changes)
+
+2. **Financial Health Assessment**
+   - Revenue trends and profitability
+   - Funding status and runway
+   - Financial risk score (0-1 scale, where 1 = highest risk)
+   - Likelihood of company failure or acquisition
+
+3. **Market Position**
+   - Position in market (leader/challenger/niche/declining)
+   - Top 3 competitors
+   - Customer count and notable customers
+   - Technology risk (is the product becoming obsolete?)
+
+4. **Customer Satisfaction**
+   - Support quality (1-5 scale)
+   - Common complaints
+   - Customer satisfaction trends
+
+5. **Negotiation Intelligence**
+   - Are they desperate for deals? (desperate/willing/inflexible)
+   - When is their fiscal year/quarter end?
+   - Recent customer losses
+   - Pressure points for negotiation
+   - Typical discount ranges
+
+6. **Risk Flags**
+   - Any concerning trends or red flags
+   - Vendor lock-in severity (severe/moderate/low)
+   - Security incidents or compliance issues
+
+7. **Bottom Line Recommendation**
+   - Should we renew, negotiate hard, or replace?
+   - Key action items
+
+Return the report in the response schema: put each section's findings in its field, the most important findings in key_insights and concrete actions in recommendations."""
+    
+    # Enums and ranges follow the CHECK constraints on vendor_intelligence
+    OUTPUT_SCHEMA = OutputSchema("vendor_intelligence_report", {
+        "type": "object",
+        "properties": {
+            "company_overview": {"type": "object"},
+            "financial_health": {
+                "type": "object",
+                "properties": {
+                    "revenue": {"type": ["number", "null"], "minimum": 0, "description": "Annual revenue in USD"},
+                    "profitability": {"type": "string", "enum": ["profitable", "break-even", "burning-cash", "unknown"]},
+                    "risk_score": {"type": ["number", "null"], "minimum": 0, "maximum": 1,
+                                   "description": "Financial risk, 1 = highest"}
+                },
+                "required": ["revenue", "profitability", "risk_score"]
+            },
+            "market_position": {
+                "type": "object",
+                "properties": {
+                    "position": {"type": "string", "enum": ["leader", "challenger", "niche", "declining", "emerging"]},
+                    "competitors": {"type": "array", "items": {"type": "string"}},
+                    "customer_count": {"type": ["integer", "null"], "minimum": 0}
+                },
+                "required": ["position", "competitors", "customer_count"]
+            },
+            "negotiation_intel": {
+                "type": "object",
+                "properties": {
+                    "vendor_eagerness": {"type": "string", "enum": ["desperate", "willing", "inflexible"]},
+                    "quarter_end": {"type": "string", "description": "Date of the vendor's next quarter end"},
+                    "pressure_points": {"type": "array", "items": {"type": "string"}},
+                    "typical_discount_percentage": {"type": ["number", "null"]}
+                },
+                "required": ["vendor_eagerness", "pressure_points", "typical_discount_percentage"]
+            },
+            "risk_flags": {"type": "array", "items": {"type": "string"}},
+            "key_insights": {"type": "array", "items": {"type": "string"}},
+            "recommendations": {"type": "array", "items": {"type": "string"}}
+        },
+        "required": ["company_overview", "financial_health", "market_position", "negotiation_intel",
+                     "risk_flags", "key_insights", "recommendations"]
+    }, "Record the vendor intelligence report")
+    
     def __init__(self):
         super().__init__("Vendor Intelligence Agent")
     
-    def analyze_vendor(self, vendor_name: str) -> Dict[str, Any]:
+    def analyze_vendor(self,
+                       vendor_name: str,
+                       existing_vendor: Dict[str, Any] = None,
+                       preloaded: bool = False) -> Dict[str, Any]:
         """
         Comprehensive vendor analysis
         
         Args:
             vendor_name: Name of vendor to analyze
+            existing_vendor: Preloaded vendor_intelligence row
+            preloaded: True when existing_vendor was batch-loaded by the
+                caller (None then means no existing data)
             
         Returns:
             Analysis results with risk scores and insights
@@ -26,7 +117,8 @@ class VendorIntelligenceAgent(BaseAgent):
         self.log(f"Analyzing vendor: {vendor_name}")
         
         # Check if we already have vendor data
-        existing_vendor = self.db.get_vendor_by_name(vendor_name)
+        if not preloaded:
+            existing_vendor = self.db.get_vendor_by_name(vendor_name)
         
         # Build context
         context = self._build_vendor_context(vendor_name, existing_vendor)
@@ -45,14 +137,24 @@ Your job is to analyze software vendors from multiple angles:
 
 Provide structured, actionable insights that help enterprise buyers make informed decisions and negotiate better deals."""
 
-        # Get Claude's analysis
-        response = self.call_claude(prompt, system_prompt)
-        
-        # Parse and structure the response
-        analysis = self._parse_analysis(response)
+        with self.track_usage() as usage:
+            # Get Claude's analysis, structured by OUTPUT_SCHEMA
+            try:
+                analysis, _ = self.call_claude_json(
+                    prompt, self.OUTPUT_SCHEMA, system_prompt, prompt_prefix=self.ANALYSIS_INSTRUCTIONS
+                )
+            except StructuredOutputError as e:
+                self.log(f"Error parsing response: {e}")
+                # Keep the raw response if it could not be repaired
+                analysis = {
+                    "raw_response": e.text,
+                    "parse_error": str(e)
+                }
         
-        # Update database
-        self._update_vendor_intelligence(vendor_name, analysis)
+            # Update database
+            self._update_vendor_intelligence(vendor_name, analysis)
+
+            self.save_usage(usage, "vendor_intelligence", subject=vendor_name)
         
         self.log(f"Completed analysis for {vendor_name}")
         
@@ -81,95 +183,9 @@ Update this analysis with current information.
         """Create comprehensive analysis prompt"""
         prompt = f"""Analyze the software vendor "{vendor_name}" for enterprise procurement decision-making.
 
-{context}
-
-Provide a comprehensive vendor intelligence report with the following sections:
-
-1. **Company Overview**
-   - Current status, ownership, headquarters
-   - Size, revenue, growth trajectory
-   - Recent news (acquisitions, layoffs, leadership changes)
-
-2. **Financial Health Assessment**
-   - Revenue trends and profitability
-   - Funding status and runway
-   - Financial risk score (0-1 scale, where 1 = highest risk)
-   - Likelihood of company failure or acquisition
-
-3. **Market Position**
-   - Position in market (leader/challenger/niche/declining)
-   - Top 3 competitors
-   - Customer count and notable customers
-   - Technology risk (is the product becoming obsolete?)
-
-4. **Customer Satisfaction**
-   - Support quality (1-5 scale)
-   - Common complaints
-   - Customer satisfaction trends
-
-5. **Negotiation Intelligence**
-   - Are they desperate for deals? (desperate/willing/inflexible)
-   - When is their fiscal year/quarter end?
-   - Recent customer losses
-   - Pressure points for negotiation
-   - Typical discount ranges
-
-6. **Risk Flags**
-   - Any concerning trends or red flags
-   - Vendor lock-in severity (severe/moderate/low)
-   - Security incidents or compliance issues
-
-7. **Bottom Line Recommendation**
-   - Should we renew, negotiate hard, or replace?
-   - Key action items
-
-Format your response as structured JSON with these exact keys:
-{{
-  "company_overview": {{}},
-  "financial_health": {{
-    "revenue": number,
-    "profitability": "profitable|break-even|burning-cash",
-    "risk_score": float (0-1)
-  }},
-  "market_position": {{
-    "position": "leader|challenger|niche|declining",
-    "competitors": [],
-    "customer_count": number
-  }},
-  "negotiation_intel": {{
-    "vendor_eagerness": "desperate|willing|inflexible",
-    "quarter_end": "date",
-    "pressure_points": [],
-    "typical_discount_percentage": float
-  }},
-  "risk_flags": [],
-  "key_insights": [],
-  "recommendations": []
-}}"""
+{context}"""
         return prompt
     
-    def _parse_analysis(self, response: str) -> Dict[str, Any]:
-        """Parse Claude's response into structured format"""
-        try:
-            # Try to extract JSON from response
-            # Claude might wrap it in markdown code blocks
-            if "```json" in response:
-                json_str = response.split("```json")[1].split("```")[0].strip()
-            elif "```" in response:
-                json_str = response.split("```")[1].split("```")[0].strip()
-            else:
-                json_str = response.strip()
-            
-            analysis = json.loads(json_str)
-            return analysis
-        except Exception as e:
-            self.log(f"Error parsing response: {e}")
-            # Return raw response if parsing fails
-            return {
-                "raw_response": response,
-                "parse_error": str(e)
-            }
-    
     def _update_vendor_intelligence(self, vendor_name: str, analysis: Dict[str, Any]):
         """Update vendor_intelligence table with analysis results"""
         try:
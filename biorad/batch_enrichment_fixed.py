@@ -10,6 +10,7 @@ import sys
 from datetime import datetime
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from data_enrichment_agent_final import DataEnrichmentAgent
+from llm.executor import get_executor
 
 class BatchEnrichmentProcessor:
     def __init__(self):
@@ -113,56 +114,61 @@ class BatchEnrichmentProcessor:
             print("\n✅ Nothing to process. All items already completed!")
             return
         
-        # Process items
-        for count, (idx, item) in enumerate(items_to_process, 1):
-            name = item['software_name']
-            description = item['description']
-            
-            print(f"\n{'='*60}")
-            print(f"Processing {count}/{len(items_to_process)} (#{idx+1} in CSV): {name}")
-            print(f"{'='*60}")
-            
-            try:
-                # Enrich
-                enriched_data = self.agent.enrich_software_data(name, description)
+        # Enrich concurrently on the shared LLM executor; save and record
+        # progress here as each item completes
+        def enrich(entry):
+            _, item = entry
+            return self.agent.enrich_software_data(item['software_name'], item['description'])
+        
+        results = get_executor().imap_unordered(enrich, items_to_process)
+        count = 0
+        try:
+            for (idx, item), enriched_data, error in results:
+                count += 1
+                name = item['software_name']
+                description = item['description']
                 
-                if enriched_data:
-                    # Save
-                    success = self.agent.save_to_database(name, description, enriched_data)
+                print(f"\n{'='*60}")
+                print(f"Completed {count}/{len(items_to_process)} (#{idx+1} in CSV): {name}")
+                print(f"{'='*60}")
+                
+                try:
+                    if error:
+                        raise error
                     
-                    if success:
-                        self.progress['completed'].append(name)
-                        self.progress['last_index'] = idx
-                        print(f"✅ Success: {name}")
+                    if enriched_data:
+                        # Save
+                        success = self.agent.save_to_database(name, description, enriched_data)
+                        
+                        if success:
+                            self.progress['completed'].append(name)
+                            self.progress['last_index'] = max(self.progress['last_index'], idx)
+                            print(f"✅ Success: {name}")
+                        else:
+                            self.progress['failed'].append(name)
+                            print(f"❌ Failed to save: {name}")
                     else:
                         self.progress['failed'].append(name)
-                        print(f"❌ Failed to save: {name}")
-                else:
+                        print(f"❌ Failed to enrich: {name}")
+                
+                except Exception as e:
+                    print(f"❌ Unexpected error: {e}")
                     self.progress['failed'].append(name)
-                    print(f"❌ Failed to enrich: {name}")
-            
-            except KeyboardInterrupt:
-                print("\n\n⚠️  Interrupted by user!")
+                
+                # Save progress after each item
                 self.save_progress()
-                self.save_failed_items(software_list)
-                print("\n💾 Progress saved. Run again to resume.")
-                sys.exit(0)
-            
-            except Exception as e:
-                print(f"❌ Unexpected error: {e}")
-                self.progress['failed'].append(name)
-            
-            # Save progress after each item
+                
+                if count % 5 == 0:
+                    print(f"\n⏸️  Batch checkpoint. Progress saved.")
+        
+        except KeyboardInterrupt:
+            # Leaving the loop cancels queued enrichments; in-flight ones are dropped
+            print("\n\n⚠️  Interrupted by user!")
+            results.close()
             self.save_progress()
-            
-            # Rate limiting
-            if count % 5 == 0:
-                print(f"\n⏸️  Batch checkpoint. Progress saved.")
-                import time
-                time.sleep(5)
-            else:
-                import time
-                time.sleep(1)
+            self.save_failed_items(software_list)
+            print("\n💾 Progress saved. Run again to resume.")
+            sys.exit(0)
         
         # Save failed items
         self.save_failed_items(software_list)
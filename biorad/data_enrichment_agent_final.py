@@ -3,15 +3,14 @@ PRISM Data Enrichment Agent - PERFECTLY MATCHED TO YOUR SCHEMA
 Uses only columns that exist in your database
 """
 
+import argparse
 import csv
 import json
 import os
 import sys
-import time
 from datetime import datetime, timedelta
 from decimal import Decimal
 import random
-import anthropic
 from dotenv import load_dotenv
 import psycopg2
 from psycopg2.extras import Json
@@ -20,14 +19,18 @@ import uuid
 # Add parent directory to path
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from database.db import Database
+from llm.client import LLMClient
+from llm.batch import BatchJob
+from llm.executor import LLMExecutor, get_executor
+from llm.metrics import LLM_USAGE
+from llm.packing import PromptPacker
+from llm.structured import OutputSchema, StructuredOutputError
 
 load_dotenv()
 
 class DataEnrichmentAgent:
     def __init__(self):
-        self.anthropic_client = anthropic.Anthropic(
-            api_key=os.getenv('ANTHROPIC_API_KEY')
-        )
+        self.llm = LLMClient(agent_name='Data Enrichment Agent')
         self.db = Database()
         self.company_id = None
         self.enriched_count = 0
@@ -147,6 +150,124 @@ class DataEnrichmentAgent:
         
         return start_date.strftime('%Y-%m-%d'), end_date.strftime('%Y-%m-%d')
     
+    # Request settings shared by interactive and batch enrichment
+    ENRICHMENT_MODEL = 'claude-sonnet-4-20250514'
+    ENRICHMENT_MAX_TOKENS = 4000
+    ENRICHMENT_TEMPERATURE = 0.3
+    
+    # Instructions shared by every product; sent as the cached prompt prefix
+    ENRICHMENT_INSTRUCTIONS = """You are a software intelligence expert. Analyze the enterprise software product described after these instructions and extract comprehensive metadata.
+
+Fill in every field of the response schema. List the product's main features, marking which are core and which need a premium tier.
+
+Be realistic and specific. For BioRad (8,000 employees, Life Sciences), provide accurate enterprise pricing."""
+    
+    # Shape of an enrichment answer; enforced as a tool (Claude) or format (Ollama)
+    ENRICHMENT_SCHEMA = OutputSchema("software_enrichment", {
+        "type": "object",
+        "properties": {
+            "vendor_name": {"type": "string", "description": "Company that makes this software"},
+            "category": {"type": "string", "enum": [
+                "ERP/Financial", "CRM", "ITSM/Service Desk", "Productivity Suite", "Collaboration",
+                "Project Management", "Business Intelligence", "Cloud Infrastructure", "HR/HCM",
+                "Marketing", "Development Tools", "Security", "Data/Analytics", "Other"
+            ]},
+            "subcategory": {"type": ["string", "null"]},
+            "pricing": {
+                "type": "object",
+                "properties": {
+                    "license_type": {"type": "string", "enum": [
+                        "Per User", "Per Month", "Usage Based", "Flat Fee", "Enterprise"
+                    ]},
+                    "estimated_annual_cost_range": {
+                        "type": "object",
+                        "properties": {"min": {"type": "number", "minimum": 0}, "max": {"type": "number", "minimum": 0}},
+                        "required": ["min", "max"]
+                    },
+                    "typical_cost_for_8000_employees": {"type": "number", "minimum": 0},
+                    "cost_per_user": {"type": "number", "minimum": 0}
+                },
+                "required": ["license_type", "estimated_annual_cost_range", "typical_cost_for_8000_employees",
+                             "cost_per_user"]
+            },
+            "usage": {
+                "type": "object",
+                "properties": {
+                    "estimated_total_licenses": {"type": "integer", "minimum": 0},
+                    "estimated_active_users": {"type": "integer", "minimum": 0},
+                    "utilization_rate": {"type": "number", "minimum": 0, "maximum": 100}
+                },
+                "required": ["estimated_total_licenses", "estimated_active_users", "utilization_rate"]
+            },
+            "business_context": {
+                "type": "object",
+                "properties": {
+                    "primary_use_case": {"type": "string", "description": "One sentence describing main purpose"},
+                    "business_criticality": {"type": "string", "enum": ["mission-critical", "high", "medium", "low"]},
+                    "business_owner_role": {"type": "string", "description": "e.g. CFO, CTO, CIO, VP Sales"},
+                    "technical_owner_role": {"type": "string", "description": "e.g. IT Director, DevOps, Cloud Ops"}
+                },
+                "required": ["primary_use_case", "business_criticality", "business_owner_role", "technical_owner_role"]
+            },
+            "contract": {
+                "type": "object",
+                "properties": {
+                    "auto_renewal": {"type": "boolean"},
+                    "payment_frequency": {"type": "string", "enum": ["Monthly", "Quarterly", "Annual"]},
+                    "notice_period_days": {"type": "integer", "minimum": 0}
+                },
+                "required": ["auto_renewal", "payment_frequency", "notice_period_days"]
+            },
+            "technical": {
+                "type": "object",
+                "properties": {
+                    "deployment_type": {"type": "string", "enum": ["Cloud", "On-Premise", "Hybrid"]},
+                    "integration_complexity": {"type": "string", "enum": ["low", "medium", "high", "critical"]},
+                    "api_available": {"type": "boolean"}
+                },
+                "required": ["deployment_type", "integration_complexity", "api_available"]
+            },
+            "replacement": {
+                "type": "object",
+                "properties": {
+                    "replacement_priority": {"type": "string", "enum": ["immediate", "high", "medium", "low", "never"]},
+                    "ai_replacement_candidate": {"type": "boolean"},
+                    "replacement_feasibility_score": {"type": "number", "minimum": 0, "maximum": 1},
+                    "ai_augmentation_candidate": {"type": "boolean"},
+                    "workflow_automation_potential": {"type": "string", "enum": ["high", "medium", "low", "none"]}
+                },
+                "required": ["replacement_priority", "ai_replacement_candidate", "replacement_feasibility_score",
+                             "ai_augmentation_candidate", "workflow_automation_potential"]
+            },
+            "features": {
+                "type": "array",
+                "items": {
+                    "type": "object",
+                    "properties": {
+                        "feature_name": {"type": "string"},
+                        "category": {"type": "string"},
+                        "description": {"type": "string"},
+                        "is_core": {"type": "boolean"},
+                        "requires_premium": {"type": "boolean"}
+                    },
+                    "required": ["feature_name", "category", "description", "is_core", "requires_premium"]
+                }
+            }
+        },
+        "required": ["vendor_name", "category", "pricing", "usage", "business_context", "contract",
+                     "technical", "replacement", "features"]
+    }, "Record the extracted software metadata")
+    
+    def build_enrichment_prompt(self, software_name: str, description: str) -> str:
+        """Per-product part of the enrichment prompt (follows ENRICHMENT_INSTRUCTIONS)"""
+        return f"""SOFTWARE: {software_name}
+DESCRIPTION: {description}
+"""
+    
+    def parse_enrichment_response(self, response_text: str) -> dict:
+        """Parse an answer against ENRICHMENT_SCHEMA (one cheap repair call if it doesn't fit)"""
+        return self.llm.parse_output(response_text, self.ENRICHMENT_SCHEMA)
+    
     def enrich_software_data(self, software_name: str, description: str) -> dict:
         """
         Use Claude to extract comprehensive software metadata
@@ -154,88 +275,20 @@ class DataEnrichmentAgent:
         print(f"\n🤖 Enriching: {software_name}")
         print(f"   Description: {description[:100]}...")
         
-        prompt = f"""You are a software intelligence expert. Analyze this enterprise software product and extract comprehensive metadata.
-
-SOFTWARE: {software_name}
-DESCRIPTION: {description}
-
-Extract the following information in JSON format:
-
-{{
-  "vendor_name": "Company that makes this software",
-  "category": "Choose ONE from: ERP/Financial, CRM, ITSM/Service Desk, Productivity Suite, Collaboration, Project Management, Business Intelligence, Cloud Infrastructure, HR/HCM, Marketing, Development Tools, Security, Data/Analytics, Other",
-  "subcategory": "More specific category if applicable",
-  "pricing": {{
-    "license_type": "Per User | Per Month | Usage Based | Flat Fee | Enterprise",
-    "estimated_annual_cost_range": {{
-      "min": 50000,
-      "max": 500000
-    }},
-    "typical_cost_for_8000_employees": 250000,
-    "cost_per_user": 31.25
-  }},
-  "usage": {{
-    "estimated_total_licenses": 1000,
-    "estimated_active_users": 850,
-    "utilization_rate": 85.0
-  }},
-  "business_context": {{
-    "primary_use_case": "One sentence describing main purpose",
-    "business_criticality": "mission-critical | high | medium | low",
-    "business_owner_role": "CFO | CTO | CIO | VP Sales | etc",
-    "technical_owner_role": "IT Director | DevOps | Cloud Ops | etc"
-  }},
-  "contract": {{
-    "auto_renewal": true,
-    "payment_frequency": "Monthly | Quarterly | Annual",
-    "notice_period_days": 30
-  }},
-  "technical": {{
-    "deployment_type": "Cloud | On-Premise | Hybrid",
-    "integration_complexity": "low | medium | high | critical",
-    "api_available": true
-  }},
-  "replacement": {{
-    "replacement_priority": "immediate | high | medium | low | never",
-    "ai_replacement_candidate": true,
-    "replacement_feasibility_score": 0.65,
-    "ai_augmentation_candidate": true,
-    "workflow_automation_potential": "high | medium | low | none"
-  }},
-  "features": [
-    {{
-      "feature_name": "Task Management",
-      "category": "Task Management",
-      "description": "Create and assign tasks",
-      "is_core": true,
-      "requires_premium": false
-    }}
-  ]
-}}
-
-Be realistic and specific. For BioRad (8,000 employees, Life Sciences), provide accurate enterprise pricing.
-
-Return ONLY valid JSON, no markdown formatting.
-"""
-
+        prompt = self.build_enrichment_prompt(software_name, description)
+        
         try:
-            message = self.anthropic_client.messages.create(
-                model='claude-sonnet-4-20250514',
-                max_tokens=4000,
-                temperature=0.3,
-                messages=[{'role': 'user', 'content': prompt}]
+            enriched_data, response = self.llm.complete_json(
+                prompt,
+                self.ENRICHMENT_SCHEMA,
+                model=self.ENRICHMENT_MODEL,
+                max_tokens=self.ENRICHMENT_MAX_TOKENS,
+                temperature=self.ENRICHMENT_TEMPERATURE,
+                prompt_prefix=self.ENRICHMENT_INSTRUCTIONS
             )
             
-            response_text = message.content[0].text
-            
-            # Extract JSON (remove markdown if present)
-            response_text = response_text.strip()
-            if response_text.startswith('```'):
-                lines = response_text.split('\n')
-                response_text = '\n'.join(lines[1:-1]) if len(lines) > 2 else response_text
-                response_text = response_text.replace('```json', '').replace('```', '').strip()
-            
-            enriched_data = json.loads(response_text)
+            if response.cached:
+                print(f"   ♻️  Using cached response")
             
             print(f"   ✅ Enriched successfully")
             print(f"      Vendor: {enriched_data['vendor_name']}")
@@ -245,9 +298,9 @@ Return ONLY valid JSON, no markdown formatting.
             
             return enriched_data
             
-        except json.JSONDecodeError as e:
-            print(f"   ❌ JSON Parse Error: {e}")
-            print(f"      Response: {response_text[:200]}...")
+        except StructuredOutputError as e:
+            print(f"   ❌ Schema Error: {e}")
+            print(f"      Response: {e.text[:200]}...")
             return None
         except Exception as e:
             print(f"   ❌ Error: {e}")
@@ -270,111 +323,104 @@ Return ONLY valid JSON, no markdown formatting.
             renewal_dt = datetime.strptime(renewal_date, '%Y-%m-%d')
             days_to_renewal = (renewal_dt - datetime.now()).days
             
-            # Insert into software_assets - ONLY columns that exist
-            insert_software = """
-                INSERT INTO software_assets (
-                    id, asset_code, company_id, software_name, vendor_name, category,
-                    subcategory, license_type, total_annual_cost, cost_per_user,
-                    total_licenses, active_users, utilization_rate,
-                    contract_start_date, contract_end_date, renewal_date, days_to_renewal,
-                    auto_renewal, notice_period_days, payment_frequency,
-                    deployment_type, primary_use_case,
-                    business_owner, technical_owner, integration_complexity,
-                    api_available, replacement_priority, replacement_feasibility_score,
-                    business_criticality, ai_replacement_candidate, ai_augmentation_candidate,
-                    workflow_automation_potential, notes,
-                    created_at, updated_at
-                ) VALUES (
-                    %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s,
-                    %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s,
-                    NOW(), NOW()
-                )
-            """
-            
-            self.db.execute_update(insert_software, (
-                software_id,
-                asset_code,  # Add asset_code here
-                self.company_id,
-                software_name,
-                enriched_data['vendor_name'],
-                enriched_data['category'],
-                enriched_data.get('subcategory', None),
-                enriched_data['pricing']['license_type'],
-                enriched_data['pricing']['typical_cost_for_8000_employees'],
-                enriched_data['pricing']['cost_per_user'],
-                enriched_data['usage']['estimated_total_licenses'],
-                enriched_data['usage']['estimated_active_users'],
-                enriched_data['usage']['utilization_rate'],
-                contract_start,
-                contract_end,
-                renewal_date,
-                days_to_renewal,
-                enriched_data['contract']['auto_renewal'],
-                enriched_data['contract']['notice_period_days'],
-                enriched_data['contract']['payment_frequency'],
-                enriched_data['technical']['deployment_type'],
-                enriched_data['business_context']['primary_use_case'],
-                enriched_data['business_context']['business_owner_role'],
-                enriched_data['business_context']['technical_owner_role'],
-                self.map_to_constraint_value(enriched_data['technical']['integration_complexity'], 'integration_complexity'),
-                enriched_data['technical']['api_available'],
-                self.map_to_constraint_value(enriched_data['replacement']['replacement_priority'], 'replacement_priority'),
-                enriched_data['replacement']['replacement_feasibility_score'],
-                self.map_to_constraint_value(enriched_data['business_context']['business_criticality'], 'business_criticality'),
-                enriched_data['replacement']['ai_replacement_candidate'],
-                enriched_data['replacement']['ai_augmentation_candidate'],
-                self.map_to_constraint_value(enriched_data['replacement']['workflow_automation_potential'], 'workflow_automation'),
-                f"Original description: {description}"  # Save description in notes field
-            ))
-            
-            print(f"   ✅ Saved software_assets")
-            
-            # Save to software_catalog if not exists (this table HAS description column)
-            catalog_check = self.db.execute_query(
-                "SELECT id FROM software_catalog WHERE software_name = %s",
-                (software_name,)
-            )
-            
-            if not catalog_check:
-                catalog_id = str(uuid.uuid4())
-                insert_catalog = """
-                    INSERT INTO software_catalog (
-                        id, software_name, vendor_name, category, description,
-                        pricing_model, min_price, max_price, total_features_count, created_at
-                    ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, NOW())
+            # One transaction per product instead of a commit per statement
+            with self.db.transaction():
+                # Insert into software_assets - ONLY columns that exist
+                insert_software = """
+                    INSERT INTO software_assets (
+                        id, asset_code, company_id, software_name, vendor_name, category,
+                        subcategory, license_type, total_annual_cost, cost_per_user,
+                        total_licenses, active_users, utilization_rate,
+                        contract_start_date, contract_end_date, renewal_date, days_to_renewal,
+                        auto_renewal, notice_period_days, payment_frequency,
+                        deployment_type, primary_use_case,
+                        business_owner, technical_owner, integration_complexity,
+                        api_available, replacement_priority, replacement_feasibility_score,
+                        business_criticality, ai_replacement_candidate, ai_augmentation_candidate,
+                        workflow_automation_potential, notes,
+                        created_at, updated_at
+                    ) VALUES (
+                        %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s,
+                        %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s,
+                        NOW(), NOW()
+                    )
                 """
-                self.db.execute_update(insert_catalog, (
-                    catalog_id,
+            
+                self.db.execute_update(insert_software, (
+                    software_id,
+                    asset_code,  # Add asset_code here
+                    self.company_id,
                     software_name,
                     enriched_data['vendor_name'],
                     enriched_data['category'],
-                    description,  # Description goes here (catalog table has it)
+                    enriched_data.get('subcategory', None),
                     enriched_data['pricing']['license_type'],
-                    enriched_data['pricing']['estimated_annual_cost_range']['min'],
-                    enriched_data['pricing']['estimated_annual_cost_range']['max'],
-                    len(enriched_data['features'])
+                    enriched_data['pricing']['typical_cost_for_8000_employees'],
+                    enriched_data['pricing']['cost_per_user'],
+                    enriched_data['usage']['estimated_total_licenses'],
+                    enriched_data['usage']['estimated_active_users'],
+                    enriched_data['usage']['utilization_rate'],
+                    contract_start,
+                    contract_end,
+                    renewal_date,
+                    days_to_renewal,
+                    enriched_data['contract']['auto_renewal'],
+                    enriched_data['contract']['notice_period_days'],
+                    enriched_data['contract']['payment_frequency'],
+                    enriched_data['technical']['deployment_type'],
+                    enriched_data['business_context']['primary_use_case'],
+                    enriched_data['business_context']['business_owner_role'],
+                    enriched_data['business_context']['technical_owner_role'],
+                    self.map_to_constraint_value(enriched_data['technical']['integration_complexity'], 'integration_complexity'),
+                    enriched_data['technical']['api_available'],
+                    self.map_to_constraint_value(enriched_data['replacement']['replacement_priority'], 'replacement_priority'),
+                    enriched_data['replacement']['replacement_feasibility_score'],
+                    self.map_to_constraint_value(enriched_data['business_context']['business_criticality'], 'business_criticality'),
+                    enriched_data['replacement']['ai_replacement_candidate'],
+                    enriched_data['replacement']['ai_augmentation_candidate'],
+                    self.map_to_constraint_value(enriched_data['replacement']['workflow_automation_potential'], 'workflow_automation'),
+                    f"Original description: {description}"  # Save description in notes field
                 ))
-                print(f"   ✅ Saved software_catalog")
-            else:
-                catalog_id = catalog_check[0]['id']
-                print(f"   ℹ️  Software already in catalog")
             
-            # Save features
-            features_saved = 0
-            for feature in enriched_data['features']:
-                category_id = self.feature_categories.get(feature['category'])
+                print(f"   ✅ Saved software_assets")
+            
+                # Save to software_catalog if not exists (this table HAS description column)
+                catalog_check = self.db.execute_query(
+                    "SELECT id FROM software_catalog WHERE software_name = %s",
+                    (software_name,)
+                )
+            
+                if not catalog_check:
+                    catalog_id = str(uuid.uuid4())
+                    insert_catalog = """
+                        INSERT INTO software_catalog (
+                            id, software_name, vendor_name, category, description,
+                            pricing_model, min_price, max_price, total_features_count, created_at
+                        ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, NOW())
+                    """
+                    self.db.execute_update(insert_catalog, (
+                        catalog_id,
+                        software_name,
+                        enriched_data['vendor_name'],
+                        enriched_data['category'],
+                        description,  # Description goes here (catalog table has it)
+                        enriched_data['pricing']['license_type'],
+                        enriched_data['pricing']['estimated_annual_cost_range']['min'],
+                        enriched_data['pricing']['estimated_annual_cost_range']['max'],
+                        len(enriched_data['features'])
+                    ))
+                    print(f"   ✅ Saved software_catalog")
+                else:
+                    catalog_id = catalog_check[0]['id']
+                    print(f"   ℹ️  Software already in catalog")
+            
+                # Save features in one multi-row insert
+                feature_rows = []
+                for feature in enriched_data['features']:
+                    category_id = self.feature_categories.get(feature['category'])
                 
-                if category_id:
-                    try:
-                        insert_feature = """
-                            INSERT INTO software_features (
-                                id, software_catalog_id, feature_category_id,
-                                feature_name, feature_description,
-                                is_core_feature, requires_premium, created_at
-                            ) VALUES (%s, %s, %s, %s, %s, %s, %s, NOW())
-                            ON CONFLICT (software_catalog_id, feature_name) DO NOTHING
-                        """
-                        self.db.execute_update(insert_feature, (
+                    if category_id:
+                        feature_rows.append((
                             str(uuid.uuid4()),
                             catalog_id,
                             category_id,
@@ -383,33 +429,49 @@ Return ONLY valid JSON, no markdown formatting.
                             feature['is_core'],
                             feature['requires_premium']
                         ))
-                        features_saved += 1
-                    except Exception as e:
-                        pass  # Skip feature if error
             
-            print(f"   ✅ Saved {features_saved} features")
+                features_saved = 0
+                if feature_rows:
+                    # One multi-row insert; if a bad feature breaks it, the rest are saved row by row
+                    inserted_ids, failed = self.db.bulk_insert_tolerant(
+                        "software_features",
+                        [
+                            "id", "software_catalog_id", "feature_category_id",
+                            "feature_name", "feature_description",
+                            "is_core_feature", "requires_premium", "created_at"
+                        ],
+                        feature_rows,
+                        on_conflict="(software_catalog_id, feature_name) DO NOTHING",
+                        returning="id",
+                        template="(%s, %s, %s, %s, %s, %s, %s, NOW())"
+                    )
+                    features_saved = len(inserted_ids)
+                    for row, error in failed:
+                        print(f"   ⚠️  Skipped feature {row[3]}: {str(error).strip()}")
             
-            # Cache the analysis
-            cache_insert = """
-                INSERT INTO feature_analysis_cache (
-                    id, software_name, extracted_features, feature_count,
-                    source, confidence_score, analysis_date
-                ) VALUES (%s, %s, %s, %s, %s, %s, NOW())
-                ON CONFLICT (software_name) DO UPDATE SET
-                    extracted_features = EXCLUDED.extracted_features,
-                    feature_count = EXCLUDED.feature_count,
-                    analysis_date = NOW()
-            """
-            self.db.execute_update(cache_insert, (
-                str(uuid.uuid4()),
-                software_name,
-                Json(enriched_data['features']),
-                len(enriched_data['features']),
-                'ai_extraction',
-                0.85
-            ))
+                print(f"   ✅ Saved {features_saved} features")
             
-            print(f"   ✅ Cached analysis")
+                # Cache the analysis
+                cache_insert = """
+                    INSERT INTO feature_analysis_cache (
+                        id, software_name, extracted_features, feature_count,
+                        source, confidence_score, analysis_date
+                    ) VALUES (%s, %s, %s, %s, %s, %s, NOW())
+                    ON CONFLICT (software_name) DO UPDATE SET
+                        extracted_features = EXCLUDED.extracted_features,
+                        feature_count = EXCLUDED.feature_count,
+                        analysis_date = NOW()
+                """
+                self.db.execute_update(cache_insert, (
+                    str(uuid.uuid4()),
+                    software_name,
+                    Json(enriched_data['features']),
+                    len(enriched_data['features']),
+                    'ai_extraction',
+                    0.85
+                ))
+            
+                print(f"   ✅ Cached analysis")
             
             self.enriched_count += 1
             return True
@@ -421,8 +483,16 @@ Return ONLY valid JSON, no markdown formatting.
             self.failed_count += 1
             return False
     
-    def process_csv(self, csv_file_path: str, batch_size: int = 5):
-        """Process CSV file with software data"""
+    def process_csv(self, csv_file_path: str, max_workers: int = None, commit_every: int = 1,
+                    pack: bool = True):
+        """
+        Process CSV file with software data, committing every commit_every products
+
+        Enrichment calls run concurrently on the shared LLM executor (pacing is
+        left to its rate limiter); results are saved here, one at a time, as
+        they complete. With ``pack`` several products share one request (see
+        llm/packing.py); products whose packed answer fails are retried alone.
+        """
         print(f"\n📂 Reading CSV: {csv_file_path}")
         
         with open(csv_file_path, 'r', encoding='utf-8') as f:
@@ -431,35 +501,51 @@ Return ONLY valid JSON, no markdown formatting.
         
         print(f"✅ Found {len(software_list)} software products to enrich")
         
-        for idx, row in enumerate(software_list, 1):
-            software_name = row['software_name'].strip()
-            description = row['description'].strip()
+        executor = LLMExecutor(max_workers) if max_workers else get_executor()
+        
+        if pack:
+            packer = PromptPacker(
+                self.llm,
+                self.ENRICHMENT_SCHEMA,
+                prompt_prefix=self.ENRICHMENT_INSTRUCTIONS,
+                model=self.ENRICHMENT_MODEL,
+                max_tokens_per_item=self.ENRICHMENT_MAX_TOKENS,
+                temperature=self.ENRICHMENT_TEMPERATURE,
+                executor=executor
+            )
+            items = ((f"item-{idx}", self.build_enrichment_prompt(row['software_name'].strip(),
+                                                                  row['description'].strip()))
+                     for idx, row in enumerate(software_list))
+            results = ((software_list[int(item_id.split('-', 1)[1])], enriched_data, error)
+                       for item_id, enriched_data, error in packer.run(items))
+        else:
+            def enrich(row):
+                return self.enrich_software_data(row['software_name'].strip(), row['description'].strip())
             
-            print(f"\n{'='*60}")
-            print(f"Processing {idx}/{len(software_list)}: {software_name}")
-            print(f"{'='*60}")
+            results = executor.imap_unordered(enrich, software_list)
+        
+        # Each product saves inside a savepoint; commits are grouped every commit_every products
+        with self.db.transaction(commit_every=commit_every) as tx:
+            for idx, (row, enriched_data, error) in enumerate(results, 1):
+                software_name = row['software_name'].strip()
+                description = row['description'].strip()
             
-            # Enrich with AI
-            enriched_data = self.enrich_software_data(software_name, description)
+                print(f"\n{'='*60}")
+                print(f"Completed {idx}/{len(software_list)}: {software_name}")
+                print(f"{'='*60}")
             
-            if enriched_data:
-                # Save to database
-                success = self.save_to_database(software_name, description, enriched_data)
+                if enriched_data:
+                    # Save to database
+                    success = self.save_to_database(software_name, description, enriched_data)
                 
-                if success:
-                    print(f"✅ Successfully processed {software_name}")
+                    if success:
+                        tx.checkpoint()
+                        print(f"✅ Successfully processed {software_name}")
+                    else:
+                        print(f"❌ Failed to save {software_name}")
                 else:
-                    print(f"❌ Failed to save {software_name}")
-            else:
-                print(f"❌ Failed to enrich {software_name}")
-                self.failed_count += 1
-            
-            # Rate limiting (Claude API)
-            if idx % batch_size == 0 and idx < len(software_list):
-                print(f"\n⏸️  Batch complete. Waiting 5 seconds...")
-                time.sleep(5)
-            else:
-                time.sleep(1)
+                    print(f"❌ Failed to enrich {software_name}" + (f": {error}" if error else ""))
+                    self.failed_count += 1
         
         # Final summary
         print(f"\n{'='*60}")
@@ -468,9 +554,139 @@ Return ONLY valid JSON, no markdown formatting.
         print(f"✅ Successfully enriched: {self.enriched_count}")
         print(f"❌ Failed: {self.failed_count}")
         print(f"📊 Success rate: {(self.enriched_count / len(software_list) * 100):.1f}%")
+        if pack:
+            stats = packer.stats
+            print(f"📦 Packing: {stats['packed_items']} products in {stats['packs']} requests, "
+                  f"{stats['single_requests']} alone ({stats['requeued']} re-queued), "
+                  f"{stats['cache_hits']} from cache")
+        tokens = self.llm.prompt_cache_stats()
+        print(f"🧮 Input tokens: {tokens['cache_read_input_tokens']:,} cached, "
+              f"{tokens['input_tokens'] + tokens['cache_creation_input_tokens']:,} uncached "
+              f"({tokens['cached_input_ratio']:.0%} from prompt cache)")
+        print(LLM_USAGE.summary())
+        print(f"{'='*60}")
+    
+    def process_csv_batch(self, csv_file_path: str, batch_id: str = None,
+                          state_file: str = 'enrichment_batch.json'):
+        """
+        Enrich a whole CSV through the Message Batches API
+        
+        All prompts go out as one asynchronous batch (cheaper, no interactive
+        rate limits); results are streamed into save_to_database once it ends.
+        The batch id and every saved item are recorded in state_file, so an
+        interrupted run resumes the same batch and skips what was saved.
+        Products already in the LLM response cache are saved without a request.
+        """
+        print(f"\n📂 Reading CSV: {csv_file_path}")
+        
+        with open(csv_file_path, 'r', encoding='utf-8') as f:
+            software_list = list(csv.DictReader(f))
+        
+        print(f"✅ Found {len(software_list)} software products to enrich")
+        
+        state = {'csv': csv_file_path, 'batch_id': None, 'saved': []}
+        if os.path.exists(state_file):
+            with open(state_file, 'r') as f:
+                previous = json.load(f)
+            if previous.get('csv') == csv_file_path and (batch_id is None or previous.get('batch_id') == batch_id):
+                state = previous
+        if batch_id:
+            state['batch_id'] = batch_id
+        saved = set(state['saved'])
+        
+        def save_state():
+            state['saved'] = sorted(saved)
+            with open(state_file, 'w') as f:
+                json.dump(state, f, indent=2)
+        
+        # custom_id is the CSV row index, so results map back to rows.
+        # Each item is committed before it is recorded in state_file, so a resume never skips unsaved rows.
+        requests, cache_keys = [], {}
+        with self.db.transaction(commit_every=1) as tx:
+            for idx, row in enumerate(software_list):
+                custom_id = f"item-{idx}"
+                if custom_id in saved:
+                    continue
+                software_name = row['software_name'].strip()
+                description = row['description'].strip()
+                prompt = self.build_enrichment_prompt(software_name, description)
+                key = self.llm.request_key(prompt, None, self.ENRICHMENT_MODEL,
+                                           self.ENRICHMENT_MAX_TOKENS, self.ENRICHMENT_TEMPERATURE,
+                                           self.ENRICHMENT_INSTRUCTIONS, self.ENRICHMENT_SCHEMA)
+                
+                cached = self.llm.cached_response(key) if not state['batch_id'] else None
+                if cached is not None:
+                    print(f"♻️  Using cached response: {software_name}")
+                    try:
+                        enriched_data = self.parse_enrichment_response(cached.text)
+                    except Exception as e:
+                        print(f"❌ Schema Error for {software_name}: {e}")
+                        self.failed_count += 1
+                        continue
+                    if self.save_to_database(software_name, description, enriched_data):
+                        tx.checkpoint()
+                        saved.add(custom_id)
+                        save_state()
+                    continue
+                
+                cache_keys[custom_id] = key
+                requests.append((custom_id, self.llm.request_params(
+                    prompt, None, self.ENRICHMENT_MODEL,
+                    self.ENRICHMENT_MAX_TOKENS, self.ENRICHMENT_TEMPERATURE,
+                    self.ENRICHMENT_INSTRUCTIONS, self.ENRICHMENT_SCHEMA
+                )))
+        
+        job = BatchJob(self.llm)
+        if state['batch_id']:
+            print(f"🔁 Resuming batch {state['batch_id']} ({len(saved)} already saved)")
+        elif requests:
+            state['batch_id'] = job.submit(requests)
+            save_state()
+        else:
+            print("\n✅ Nothing to submit. All items already saved!")
+            return
+        
+        job.wait(state['batch_id'])
+        
+        with self.db.transaction(commit_every=1) as tx:
+            for custom_id, response, error in job.results(state['batch_id'], cache_keys,
+                                                             validate=self.ENRICHMENT_SCHEMA.accepts):
+                if custom_id in saved:
+                    continue
+                row = software_list[int(custom_id.split('-', 1)[1])]
+                software_name = row['software_name'].strip()
+                description = row['description'].strip()
+                
+                if error:
+                    print(f"❌ Failed to enrich {software_name}: {error}")
+                    self.failed_count += 1
+                    continue
+                
+                try:
+                    enriched_data = self.parse_enrichment_response(response.text)
+                except StructuredOutputError as e:
+                    print(f"❌ Schema Error for {software_name}: {e}")
+                    self.failed_count += 1
+                    continue
+                
+                if self.save_to_database(software_name, description, enriched_data):
+                    tx.checkpoint()
+                    saved.add(custom_id)
+                    save_state()
+                    print(f"✅ Successfully processed {software_name}")
+                else:
+                    print(f"❌ Failed to save {software_name}")
+        
+        # Final summary
+        print(f"\n{'='*60}")
+        print(f"🎉 BATCH ENRICHMENT COMPLETE ({state['batch_id'] or 'cache only'})")
+        print(f"{'='*60}")
+        print(f"✅ Saved: {len(saved)}/{len(software_list)}")
+        print(f"❌ Failed: {self.failed_count}")
+        print(LLM_USAGE.summary())
         print(f"{'='*60}")
     
-    def run(self, csv_file_path: str):
+    def run(self, csv_file_path: str, batch: bool = False, batch_id: str = None, pack: bool = True):
         """Main execution flow"""
         print("=" * 60)
         print("🚀 PRISM DATA ENRICHMENT AGENT")
@@ -481,17 +697,32 @@ Return ONLY valid JSON, no markdown formatting.
         self.load_feature_categories()
         
         # Process CSV
-        self.process_csv(csv_file_path)
+        if batch or batch_id:
+            self.process_csv_batch(csv_file_path, batch_id=batch_id)
+        else:
+            self.process_csv(csv_file_path, pack=pack)
+        
+        try:
+            self.db.save_llm_run_usage(LLM_USAGE.snapshot())
+        except Exception as e:
+            print(f"⚠️  Could not save LLM usage for run {LLM_USAGE.run_id}: {e}")
         
         print("\n✅ Agent execution complete!")
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Enrich BioRad software data with Claude')
+    parser.add_argument('csv_file', nargs='?', default='biorad_software_final_processed.csv')
+    parser.add_argument('--batch', action='store_true', help='Submit all items as one Message Batch')
+    parser.add_argument('--batch-id', help='Resume an existing batch by id (implies --batch)')
+    parser.add_argument('--no-pack', action='store_true', help='Send one request per product')
+    args = parser.parse_args()
+    
     agent = DataEnrichmentAgent()
-    csv_file = 'biorad_software_final_processed.csv'
+    csv_file = args.csv_file
     
     if not os.path.exists(csv_file):
         print(f"❌ Error: File not found: {csv_file}")
         sys.exit(1)
     
-    agent.run(csv_file)
+    agent.run(csv_file, batch=args.batch, batch_id=args.batch_id, pack=not args.no_pack)
@@ -14,16 +14,135 @@ MAX_TOKENS = 4096
 # Database
 DATABASE_URL = os.getenv("DATABASE_URL")
 
+# Connection Pool
+DB_POOL_MIN_SIZE = int(os.getenv("DB_POOL_MIN_SIZE", "1"))
+DB_POOL_MAX_SIZE = int(os.getenv("DB_POOL_MAX_SIZE", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))  # seconds to wait for a free connection
+DB_POOL_MAX_IDLE = float(os.getenv("DB_POOL_MAX_IDLE", "300"))  # close connections idle longer than this
+DB_POOL_CHECK_AFTER = float(os.getenv("DB_POOL_CHECK_AFTER", "30"))  # ping connections idle longer than this
+# Set when DATABASE_URL points at PgBouncer in transaction mode (e.g. Neon's -pooler host):
+# connections then carry no session state between checkouts
+DB_PGBOUNCER_TRANSACTION_MODE = os.getenv("DB_PGBOUNCER_TRANSACTION_MODE", "").lower() in ("1", "true", "yes")
+
+# Prepared Statements (ignored in PgBouncer transaction mode)
+DB_PREPARED_STATEMENTS = os.getenv("DB_PREPARED_STATEMENTS", "true").lower() in ("1", "true", "yes")
+DB_PREPARE_THRESHOLD = int(os.getenv("DB_PREPARE_THRESHOLD", "3"))  # executions before a statement is prepared
+
+# Query Instrumentation
+DB_QUERY_STATS = os.getenv("DB_QUERY_STATS", "true").lower() in ("1", "true", "yes")
+DB_SLOW_QUERY_MS = float(os.getenv("DB_SLOW_QUERY_MS", "500"))  # log statements slower than this
+DB_EXPLAIN_SLOW_QUERIES = os.getenv("DB_EXPLAIN_SLOW_QUERIES", "").lower() in ("1", "true", "yes")
+DB_QUERY_SUMMARY_AT_EXIT = os.getenv("DB_QUERY_SUMMARY_AT_EXIT", "").lower() in ("1", "true", "yes")
+
+# LLM Response Cache
+LLM_CACHE_BACKEND = os.getenv("LLM_CACHE_BACKEND", "sqlite")  # sqlite | postgres | memory | none
+LLM_CACHE_PATH = os.getenv("LLM_CACHE_PATH", ".prism_cache/llm_responses.sqlite3")
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "5000"))
+LLM_CACHE_TTL = float(os.getenv("LLM_CACHE_TTL", str(7 * 24 * 3600)))  # seconds
+LLM_CACHE_BYPASS = os.getenv("LLM_CACHE_BYPASS", "").lower() in ("1", "true", "yes")  # force refresh
+# Per-agent TTL overrides in seconds (0 disables caching for that agent)
+LLM_CACHE_TTL_BY_AGENT = {
+    "Vendor Intelligence Agent": 7 * 24 * 3600,
+    "Alternative Discovery Agent": 7 * 24 * 3600,
+    "Cost Optimization Agent": 24 * 3600,
+    "Report Generation Agent": 0,
+    "Data Enrichment Agent": 30 * 24 * 3600,
+}
+
+# LLM Concurrency / Rate Limits (shared by every LLMClient in the process)
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "4"))
+LLM_REQUESTS_PER_MINUTE = float(os.getenv("LLM_REQUESTS_PER_MINUTE", "50"))
+LLM_TOKENS_PER_MINUTE = float(os.getenv("LLM_TOKENS_PER_MINUTE", "40000"))  # input + output
+LLM_RATE_LIMIT_RETRIES = int(os.getenv("LLM_RATE_LIMIT_RETRIES", "5"))  # 429/529 re-attempts (llm/retry.py)
+LLM_PROMPT_CACHING = os.getenv("LLM_PROMPT_CACHING", "true").lower() in ("1", "true", "yes")  # cache_control on stable prefixes
+# LLM usage accounting: USD per million tokens (cache reads/writes and batches priced off these)
+LLM_PRICING_PER_MTOK = {
+    "claude-sonnet-4-20250514": {"input": 3.00, "output": 15.00},
+    "claude-3-5-haiku-20241022": {"input": 0.80, "output": 4.00},
+}
+LLM_USAGE_REPORT_PATH = os.getenv("LLM_USAGE_REPORT_PATH", "")  # write per-run JSON usage report at exit
+LLM_BATCH_POLL_INTERVAL = float(os.getenv("LLM_BATCH_POLL_INTERVAL", "30"))  # seconds between batch status checks
+
+# LLM Providers (llm/providers.py)
+OLLAMA_URL = os.getenv("OLLAMA_URL", "http://localhost:11434")
+OLLAMA_MODEL = os.getenv("OLLAMA_MODEL", "llama3.1:8b")
+OLLAMA_NUM_CTX = int(os.getenv("OLLAMA_NUM_CTX", "8192"))  # context window; packed prompts need more than the default
+LLM_PROVIDER_CONCURRENCY = {
+    "anthropic": int(os.getenv("LLM_ANTHROPIC_CONCURRENCY", "8")),
+    "ollama": int(os.getenv("LLM_OLLAMA_CONCURRENCY", "1")),  # one local GPU
+    "fake": 16,
+    "replay": int(os.getenv("LLM_ANTHROPIC_CONCURRENCY", "8")),  # replay at the live API's concurrency
+}
+# Providers tried in order per task; unhealthy or unconfigured ones are skipped
+LLM_ROUTES = {
+    "default": ["anthropic"],
+    "vendor_research": ["anthropic"],
+    "alternatives": ["anthropic"],
+    "cost_analysis": ["anthropic"],
+    "report": ["anthropic"],
+    "enrichment": ["anthropic", "ollama"],
+    "categorisation": ["ollama", "anthropic"],
+}
+LLM_AGENT_TASKS = {
+    "Vendor Intelligence Agent": "vendor_research",
+    "Alternative Discovery Agent": "alternatives",
+    "Cost Optimization Agent": "cost_analysis",
+    "Report Generation Agent": "report",
+    "Data Enrichment Agent": "enrichment",
+    "Local Enrichment": "categorisation",
+}
+LLM_PROVIDER = os.getenv("LLM_PROVIDER", "")  # force every task to one provider, e.g. "fake" offline
+LLM_PROVIDER_FAILURE_THRESHOLD = int(os.getenv("LLM_PROVIDER_FAILURE_THRESHOLD", "3"))  # consecutive failures
+LLM_PROVIDER_COOLDOWN = float(os.getenv("LLM_PROVIDER_COOLDOWN", "60"))  # seconds a failed provider is skipped
+
+# Structured output (llm/structured.py): answers that fail their schema get one repair call
+LLM_REPAIR_MODEL = os.getenv("LLM_REPAIR_MODEL", "claude-3-5-haiku-20241022")
+LLM_REPAIR_MAX_TOKENS = int(os.getenv("LLM_REPAIR_MAX_TOKENS", "4096"))
+
+# LLM cassettes (llm/cassette.py): record live calls, replay them offline for benchmarks.
+# Use LLM_CACHE_BACKEND=memory (or none) for both runs so the same requests reach the provider.
+LLM_CASSETTE_MODE = os.getenv("LLM_CASSETTE_MODE", "")  # "" | record | replay (replay serves every task)
+LLM_CASSETTE_PATH = os.getenv("LLM_CASSETTE_PATH", ".prism_cache/llm_cassette.jsonl")
+LLM_REPLAY_LATENCY = os.getenv("LLM_REPLAY_LATENCY", "recorded")  # "recorded" or fixed seconds per call
+
+# Prompt packing (llm/packing.py): several items per request, K sized to the output budget
+LLM_PACK_OUTPUT_TOKENS = int(os.getenv("LLM_PACK_OUTPUT_TOKENS", "16000"))  # output tokens per packed request
+LLM_PACK_MAX_ITEMS = int(os.getenv("LLM_PACK_MAX_ITEMS", "8"))
+
+# Hedged requests (llm/hedging.py): a call with no first token after the observed p95 gets a
+# duplicate; the first to answer wins and the other is cancelled. Off by default (hedges cost tokens).
+LLM_HEDGING = os.getenv("LLM_HEDGING", "").lower() in ("1", "true", "yes")
+LLM_HEDGE_PERCENTILE = float(os.getenv("LLM_HEDGE_PERCENTILE", "0.95"))
+LLM_HEDGE_MIN_SAMPLES = int(os.getenv("LLM_HEDGE_MIN_SAMPLES", "20"))  # no hedging until this many calls per model
+LLM_HEDGE_MIN_DELAY = float(os.getenv("LLM_HEDGE_MIN_DELAY", "1"))  # seconds; never hedge sooner than this
+LLM_HEDGE_MAX_RATIO = float(os.getenv("LLM_HEDGE_MAX_RATIO", "0.05"))  # at most this share of calls are hedged
+
 # Agent Settings
-AGENT_TIMEOUT = 120  # seconds
-MAX_RETRIES = 3
+# Time budgets (llm/deadline.py); nested budgets never outlast the enclosing one, 0 = unbounded
+AGENT_TIMEOUT = float(os.getenv("AGENT_TIMEOUT", "120"))  # seconds per LLM call
+AGENT_ITEM_TIMEOUT = float(os.getenv("AGENT_ITEM_TIMEOUT", "300"))  # seconds per vendor/software analysed
+AGENT_RUN_TIMEOUT = float(os.getenv("AGENT_RUN_TIMEOUT", "3600"))  # seconds for a whole portfolio run
+# Run budgets (archive/agents/governor.py), 0 = unbounded; the wall-time budget is AGENT_RUN_TIMEOUT
+AGENT_RUN_TOKEN_BUDGET = int(os.getenv("AGENT_RUN_TOKEN_BUDGET", "0"))  # billed LLM tokens per run
+AGENT_RUN_COST_BUDGET = float(os.getenv("AGENT_RUN_COST_BUDGET", "0"))  # USD per run
+# Once this share of any budget is used, calls switch to the cheaper model and output limit
+AGENT_BUDGET_DEGRADE_AT = float(os.getenv("AGENT_BUDGET_DEGRADE_AT", "0.7"))
+AGENT_BUDGET_MODEL = os.getenv("AGENT_BUDGET_MODEL", "claude-3-5-haiku-20241022")
+AGENT_BUDGET_MAX_TOKENS = int(os.getenv("AGENT_BUDGET_MAX_TOKENS", "2048"))
+# Once this share is used, items below AGENT_BUDGET_LOW_SPEND (total_annual_cost, USD) are skipped
+AGENT_BUDGET_SKIP_AT = float(os.getenv("AGENT_BUDGET_SKIP_AT", "0.9"))
+AGENT_BUDGET_LOW_SPEND = float(os.getenv("AGENT_BUDGET_LOW_SPEND", "10000"))
+# Retries (llm/retry.py), shared by LLM providers and the database layer
+MAX_RETRIES = int(os.getenv("MAX_RETRIES", "3"))  # per call, for transient errors other than 429/529
+RETRY_BASE_DELAY = float(os.getenv("RETRY_BASE_DELAY", "1"))  # seconds; doubles per retry, full jitter
+RETRY_MAX_DELAY = float(os.getenv("RETRY_MAX_DELAY", "30"))
+# Per-run budget: at most RETRY_BUDGET_MIN retries plus this share of first attempts
+RETRY_BUDGET_RATIO = float(os.getenv("RETRY_BUDGET_RATIO", "0.1"))
+RETRY_BUDGET_MIN = int(os.getenv("RETRY_BUDGET_MIN", "20"))
 
 # Logging
 LOG_LEVEL = "INFO"
 
-# Validate required settings
-if not ANTHROPIC_API_KEY:
-    raise ValueError("ANTHROPIC_API_KEY environment variable is required")
-
-if not DATABASE_URL:
-    raise ValueError("DATABASE_URL environment variable is required")
+# Required settings are validated where they are used: AnthropicProvider
+# needs ANTHROPIC_API_KEY and Database needs DATABASE_URL, so Ollama-only
+# or fake-provider runs work without them.
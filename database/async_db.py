@@ -0,0 +1,354 @@
+"""
+PRISM Async Database Handler
+asyncpg-backed mirror of database.db.Database for asyncio pipelines
+"""
+import asyncio
+import contextvars
+import json
+from contextlib import asynccontextmanager
+from typing import List, Dict, Any, Sequence, AsyncIterator
+import asyncpg
+from config.settings import (
+    DATABASE_URL, DB_POOL_MIN_SIZE, DB_POOL_MAX_SIZE, DB_POOL_TIMEOUT,
+    DB_POOL_MAX_IDLE, DB_PGBOUNCER_TRANSACTION_MODE
+)
+from database.placeholders import to_numbered_placeholders as to_asyncpg_query
+from llm.deadline import check_deadline, remaining
+
+
+class AsyncDatabase:
+    """
+    Async database connection and query handler
+
+    Takes the same SQL (with ``%s`` placeholders) as ``Database``, but every
+    call is a coroutine and connections come from an asyncpg pool, so many
+    queries can be in flight at once.
+
+    Covers the reads, inserts and usage savers the async pipelines need,
+    not all of ``Database``: queries always return dicts (no
+    ``result_format``), there is no ``iter_software_pages`` (use
+    ``stream_query``) and ``transaction`` has no ``commit_every``.
+    """
+
+    def __init__(self, min_size: int = DB_POOL_MIN_SIZE, max_size: int = DB_POOL_MAX_SIZE):
+        if not DATABASE_URL:
+            raise ValueError("DATABASE_URL environment variable is required")
+        self.connection_string = DATABASE_URL
+        self.min_size = min_size
+        self.max_size = max_size
+        self.pool = None
+        self._pool_lock = asyncio.Lock()
+        self._transaction = contextvars.ContextVar("prism_async_transaction", default=None)
+
+    async def connect(self) -> "AsyncDatabase":
+        """Create the connection pool (called lazily on first query)"""
+        async with self._pool_lock:
+            if self.pool is None:
+                self.pool = await asyncpg.create_pool(
+                    self.connection_string,
+                    min_size=self.min_size,
+                    max_size=self.max_size,
+                    max_inactive_connection_lifetime=DB_POOL_MAX_IDLE,
+                    # PgBouncer in transaction mode cannot keep named prepared statements
+                    statement_cache_size=0 if DB_PGBOUNCER_TRANSACTION_MODE else 100
+                )
+        return self
+
+    async def close(self):
+        """Close every pooled connection"""
+        if self.pool is not None:
+            await self.pool.close()
+            self.pool = None
+
+    async def __aenter__(self) -> "AsyncDatabase":
+        return await self.connect()
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    @asynccontextmanager
+    async def get_connection(self):
+        """
+        Async context manager for pooled connections
+
+        Under a deadline (llm/deadline.py) the pool wait is capped at the
+        time left; statements pass ``timeout=remaining()`` so asyncpg
+        cancels them when it runs out.
+        """
+        check_deadline()
+        conn = self._transaction.get()
+        if conn is not None:
+            # Inside transaction(): share its connection
+            yield conn
+            return
+
+        if self.pool is None:
+            await self.connect()
+        async with self.pool.acquire(timeout=remaining(DB_POOL_TIMEOUT)) as conn:
+            yield conn
+
+    @asynccontextmanager
+    async def transaction(self):
+        """
+        Run a group of statements on one connection with one commit
+
+        Every AsyncDatabase call made from the same task while the block is
+        open joins the transaction; nested calls become savepoints.
+        """
+        async with self.get_connection() as conn:
+            async with conn.transaction():
+                token = self._transaction.set(conn)
+                try:
+                    yield conn
+                finally:
+                    self._transaction.reset(token)
+
+    def pool_stats(self) -> Dict[str, Any]:
+        """Connection pool size statistics"""
+        if self.pool is None:
+            return {'size': 0, 'idle': 0, 'in_use': 0, 'max_size': self.max_size}
+        size = self.pool.get_size()
+        idle = self.pool.get_idle_size()
+        return {'size': size, 'idle': idle, 'in_use': size - idle, 'max_size': self.max_size}
+
+    async def execute_query(self, query: str, params: tuple = None) -> List[Dict[str, Any]]:
+        """Execute a SELECT query and return results as list of dicts"""
+        async with self.get_connection() as conn:
+            rows = await conn.fetch(to_asyncpg_query(query), *(params or ()), timeout=remaining())
+            return [dict(row) for row in rows]
+
+    async def execute_update(self, query: str, params: tuple = None) -> int:
+        """Execute an INSERT/UPDATE/DELETE query and return affected rows"""
+        async with self.get_connection() as conn:
+            status = await conn.execute(to_asyncpg_query(query), *(params or ()), timeout=remaining())
+            # Command tags look like "INSERT 0 5" / "UPDATE 3"
+            count = status.rsplit(" ", 1)[-1]
+            return int(count) if count.isdigit() else 0
+
+    async def stream_query(self,
+                           query: str,
+                           params: tuple = None,
+                           chunk_size: int = 2000) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Stream a SELECT through a server-side cursor, one row at a time
+
+        Inside ``transaction()`` the cursor runs on its connection; otherwise
+        it gets a connection of its own, which is not published to other
+        calls: the generator is suspended between rows, and statements made
+        meanwhile must not land in the cursor's transaction.
+        """
+        conn = self._transaction.get()
+        if conn is not None:
+            async for row in conn.cursor(to_asyncpg_query(query), *(params or ()), prefetch=chunk_size):
+                yield dict(row)
+            return
+
+        check_deadline()
+        if self.pool is None:
+            await self.connect()
+        async with self.pool.acquire(timeout=remaining(DB_POOL_TIMEOUT)) as conn:
+            # Server-side cursors only live inside a transaction
+            async with conn.transaction():
+                async for row in conn.cursor(to_asyncpg_query(query), *(params or ()), prefetch=chunk_size):
+                    yield dict(row)
+
+    async def bulk_insert(self,
+                          table: str,
+                          columns: Sequence[str],
+                          rows: Sequence[Sequence[Any]],
+                          method: str = "values") -> int:
+        """
+        Insert many rows in one round trip
+
+        ``method="copy"`` uses the binary COPY protocol; ``"values"`` runs a
+        pipelined executemany. Returns the number of rows sent.
+        """
+        rows = [
+            tuple(row[col] for col in columns) if isinstance(row, dict) else tuple(row)
+            for row in rows
+        ]
+        if not rows:
+            return 0
+
+        async with self.get_connection() as conn:
+            if method == "copy":
+                schema, _, name = table.rpartition(".")
+                await conn.copy_records_to_table(
+                    name, records=rows, columns=list(columns), schema_name=schema or None,
+                    timeout=remaining()
+                )
+            elif method == "values":
+                column_list = ", ".join(f'"{col}"' for col in columns)
+                placeholders = ", ".join(f"${i}" for i in range(1, len(columns) + 1))
+                await conn.executemany(
+                    f"INSERT INTO {table} ({column_list}) VALUES ({placeholders})", rows,
+                    timeout=remaining()
+                )
+            else:
+                raise ValueError(f"Unknown bulk insert method: {method}")
+        return len(rows)
+
+    async def get_software_by_id(self, software_id: str) -> Dict[str, Any]:
+        """Get software asset by ID"""
+        query = """
+            SELECT * FROM software_assets
+            WHERE id = %s::uuid
+        """
+        results = await self.execute_query(query, (str(software_id),))
+        return results[0] if results else None
+
+    async def get_software_by_ids(self, software_ids: Sequence[str]) -> Dict[str, Dict[str, Any]]:
+        """Get many software assets in one query, keyed by ID"""
+        if not software_ids:
+            return {}
+        query = """
+            SELECT * FROM software_assets
+            WHERE id = ANY(%s::uuid[])
+        """
+        results = await self.execute_query(query, ([str(i) for i in software_ids],))
+        return {str(row['id']): row for row in results}
+
+    async def get_latest_usage_by_software_ids(self, software_ids: Sequence[str]) -> Dict[str, Dict[str, Any]]:
+        """Get the most recent usage_analytics row per software, keyed by software ID"""
+        if not software_ids:
+            return {}
+        query = """
+            SELECT DISTINCT ON (software_id) * FROM usage_analytics
+            WHERE software_id = ANY(%s::uuid[])
+            ORDER BY software_id, analysis_date DESC
+        """
+        results = await self.execute_query(query, ([str(i) for i in software_ids],))
+        return {str(row['software_id']): row for row in results}
+
+    async def get_all_software(self) -> List[Dict[str, Any]]:
+        """Get all software assets"""
+        query = "SELECT * FROM software_assets ORDER BY total_annual_cost DESC"
+        return await self.execute_query(query)
+
+    async def get_replacement_candidates(self) -> List[Dict[str, Any]]:
+        """Get software marked for replacement"""
+        query = """
+            SELECT * FROM software_assets
+            WHERE ai_replacement_candidate = true
+               OR replacement_priority IN ('immediate', 'high')
+            ORDER BY
+                CASE replacement_priority
+                    WHEN 'immediate' THEN 1
+                    WHEN 'high' THEN 2
+                    ELSE 3
+                END,
+                total_annual_cost DESC
+        """
+        return await self.execute_query(query)
+
+    async def get_vendor_by_name(self, vendor_name: str) -> Dict[str, Any]:
+        """Get vendor intelligence by name"""
+        query = "SELECT * FROM vendor_intelligence WHERE vendor_name = %s"
+        results = await self.execute_query(query, (vendor_name,))
+        return results[0] if results else None
+
+    async def get_vendors_by_names(self, vendor_names: Sequence[str]) -> Dict[str, Dict[str, Any]]:
+        """Get vendor intelligence for many vendors in one query, keyed by name"""
+        if not vendor_names:
+            return {}
+        query = "SELECT * FROM vendor_intelligence WHERE vendor_name = ANY(%s)"
+        results = await self.execute_query(query, (list(vendor_names),))
+        return {row['vendor_name']: row for row in results}
+
+    async def save_agent_analysis(self,
+                                  software_id: str,
+                                  agent_name: str,
+                                  analysis_type: str,
+                                  raw_findings: str,
+                                  structured_findings: Dict[str, Any],
+                                  key_insights: List[str],
+                                  recommendations: List[str],
+                                  confidence_score: float,
+                                  tokens_used: int = None,
+                                  processing_time_seconds: float = None) -> str:
+        """Save agent analysis to database, with the LLM tokens and time it took"""
+        query = """
+            INSERT INTO ai_agent_analyses (
+                software_id, agent_name, analysis_type,
+                raw_findings, structured_findings,
+                key_insights, recommendations, confidence_score,
+                tokens_used, processing_time_seconds
+            ) VALUES (%s::uuid, %s, %s, %s, %s::jsonb, %s, %s, %s, %s, %s)
+            RETURNING id
+        """
+        async with self.get_connection() as conn:
+            analysis_id = await conn.fetchval(
+                to_asyncpg_query(query),
+                str(software_id) if software_id else None, agent_name, analysis_type,
+                raw_findings, json.dumps(structured_findings, default=str),
+                key_insights, recommendations, confidence_score,
+                tokens_used, processing_time_seconds
+            )
+            return str(analysis_id)
+
+    async def save_llm_usage(self,
+                             run_id: str,
+                             agent_name: str,
+                             analysis_type: str,
+                             tokens: Dict[str, int],
+                             calls: int,
+                             cost_usd: float,
+                             llm_time_seconds: float,
+                             processing_time_seconds: float,
+                             subject: str = None,
+                             software_id: str = None,
+                             retries: int = 0,
+                             ttft_seconds: float = None,
+                             models: List[str] = None) -> str:
+        """Save the LLM tokens, cost and time behind one analysis (llm_analysis_usage)"""
+        query = """
+            INSERT INTO llm_analysis_usage (
+                run_id, agent_name, analysis_type, subject, software_id, calls, retries, models,
+                input_tokens, cache_read_input_tokens, cache_creation_input_tokens, output_tokens,
+                tokens_used, cost_usd, llm_time_seconds, ttft_seconds, processing_time_seconds
+            ) VALUES (%s, %s, %s, %s, %s::uuid, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+            RETURNING id
+        """
+        async with self.get_connection() as conn:
+            usage_id = await conn.fetchval(
+                to_asyncpg_query(query),
+                run_id, agent_name, analysis_type, subject,
+                str(software_id) if software_id else None, calls, retries, list(models or []),
+                tokens.get('input_tokens', 0), tokens.get('cache_read_input_tokens', 0),
+                tokens.get('cache_creation_input_tokens', 0), tokens.get('output_tokens', 0),
+                sum(tokens.values()), round(cost_usd, 6), round(llm_time_seconds, 3),
+                ttft_seconds, processing_time_seconds,
+                timeout=remaining()
+            )
+            return str(usage_id)
+
+    async def save_llm_run_usage(self, snapshot: Dict[str, Any]) -> int:
+        """Save (or update) a run's LLM totals from a UsageTracker snapshot (llm_run_usage)"""
+        totals = snapshot['totals']
+        query = """
+            INSERT INTO llm_run_usage (
+                run_id, started_at, elapsed_seconds, calls, cache_hits, coalesced, retries,
+                input_tokens, cache_read_input_tokens, cache_creation_input_tokens, output_tokens,
+                cost_usd, agents
+            ) VALUES (%s, to_timestamp(%s), %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s::jsonb)
+            ON CONFLICT (run_id) DO UPDATE SET
+                elapsed_seconds = EXCLUDED.elapsed_seconds,
+                calls = EXCLUDED.calls,
+                cache_hits = EXCLUDED.cache_hits,
+                coalesced = EXCLUDED.coalesced,
+                retries = EXCLUDED.retries,
+                input_tokens = EXCLUDED.input_tokens,
+                cache_read_input_tokens = EXCLUDED.cache_read_input_tokens,
+                cache_creation_input_tokens = EXCLUDED.cache_creation_input_tokens,
+                output_tokens = EXCLUDED.output_tokens,
+                cost_usd = EXCLUDED.cost_usd,
+                agents = EXCLUDED.agents,
+                recorded_at = NOW()
+        """
+        return await self.execute_update(query, (
+            snapshot['run_id'], snapshot['started'], snapshot['elapsed_seconds'],
+            totals['calls'], totals['cache_hits'], totals['coalesced'], totals['retries'],
+            totals['input_tokens'], totals['cache_read_input_tokens'],
+            totals['cache_creation_input_tokens'], totals['output_tokens'],
+            round(totals['cost_usd'], 6), json.dumps(snapshot['agents'], default=str)
+        ))
@@ -1,46 +1,651 @@
 """
 PRISM Database Connection Handler
 """
+import csv
+import datetime
+import decimal
+import functools
+import hashlib
+import io
+import threading
+import time
+import uuid
 import psycopg2
-from psycopg2.extras import RealDictCursor
+import psycopg2.errors
+from psycopg2 import sql
+from psycopg2.extras import RealDictCursor, execute_values
 from contextlib import contextmanager
-from typing import List, Dict, Any
-from config.settings import DATABASE_URL
+from typing import List, Dict, Any, Sequence, Iterable, Iterator, Tuple
+from config.settings import (
+    DATABASE_URL, DB_POOL_MIN_SIZE, DB_POOL_MAX_SIZE, DB_POOL_TIMEOUT,
+    DB_POOL_MAX_IDLE, DB_POOL_CHECK_AFTER, DB_QUERY_STATS, DB_SLOW_QUERY_MS,
+    DB_EXPLAIN_SLOW_QUERIES, DB_QUERY_SUMMARY_AT_EXIT, DB_PREPARED_STATEMENTS,
+    DB_PREPARE_THRESHOLD, DB_PGBOUNCER_TRANSACTION_MODE
+)
+from database.pool import get_pool
+from database.placeholders import to_numbered_placeholders
+from database.instrumentation import QUERY_STATS, estimate_bytes, enable_exit_summary
+from llm.deadline import current_deadline
+from llm.retry import FATAL, RETRYABLE, RetryPolicy
+
+
+# Scalar parameter types safe to pass to EXECUTE as untyped literals
+_PREPARABLE_TYPES = (str, int, float, bool, type(None), decimal.Decimal,
+                     datetime.date, datetime.datetime, uuid.UUID)
+_DDL_PREFIXES = ("CREATE", "ALTER", "DROP", "TRUNCATE", "COMMENT")
+
+
+class PreparedStatementCache:
+    """
+    Decides which statements are hot enough to PREPARE
+    
+    Each pooled connection keeps its own name map (``conn.prepared``);
+    this object counts executions across connections and holds the schema
+    generation that invalidates every connection's prepared statements.
+    """
+    
+    def __init__(self, threshold: int):
+        self.threshold = threshold
+        self.generation = 0
+        self._uses: Dict[str, int] = {}
+        self._unpreparable = set()
+        self._lock = threading.Lock()
+        self.stats = {'prepared': 0, 'executed': 0, 'invalidations': 0}
+    
+    def is_hot(self, query: str) -> bool:
+        """Count one execution; True once the statement has reached the threshold"""
+        with self._lock:
+            if query in self._unpreparable:
+                return False
+            uses = self._uses.get(query, 0) + 1
+            if len(self._uses) < 10000 or query in self._uses:
+                self._uses[query] = uses
+            return uses >= self.threshold
+    
+    def mark_unpreparable(self, query: str):
+        """Never try to PREPARE this statement again (e.g. untyped parameters)"""
+        with self._lock:
+            self._unpreparable.add(query)
+    
+    def invalidate(self):
+        """Drop prepared statements on every connection (after schema changes)"""
+        with self._lock:
+            self.generation += 1
+            self.stats['invalidations'] += 1
+    
+    def count(self, stat: str):
+        """Increment a counter (connections on many threads share this cache)"""
+        with self._lock:
+            self.stats[stat] += 1
+    
+    def snapshot(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self.stats)
+    
+    @staticmethod
+    def statement_name(query: str) -> str:
+        return "prism_" + hashlib.sha1(query.encode("utf-8")).hexdigest()[:16]
+
+
+PREPARED_STATEMENTS = PreparedStatementCache(DB_PREPARE_THRESHOLD)
+
+
+def _classify_error(error: BaseException, idempotent: bool) -> str:
+    """Retry class of a database error (see llm/retry.py)"""
+    if isinstance(error, psycopg2.errors.QueryCanceled):
+        # statement_timeout from a deadline: there is no time left to retry in
+        return FATAL
+    if isinstance(error, psycopg2.extensions.TransactionRollbackError):
+        # Serialization failure or deadlock: the server rolled back, rerunning is safe
+        return RETRYABLE
+    if isinstance(error, (psycopg2.OperationalError, psycopg2.InterfaceError)):
+        # Dropped connection: a write may or may not have committed, so only reads are rerun
+        return RETRYABLE if idempotent else FATAL
+    return FATAL
+
+
+_READ_RETRY = RetryPolicy("database", lambda error: _classify_error(error, idempotent=True))
+_WRITE_RETRY = RetryPolicy("database", lambda error: _classify_error(error, idempotent=False))
+
+
+def _retried(idempotent: bool):
+    """Retry a Database method on transient errors, unless it runs inside db.transaction()"""
+    policy = _READ_RETRY if idempotent else _WRITE_RETRY
+    
+    def decorate(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            if getattr(self._local, 'transaction', None) is not None:
+                # One failed statement aborts the whole transaction; its owner decides
+                return method(self, *args, **kwargs)
+            result, _ = policy.call(lambda: method(self, *args, **kwargs))
+            return result
+        return wrapper
+    return decorate
+
+
+# Postgres type OIDs mapped to NumPy dtypes for columnar results
+_INT_OIDS = {20, 21, 23, 26}  # int8, int2, int4, oid
+_FLOAT_OIDS = {700, 701, 1700}  # float4, float8, numeric
+_BOOL_OIDS = {16}
+
+
+def _to_columnar(description, rows: List[tuple]) -> Dict[str, Any]:
+    """
+    Pivot tuple rows into one NumPy array per column
+    
+    Integer columns become int64 (float64 if they contain NULLs), numeric
+    and float columns float64 with NaN for NULL, booleans bool, and
+    everything else an object array.
+    """
+    try:
+        import numpy as np
+    except ImportError:
+        raise ImportError("result_format='columns' requires numpy (pip install numpy)")
+    
+    columns = {}
+    for index, col in enumerate(description):
+        values = [row[index] for row in rows]
+        has_nulls = any(v is None for v in values)
+        if col.type_code in _INT_OIDS and not has_nulls:
+            array = np.array(values, dtype=np.int64)
+        elif col.type_code in _INT_OIDS or col.type_code in _FLOAT_OIDS:
+            array = np.array([np.nan if v is None else float(v) for v in values], dtype=np.float64)
+        elif col.type_code in _BOOL_OIDS and not has_nulls:
+            array = np.array(values, dtype=bool)
+        else:
+            array = np.empty(len(values), dtype=object)
+            array[:] = values
+        columns[col.name] = array
+    return columns
+
+
+class Transaction:
+    """
+    Unit of work on a single pooled connection
+    
+    While a transaction is open, every Database method called on the same
+    thread runs on its connection and nothing is committed until the
+    outermost ``with db.transaction()`` block exits.
+    """
+    
+    def __init__(self, db: "Database", conn, commit_every: int = None):
+        self.db = db
+        self.conn = conn
+        self.commit_every = commit_every
+        self.pending = 0
+        self._savepoint_counter = 0
+    
+    def execute_query(self, query: str, params: tuple = None, result_format: str = "dicts") -> Any:
+        """Run a SELECT inside this transaction"""
+        return self.db.execute_query(query, params, result_format=result_format)
+    
+    def execute_update(self, query: str, params: tuple = None) -> int:
+        """Run an INSERT/UPDATE/DELETE inside this transaction"""
+        return self.db.execute_update(query, params)
+    
+    @contextmanager
+    def savepoint(self):
+        """Isolate a group of statements; on error only they are rolled back"""
+        self._savepoint_counter += 1
+        name = f"prism_sp_{self._savepoint_counter}"
+        with self.conn.cursor() as cursor:
+            cursor.execute(f"SAVEPOINT {name}")
+        try:
+            yield self
+        except Exception:
+            with self.conn.cursor() as cursor:
+                cursor.execute(f"ROLLBACK TO SAVEPOINT {name}")
+            raise
+        else:
+            with self.conn.cursor() as cursor:
+                cursor.execute(f"RELEASE SAVEPOINT {name}")
+    
+    def commit(self):
+        """Commit work so far and keep the transaction open for more"""
+        self.conn.commit()
+        self.pending = 0
+    
+    def checkpoint(self):
+        """Mark one item done; commits once commit_every items are pending"""
+        self.pending += 1
+        if self.commit_every and self.pending >= self.commit_every:
+            self.commit()
 
 
 class Database:
     """Database connection and query handler"""
     
     def __init__(self):
+        if not DATABASE_URL:
+            raise ValueError("DATABASE_URL environment variable is required")
         self.connection_string = DATABASE_URL
+        # One pool per DSN, shared by every agent and script in the process
+        self.pool = get_pool(
+            self.connection_string,
+            min_size=DB_POOL_MIN_SIZE,
+            max_size=DB_POOL_MAX_SIZE,
+            timeout=DB_POOL_TIMEOUT,
+            max_idle=DB_POOL_MAX_IDLE,
+            check_after=DB_POOL_CHECK_AFTER
+        )
+        self._local = threading.local()
+        if DB_QUERY_STATS and DB_QUERY_SUMMARY_AT_EXIT:
+            enable_exit_summary()
+    
+    @contextmanager
+    def transaction(self, commit_every: int = None):
+        """
+        Run a group of reads and writes on one connection with one commit
+        
+        Args:
+            commit_every: Commit after this many ``tx.checkpoint()`` calls,
+                for grouping commits across a long batch
+            
+        Usage:
+            with db.transaction() as tx:
+                db.execute_update(...)
+                with tx.savepoint():
+                    db.bulk_insert(...)
+        
+        Nested calls become savepoints of the enclosing transaction.
+        """
+        current = getattr(self._local, 'transaction', None)
+        if current is not None:
+            with current.savepoint():
+                yield current
+            return
+        
+        with self.get_connection() as conn:
+            tx = Transaction(self, conn, commit_every=commit_every)
+            self._local.transaction = tx
+            try:
+                yield tx
+            finally:
+                self._local.transaction = None
     
     @contextmanager
     def get_connection(self):
-        """Context manager for database connections"""
-        conn = psycopg2.connect(self.connection_string)
+        """
+        Context manager for pooled database connections
+        
+        Under a deadline (llm/deadline.py) the work on the connection gets
+        a statement_timeout of the time left, so a slow query is cancelled
+        server-side instead of outliving the item or run that issued it.
+        """
+        tx = getattr(self._local, 'transaction', None)
+        if tx is not None:
+            # Inside db.transaction(): share its connection, commit happens there
+            self._apply_deadline(tx.conn)
+            yield tx.conn
+            return
+        
+        conn = self.pool.getconn()
+        broken = False
         try:
+            self._apply_deadline(conn)
             yield conn
             conn.commit()
         except Exception as e:
-            conn.rollback()
+            try:
+                conn.rollback()
+            except psycopg2.Error:
+                broken = True
+            if isinstance(e, (psycopg2.OperationalError, psycopg2.InterfaceError)):
+                broken = True
+            scope = current_deadline()
+            if isinstance(e, psycopg2.errors.QueryCanceled) and scope is not None and scope.expired:
+                raise scope.error("query cancelled") from e
             raise e
         finally:
-            conn.close()
+            self.pool.putconn(conn, discard=broken or bool(conn.closed))
+    
+    @staticmethod
+    def _apply_deadline(conn):
+        """SET LOCAL statement_timeout to the current deadline (no-op without one)"""
+        scope = current_deadline()
+        if scope is None:
+            return
+        left = scope.remaining()
+        if left is None:
+            return
+        scope.check()
+        # SET LOCAL lasts until the transaction ends, so PgBouncer transaction mode is fine too
+        with conn.cursor() as cursor:
+            cursor.execute("SET LOCAL statement_timeout = %s", (max(1, int(left * 1000)),))
+    
+    def pool_stats(self) -> Dict[str, Any]:
+        """Connection pool statistics (checkouts, wait times, size)"""
+        stats = self.pool.stats()
+        stats['prepared_statements'] = PREPARED_STATEMENTS.snapshot()
+        return stats
+    
+    def query_stats(self) -> Dict[str, Dict[str, Any]]:
+        """Per-statement latency/row/byte statistics keyed by normalised SQL"""
+        return QUERY_STATS.snapshot()
+    
+    @contextmanager
+    def _timed(self, conn, query: str, params=None):
+        """
+        Time one statement and record it in QUERY_STATS
+        
+        Yields a dict the caller fills in with 'rows' and 'bytes'.
+        Statements slower than DB_SLOW_QUERY_MS are logged.
+        """
+        result = {'rows': 0, 'bytes': 0}
+        if not DB_QUERY_STATS:
+            yield result
+            return
+        
+        started = time.perf_counter()
+        yield result
+        elapsed = time.perf_counter() - started
+        
+        QUERY_STATS.record(query, elapsed, result['rows'], result['bytes'])
+        if elapsed * 1000 >= DB_SLOW_QUERY_MS:
+            self._log_slow_query(conn, query, params, elapsed)
+    
+    def _log_slow_query(self, conn, query: str, params, elapsed: float):
+        """Print a slow statement, with its plan when DB_EXPLAIN_SLOW_QUERIES is set"""
+        statement = " ".join(query.split())
+        print(f"[Database] Slow query ({elapsed * 1000:.0f} ms): {statement[:500]}")
+        
+        # EXPLAIN ANALYZE re-executes the statement, so only do it for reads
+        if not DB_EXPLAIN_SLOW_QUERIES or not statement.upper().startswith(("SELECT", "WITH")):
+            return
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("EXPLAIN (ANALYZE, BUFFERS) " + query, params)
+                plan = "\n".join(row[0] for row in cursor.fetchall())
+            print(f"[Database] Plan:\n{plan}")
+        except psycopg2.Error as e:
+            print(f"[Database] Could not explain slow query: {e}")
+    
+    def _execute(self, conn, cursor, query: str, params: tuple = None):
+        """
+        Execute a statement, through a per-connection prepared statement
+        once the same SQL text has run DB_PREPARE_THRESHOLD times
+        
+        Parse and plan then happen once per connection instead of per call.
+        Disabled in PgBouncer transaction mode, where consecutive
+        transactions may land on different server connections.
+        """
+        name = None
+        if self._can_prepare(conn, query, params):
+            name = self._prepare(conn, cursor, query)
+        if name is None:
+            cursor.execute(query, params)
+            return
+        
+        placeholders = ", ".join(["%s"] * len(params))
+        try:
+            cursor.execute(f"EXECUTE {name} ({placeholders})", params)
+            PREPARED_STATEMENTS.count('executed')
+        except (psycopg2.errors.FeatureNotSupported, psycopg2.errors.InvalidSqlStatementName):
+            # "cached plan must not change result type" after a schema change,
+            # or the statement vanished server-side: forget this connection's cache
+            conn.prepared.clear()
+            if getattr(self._local, 'transaction', None) is not None:
+                raise
+            conn.rollback()
+            with conn.cursor() as reset:
+                reset.execute("DEALLOCATE ALL")
+            cursor.execute(query, params)
+    
+    def _can_prepare(self, conn, query: str, params) -> bool:
+        if not DB_PREPARED_STATEMENTS or DB_PGBOUNCER_TRANSACTION_MODE:
+            return False
+        if not params or not hasattr(conn, 'prepared'):
+            return False
+        if not all(isinstance(p, _PREPARABLE_TYPES) for p in params):
+            return False
+        return PREPARED_STATEMENTS.is_hot(query)
     
-    def execute_query(self, query: str, params: tuple = None) -> List[Dict[str, Any]]:
-        """Execute a SELECT query and return results as list of dicts"""
+    def _prepare(self, conn, cursor, query: str) -> str:
+        """PREPARE the statement on this connection if needed; None if it cannot be"""
+        if conn.schema_generation != PREPARED_STATEMENTS.generation:
+            if conn.prepared:
+                cursor.execute("DEALLOCATE ALL")
+                conn.prepared.clear()
+            conn.schema_generation = PREPARED_STATEMENTS.generation
+        
+        name = conn.prepared.get(query)
+        if name is None:
+            name = PREPARED_STATEMENTS.statement_name(query)
+            # Savepoint so a statement the server cannot prepare does not
+            # abort the surrounding transaction
+            cursor.execute("SAVEPOINT prism_prepare")
+            try:
+                cursor.execute(f"PREPARE {name} AS {to_numbered_placeholders(query)}")
+            except (psycopg2.ProgrammingError, psycopg2.DataError, psycopg2.NotSupportedError):
+                cursor.execute("ROLLBACK TO SAVEPOINT prism_prepare")
+                PREPARED_STATEMENTS.mark_unpreparable(query)
+                return None
+            cursor.execute("RELEASE SAVEPOINT prism_prepare")
+            conn.prepared[query] = name
+            PREPARED_STATEMENTS.count('prepared')
+        return name
+    
+    def invalidate_prepared_statements(self):
+        """Force every pooled connection to re-prepare (call after DDL)"""
+        PREPARED_STATEMENTS.invalidate()
+    
+    @_retried(idempotent=True)
+    def execute_query(self, query: str, params: tuple = None, result_format: str = "dicts") -> Any:
+        """
+        Execute a SELECT query
+        
+        Args:
+            query: SELECT statement
+            params: Query parameters
+            result_format: "dicts" (default) for a list of row dicts;
+                "tuples" for ``(columns, rows)`` with plain tuple rows;
+                "columns" for ``{column: numpy array}`` (requires numpy)
+            
+        Returns:
+            Results in the requested format
+        """
+        if result_format not in ("dicts", "tuples", "columns"):
+            raise ValueError(f"Unknown result format: {result_format}")
+        
+        cursor_factory = RealDictCursor if result_format == "dicts" else None
+        with self.get_connection() as conn:
+            with conn.cursor(cursor_factory=cursor_factory) as cursor:
+                with self._timed(conn, query, params) as timing:
+                    self._execute(conn, cursor, query, params)
+                    # RealDictRow is already a dict; avoid copying every row
+                    rows = cursor.fetchall()
+                    timing['rows'] = len(rows)
+                    if DB_QUERY_STATS:
+                        timing['bytes'] = estimate_bytes(rows)
+                if result_format == "dicts":
+                    return rows
+                description = cursor.description or []
+        
+        columns = [col.name for col in description]
+        if result_format == "tuples":
+            return columns, rows
+        return _to_columnar(description, rows)
+    
+    def stream_query(self,
+                     query: str,
+                     params: tuple = None,
+                     chunk_size: int = 2000,
+                     batches: bool = False) -> Iterator[Any]:
+        """
+        Stream a SELECT through a named server-side cursor
+        
+        Only ``chunk_size`` rows are held client-side at a time, so large
+        result sets can be walked in constant memory. The pooled connection
+        stays checked out (inside one transaction) until the generator is
+        exhausted or closed.
+        
+        Args:
+            query: SELECT statement
+            params: Query parameters
+            chunk_size: Rows fetched per round trip
+            batches: Yield lists of up to chunk_size rows instead of single rows
+            
+        Yields:
+            Row dicts, or lists of row dicts when ``batches`` is set
+        """
         with self.get_connection() as conn:
-            with conn.cursor(cursor_factory=RealDictCursor) as cursor:
+            cursor_name = f"prism_stream_{uuid.uuid4().hex}"
+            with conn.cursor(name=cursor_name, cursor_factory=RealDictCursor) as cursor:
+                cursor.itersize = chunk_size
                 cursor.execute(query, params)
-                return [dict(row) for row in cursor.fetchall()]
+                while True:
+                    # Time each fetch round trip, not the consumer's work between them
+                    with self._timed(conn, query, params) as timing:
+                        rows = cursor.fetchmany(chunk_size)
+                        timing['rows'] = len(rows)
+                        if DB_QUERY_STATS:
+                            timing['bytes'] = estimate_bytes(rows)
+                    if not rows:
+                        break
+                    if batches:
+                        yield rows
+                    else:
+                        yield from rows
     
+    @_retried(idempotent=False)
     def execute_update(self, query: str, params: tuple = None) -> int:
         """Execute an INSERT/UPDATE/DELETE query and return affected rows"""
         with self.get_connection() as conn:
             with conn.cursor() as cursor:
-                cursor.execute(query, params)
+                with self._timed(conn, query, params) as timing:
+                    self._execute(conn, cursor, query, params)
+                    timing['rows'] = cursor.rowcount
+                if query.lstrip().upper().startswith(_DDL_PREFIXES):
+                    self.invalidate_prepared_statements()
                 return cursor.rowcount
     
+    @_retried(idempotent=False)
+    def bulk_insert(self,
+                    table: str,
+                    columns: Sequence[str],
+                    rows: Iterable[Sequence[Any]],
+                    on_conflict: str = None,
+                    returning: str = None,
+                    template: str = None,
+                    chunk_size: int = 500,
+                    method: str = "values") -> List[Any]:
+        """
+        Insert many rows in a single transaction
+        
+        Args:
+            table: Target table name
+            columns: Column names, in the order values appear in each row
+            rows: Row tuples (or dicts keyed by column name)
+            on_conflict: Conflict clause without the ON CONFLICT keywords,
+                e.g. "(software_name) DO NOTHING"
+            returning: Column to return for each inserted row (e.g. "id")
+            template: Per-row VALUES template, e.g. "(%s, %s, NOW())"
+            chunk_size: Rows per multi-row INSERT / COPY chunk
+            method: "values" for multi-row INSERT ... VALUES, "copy" for
+                COPY FROM STDIN (fastest; no on_conflict/returning/template)
+            
+        Returns:
+            Values of the ``returning`` column, or an empty list
+        """
+        rows = [
+            tuple(row[col] for col in columns) if isinstance(row, dict) else tuple(row)
+            for row in rows
+        ]
+        if not rows:
+            return []
+        
+        table_sql = sql.SQL(".").join(sql.Identifier(part) for part in table.split("."))
+        columns_sql = sql.SQL(", ").join(sql.Identifier(col) for col in columns)
+        
+        if method == "copy":
+            if on_conflict or returning or template:
+                raise ValueError("COPY does not support on_conflict, returning or template")
+            return self._bulk_copy(table_sql, columns_sql, rows, chunk_size)
+        if method != "values":
+            raise ValueError(f"Unknown bulk insert method: {method}")
+        
+        query = sql.SQL("INSERT INTO {} ({}) VALUES %s").format(table_sql, columns_sql)
+        if on_conflict:
+            query += sql.SQL(" ON CONFLICT ") + sql.SQL(on_conflict)
+        if returning:
+            query += sql.SQL(" RETURNING {}").format(sql.Identifier(returning))
+        
+        returned = []
+        with self.get_connection() as conn:
+            with conn.cursor() as cursor:
+                query = query.as_string(conn)
+                for start in range(0, len(rows), chunk_size):
+                    chunk = rows[start:start + chunk_size]
+                    with self._timed(conn, query) as timing:
+                        result = execute_values(
+                            cursor, query, chunk,
+                            template=template,
+                            page_size=len(chunk),
+                            fetch=bool(returning)
+                        )
+                        timing['rows'] = len(chunk)
+                    if returning:
+                        returned.extend(row[0] for row in result)
+        return returned
+    
+    def bulk_insert_tolerant(self,
+                             table: str,
+                             columns: Sequence[str],
+                             rows: Iterable[Sequence[Any]],
+                             **kwargs) -> Tuple[List[Any], List[Tuple[Sequence[Any], Exception]]]:
+        """
+        bulk_insert that loses only the bad rows when a row breaks the batch
+        
+        The batch is tried first, inside a savepoint. If it fails (a value
+        of the wrong type, too long, NULL in a NOT NULL column), each row is
+        inserted again in its own savepoint. Keyword arguments go to
+        bulk_insert.
+        
+        Returns:
+            (values of the ``returning`` column, [(row, error)] for the rows
+            that could not be inserted)
+        """
+        rows = list(rows)
+        with self.transaction() as tx:
+            try:
+                with tx.savepoint():
+                    return self.bulk_insert(table, columns, rows, **kwargs), []
+            except (psycopg2.OperationalError, psycopg2.InterfaceError):
+                # Connection trouble or a cancelled statement: no single row is to blame
+                raise
+            except psycopg2.Error:
+                pass
+            
+            returned, failed = [], []
+            for row in rows:
+                try:
+                    with tx.savepoint():
+                        returned.extend(self.bulk_insert(table, columns, [row], **kwargs))
+                except (psycopg2.OperationalError, psycopg2.InterfaceError):
+                    raise
+                except psycopg2.Error as e:
+                    failed.append((row, e))
+            return returned, failed
+    
+    def _bulk_copy(self, table_sql, columns_sql, rows: List[tuple], chunk_size: int) -> List[Any]:
+        """Stream rows through COPY ... FROM STDIN in CSV chunks"""
+        with self.get_connection() as conn:
+            with conn.cursor() as cursor:
+                copy_sql = sql.SQL(
+                    "COPY {} ({}) FROM STDIN WITH (FORMAT csv, NULL '\\N')"
+                ).format(table_sql, columns_sql).as_string(conn)
+                for start in range(0, len(rows), chunk_size):
+                    buffer = io.StringIO()
+                    writer = csv.writer(buffer)
+                    for row in rows[start:start + chunk_size]:
+                        writer.writerow(['\\N' if value is None else value for value in row])
+                    buffer.seek(0)
+                    with self._timed(conn, copy_sql) as timing:
+                        cursor.copy_expert(copy_sql, buffer)
+                        timing['rows'] = cursor.rowcount
+        return []
+    
     def get_software_by_id(self, software_id: str) -> Dict[str, Any]:
         """Get software asset by ID"""
         query = """
@@ -50,11 +655,115 @@ class Database:
         results = self.execute_query(query, (software_id,))
         return results[0] if results else None
     
+    def get_software_by_ids(self, software_ids: Sequence[str]) -> Dict[str, Dict[str, Any]]:
+        """Get many software assets in one query, keyed by ID"""
+        if not software_ids:
+            return {}
+        query = """
+            SELECT * FROM software_assets 
+            WHERE id = ANY(%s::uuid[])
+        """
+        results = self.execute_query(query, ([str(i) for i in software_ids],))
+        return {str(row['id']): row for row in results}
+    
+    def get_latest_usage_by_software_ids(self, software_ids: Sequence[str]) -> Dict[str, Dict[str, Any]]:
+        """Get the most recent usage_analytics row per software in one query, keyed by software ID"""
+        if not software_ids:
+            return {}
+        query = """
+            SELECT DISTINCT ON (software_id) * FROM usage_analytics 
+            WHERE software_id = ANY(%s::uuid[])
+            ORDER BY software_id, analysis_date DESC
+        """
+        results = self.execute_query(query, ([str(i) for i in software_ids],))
+        return {str(row['software_id']): row for row in results}
+    
     def get_all_software(self) -> List[Dict[str, Any]]:
         """Get all software assets"""
         query = "SELECT * FROM software_assets ORDER BY total_annual_cost DESC"
         return self.execute_query(query)
     
+    def stream_all_software(self, chunk_size: int = 2000) -> Iterator[Dict[str, Any]]:
+        """Lazily iterate all software assets without materialising the table"""
+        query = "SELECT * FROM software_assets ORDER BY total_annual_cost DESC"
+        return self.stream_query(query, chunk_size=chunk_size)
+    
+    def iter_software_pages(self,
+                            company_id: str = None,
+                            columns: Sequence[str] = None,
+                            filters: Dict[str, Any] = None,
+                            page_size: int = 500) -> Iterator[List[Dict[str, Any]]]:
+        """
+        Walk software assets page by page, most expensive first
+        
+        Uses keyset pagination on (total_annual_cost, id) rather than
+        OFFSET, so every page is an index range scan (see migration 006)
+        and ordering stays stable while rows are inserted.
+        
+        Args:
+            company_id: Only this company's assets
+            columns: Columns to select (id and total_annual_cost are always added)
+            filters: Equality filters, {column: value}; list values match any
+            page_size: Rows per page
+            
+        Yields:
+            Lists of up to page_size row dicts
+        """
+        if columns:
+            selected = list(columns)
+            for key in ("id", "total_annual_cost"):
+                if key not in selected:
+                    selected.append(key)
+            select_sql = sql.SQL(", ").join(sql.Identifier(col) for col in selected)
+        else:
+            select_sql = sql.SQL("*")
+        
+        conditions = []
+        params = []
+        if company_id is not None:
+            conditions.append(sql.SQL("company_id = %s"))
+            params.append(company_id)
+        for column, value in (filters or {}).items():
+            if isinstance(value, (list, tuple, set)):
+                conditions.append(sql.SQL("{} = ANY(%s)").format(sql.Identifier(column)))
+                params.append(list(value))
+            else:
+                conditions.append(sql.SQL("{} = %s").format(sql.Identifier(column)))
+                params.append(value)
+        
+        def build(page_conditions):
+            query = sql.SQL("SELECT {} FROM software_assets").format(select_sql)
+            if page_conditions:
+                query += sql.SQL(" WHERE ") + sql.SQL(" AND ").join(page_conditions)
+            return query + sql.SQL(" ORDER BY total_annual_cost DESC, id DESC LIMIT %s")
+        
+        first_page = build(conditions)
+        next_page = build(conditions + [sql.SQL("(total_annual_cost, id) < (%s, %s::uuid)")])
+        with self.get_connection() as conn:
+            first_page = first_page.as_string(conn)
+            next_page = next_page.as_string(conn)
+        
+        last_key = None
+        while True:
+            if last_key is None:
+                rows = self.execute_query(first_page, tuple(params) + (page_size,))
+            else:
+                rows = self.execute_query(next_page, tuple(params) + last_key + (page_size,))
+            if not rows:
+                return
+            
+            yield rows
+            
+            if len(rows) < page_size:
+                return
+            last_row = rows[-1]
+            last_key = (last_row['total_annual_cost'], str(last_row['id']))
+    
+    def iter_software(self, **kwargs) -> Iterator[Dict[str, Any]]:
+        """Row-by-row view of iter_software_pages (same arguments)"""
+        for page in self.iter_software_pages(**kwargs):
+            yield from page
+    
     def get_replacement_candidates(self) -> List[Dict[str, Any]]:
         """Get software marked for replacement"""
         query = """
@@ -77,6 +786,92 @@ class Database:
         results = self.execute_query(query, (vendor_name,))
         return results[0] if results else None
     
+    def get_vendors_by_names(self, vendor_names: Sequence[str]) -> Dict[str, Dict[str, Any]]:
+        """Get vendor intelligence for many vendors in one query, keyed by name"""
+        if not vendor_names:
+            return {}
+        query = "SELECT * FROM vendor_intelligence WHERE vendor_name = ANY(%s)"
+        results = self.execute_query(query, (list(vendor_names),))
+        return {row['vendor_name']: row for row in results}
+    
+    @_retried(idempotent=False)
+    def save_llm_usage(self,
+                       run_id: str,
+                       agent_name: str,
+                       analysis_type: str,
+                       tokens: Dict[str, int],
+                       calls: int,
+                       cost_usd: float,
+                       llm_time_seconds: float,
+                       processing_time_seconds: float,
+                       subject: str = None,
+                       software_id: str = None,
+                       retries: int = 0,
+                       ttft_seconds: float = None,
+                       models: List[str] = None) -> str:
+        """Save the LLM tokens, cost and time behind one analysis (llm_analysis_usage)"""
+        query = """
+            INSERT INTO llm_analysis_usage (
+                run_id, agent_name, analysis_type, subject, software_id, calls, retries, models,
+                input_tokens, cache_read_input_tokens, cache_creation_input_tokens, output_tokens,
+                tokens_used, cost_usd, llm_time_seconds, ttft_seconds, processing_time_seconds
+            ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+            RETURNING id
+        """
+        with self.get_connection() as conn:
+            with conn.cursor() as cursor:
+                with self._timed(conn, query) as timing:
+                    cursor.execute(query, (
+                        run_id, agent_name, analysis_type, subject, software_id, calls, retries,
+                        list(models or []), tokens.get('input_tokens', 0), tokens.get('cache_read_input_tokens', 0),
+                        tokens.get('cache_creation_input_tokens', 0), tokens.get('output_tokens', 0),
+                        sum(tokens.values()), round(cost_usd, 6), round(llm_time_seconds, 3),
+                        ttft_seconds, processing_time_seconds
+                    ))
+                    timing['rows'] = 1
+                return cursor.fetchone()[0]
+    
+    @_retried(idempotent=True)
+    def save_llm_run_usage(self, snapshot: Dict[str, Any]) -> int:
+        """Save (or update) a run's LLM totals from a UsageTracker snapshot (llm_run_usage)"""
+        import json
+        totals = snapshot['totals']
+        query = """
+            INSERT INTO llm_run_usage (
+                run_id, started_at, elapsed_seconds, calls, cache_hits, coalesced, retries,
+                input_tokens, cache_read_input_tokens, cache_creation_input_tokens, output_tokens,
+                cost_usd, agents
+            ) VALUES (%s, to_timestamp(%s), %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s::jsonb)
+            ON CONFLICT (run_id) DO UPDATE SET
+                elapsed_seconds = EXCLUDED.elapsed_seconds,
+                calls = EXCLUDED.calls,
+                cache_hits = EXCLUDED.cache_hits,
+                coalesced = EXCLUDED.coalesced,
+                retries = EXCLUDED.retries,
+                input_tokens = EXCLUDED.input_tokens,
+                cache_read_input_tokens = EXCLUDED.cache_read_input_tokens,
+                cache_creation_input_tokens = EXCLUDED.cache_creation_input_tokens,
+                output_tokens = EXCLUDED.output_tokens,
+                cost_usd = EXCLUDED.cost_usd,
+                agents = EXCLUDED.agents,
+                recorded_at = NOW()
+        """
+        params = (
+            snapshot['run_id'], snapshot['started'], snapshot['elapsed_seconds'],
+            totals['calls'], totals['cache_hits'], totals['coalesced'], totals['retries'],
+            totals['input_tokens'], totals['cache_read_input_tokens'],
+            totals['cache_creation_input_tokens'], totals['output_tokens'],
+            round(totals['cost_usd'], 6), json.dumps(snapshot['agents'], default=str)
+        )
+        # Not through execute_update: its own retries would nest inside this method's
+        with self.get_connection() as conn:
+            with conn.cursor() as cursor:
+                with self._timed(conn, query, params) as timing:
+                    self._execute(conn, cursor, query, params)
+                    timing['rows'] = cursor.rowcount
+                return cursor.rowcount
+    
+    @_retried(idempotent=False)
     def save_agent_analysis(self, 
                            software_id: str,
                            agent_name: str,
@@ -85,22 +880,28 @@ class Database:
                            structured_findings: Dict[str, Any],
                            key_insights: List[str],
                            recommendations: List[str],
-                           confidence_score: float) -> str:
-        """Save agent analysis to database"""
+                           confidence_score: float,
+                           tokens_used: int = None,
+                           processing_time_seconds: float = None) -> str:
+        """Save agent analysis to database, with the LLM tokens and time it took"""
         query = """
             INSERT INTO ai_agent_analyses (
                 software_id, agent_name, analysis_type, 
                 raw_findings, structured_findings, 
-                key_insights, recommendations, confidence_score
-            ) VALUES (%s, %s, %s, %s, %s::jsonb, %s, %s, %s)
+                key_insights, recommendations, confidence_score,
+                tokens_used, processing_time_seconds
+            ) VALUES (%s, %s, %s, %s, %s::jsonb, %s, %s, %s, %s, %s)
             RETURNING id
         """
         import json
         with self.get_connection() as conn:
             with conn.cursor() as cursor:
-                cursor.execute(query, (
-                    software_id, agent_name, analysis_type,
-                    raw_findings, json.dumps(structured_findings),
-                    key_insights, recommendations, confidence_score
-                ))
+                with self._timed(conn, query) as timing:
+                    cursor.execute(query, (
+                        software_id, agent_name, analysis_type,
+                        raw_findings, json.dumps(structured_findings, default=str),
+                        key_insights, recommendations, confidence_score,
+                        tokens_used, processing_time_seconds
+                    ))
+                    timing['rows'] = 1
                 return cursor.fetchone()[0]
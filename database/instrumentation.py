@@ -0,0 +1,134 @@
+"""
+PRISM Query Instrumentation
+Per-statement latency histograms, row/byte counts and a slow-query log
+"""
+import atexit
+import functools
+import re
+import threading
+from typing import Dict, Any, List
+
+# Latency histogram bucket upper bounds, in milliseconds
+LATENCY_BUCKETS_MS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, float("inf"))
+
+_COMMENT = re.compile(r"--[^\n]*|/\*.*?\*/", re.DOTALL)
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r"\b\d+(?:\.\d+)?\b")
+_WHITESPACE = re.compile(r"\s+")
+
+
+@functools.lru_cache(maxsize=1024)
+def normalize_sql(query: str) -> str:
+    """Collapse a statement to a stable key: no literals, comments or extra whitespace"""
+    query = _COMMENT.sub(" ", query)
+    query = _STRING.sub("?", query)
+    query = _NUMBER.sub("?", query)
+    return _WHITESPACE.sub(" ", query).strip()
+
+
+def estimate_bytes(rows: List[Any]) -> int:
+    """Rough size of a result set (text/bytes length, 8 bytes per other value)"""
+    total = 0
+    for row in rows:
+        values = row.values() if isinstance(row, dict) else row
+        for value in values:
+            if isinstance(value, (str, bytes, bytearray, memoryview)):
+                total += len(value)
+            elif value is not None:
+                total += 8
+    return total
+
+
+class QueryStats:
+    """Thread-safe aggregate of statement timings keyed by normalised SQL"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats: Dict[str, Dict[str, Any]] = {}
+
+    def record(self, query: str, elapsed: float, rows: int = 0, nbytes: int = 0):
+        """Record one execution (elapsed in seconds)"""
+        key = normalize_sql(query)
+        elapsed_ms = elapsed * 1000
+        with self._lock:
+            entry = self._stats.get(key)
+            if entry is None:
+                entry = self._stats[key] = {
+                    'calls': 0,
+                    'total_ms': 0.0,
+                    'max_ms': 0.0,
+                    'rows': 0,
+                    'bytes': 0,
+                    'histogram': [0] * len(LATENCY_BUCKETS_MS),
+                }
+            entry['calls'] += 1
+            entry['total_ms'] += elapsed_ms
+            entry['max_ms'] = max(entry['max_ms'], elapsed_ms)
+            entry['rows'] += rows
+            entry['bytes'] += nbytes
+            for i, bound in enumerate(LATENCY_BUCKETS_MS):
+                if elapsed_ms <= bound:
+                    entry['histogram'][i] += 1
+                    break
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        """Copy of all entries with mean and approximate p50/p95 added"""
+        with self._lock:
+            entries = {key: dict(entry, histogram=list(entry['histogram']))
+                       for key, entry in self._stats.items()}
+        for entry in entries.values():
+            entry['mean_ms'] = entry['total_ms'] / entry['calls']
+            entry['p50_ms'] = self._percentile(entry, 0.50)
+            entry['p95_ms'] = self._percentile(entry, 0.95)
+        return entries
+
+    def reset(self):
+        with self._lock:
+            self._stats.clear()
+
+    def summary(self, limit: int = 15) -> str:
+        """Text table of the statements with the most total time"""
+        entries = sorted(self.snapshot().items(), key=lambda item: item[1]['total_ms'], reverse=True)
+        if not entries:
+            return "No queries recorded"
+
+        lines = [
+            f"{'calls':>7} {'total ms':>10} {'mean':>8} {'p95':>8} {'max':>8} {'rows':>8} {'bytes':>10}  statement"
+        ]
+        for key, entry in entries[:limit]:
+            statement = key if len(key) <= 100 else key[:97] + "..."
+            lines.append(
+                f"{entry['calls']:>7} {entry['total_ms']:>10.1f} {entry['mean_ms']:>8.1f} "
+                f"{entry['p95_ms']:>8.1f} {entry['max_ms']:>8.1f} {entry['rows']:>8} "
+                f"{entry['bytes']:>10}  {statement}"
+            )
+        return "\n".join(lines)
+
+    @staticmethod
+    def _percentile(entry: Dict[str, Any], fraction: float) -> float:
+        """Upper bucket bound containing the given fraction of calls"""
+        target = entry['calls'] * fraction
+        seen = 0
+        for count, bound in zip(entry['histogram'], LATENCY_BUCKETS_MS):
+            seen += count
+            if seen >= target:
+                return min(bound, entry['max_ms'])
+        return entry['max_ms']
+
+
+QUERY_STATS = QueryStats()
+_summary_enabled = False
+
+
+def enable_exit_summary():
+    """Print the query summary when the process exits"""
+    global _summary_enabled
+    if not _summary_enabled:
+        _summary_enabled = True
+        atexit.register(_print_summary)
+
+
+def _print_summary():
+    if QUERY_STATS.snapshot():
+        print("\n[Database] Query summary (by total time)")
+        print(QUERY_STATS.summary())
@@ -0,0 +1,26 @@
+-- ============================================
+-- PRISM SOFTWARE ASSETS KEYSET INDEXES
+-- Migration 006: Index the portfolio sort order
+-- ============================================
+--
+-- Database.iter_software_pages() walks software_assets ordered by
+-- (total_annual_cost DESC, id DESC) using keyset pagination:
+--
+--   WHERE (total_annual_cost, id) < (:last_cost, :last_id)
+--   ORDER BY total_annual_cost DESC, id DESC
+--   LIMIT :page_size
+--
+-- These indexes let every page be an index range scan, with or
+-- without a company_id filter, instead of a sort of the whole table.
+--
+-- ============================================
+
+BEGIN;
+
+CREATE INDEX IF NOT EXISTS idx_software_assets_cost_id
+    ON software_assets(total_annual_cost DESC, id DESC);
+
+CREATE INDEX IF NOT EXISTS idx_software_assets_company_cost_id
+    ON software_assets(company_id, total_annual_cost DESC, id DESC);
+
+COMMIT;
@@ -0,0 +1,26 @@
+-- ============================================
+-- PRISM LLM RESPONSE CACHE
+-- Migration 007: Shared cache for model responses
+-- ============================================
+--
+-- Backing table for llm.cache.PostgresStore (LLM_CACHE_BACKEND=postgres).
+-- Keys are SHA-256 hashes of model, system prompt, prompt, temperature
+-- and max_tokens; last_access drives LRU eviction.
+--
+-- ============================================
+
+BEGIN;
+
+CREATE TABLE IF NOT EXISTS llm_response_cache (
+    cache_key CHAR(64) PRIMARY KEY,
+    namespace VARCHAR(100),
+    response TEXT NOT NULL,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    expires_at TIMESTAMPTZ,
+    last_access TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+CREATE INDEX IF NOT EXISTS idx_llm_response_cache_last_access ON llm_response_cache(last_access);
+CREATE INDEX IF NOT EXISTS idx_llm_response_cache_expires_at ON llm_response_cache(expires_at);
+
+COMMIT;
@@ -0,0 +1,74 @@
+-- ============================================
+-- PRISM LLM USAGE
+-- Migration 008: Token, time and cost figures per analysis and per run
+-- ============================================
+--
+-- Written from llm/metrics.py. llm_analysis_usage gets one row per agent
+-- analysis (BaseAgent.save_usage) and llm_run_usage one row per run with
+-- its totals; both carry the run id printed in the run summary.
+-- v_agent_llm_usage rolls the analyses up per run and agent.
+--
+-- ============================================
+
+BEGIN;
+
+CREATE TABLE IF NOT EXISTS llm_run_usage (
+    run_id VARCHAR(32) PRIMARY KEY,
+    started_at TIMESTAMPTZ NOT NULL,
+    elapsed_seconds NUMERIC,
+    calls INTEGER NOT NULL DEFAULT 0,
+    cache_hits INTEGER NOT NULL DEFAULT 0,
+    coalesced INTEGER NOT NULL DEFAULT 0,
+    retries INTEGER NOT NULL DEFAULT 0,
+    input_tokens BIGINT NOT NULL DEFAULT 0,
+    cache_read_input_tokens BIGINT NOT NULL DEFAULT 0,
+    cache_creation_input_tokens BIGINT NOT NULL DEFAULT 0,
+    output_tokens BIGINT NOT NULL DEFAULT 0,
+    cost_usd NUMERIC(12, 6) NOT NULL DEFAULT 0,
+    agents JSONB,  -- per-agent figures, including latency percentiles
+    recorded_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+CREATE TABLE IF NOT EXISTS llm_analysis_usage (
+    id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+    run_id VARCHAR(32) NOT NULL,
+    agent_name VARCHAR(100) NOT NULL,
+    analysis_type VARCHAR(100) NOT NULL,
+    subject TEXT,  -- vendor or software analysed
+    software_id UUID,
+    calls INTEGER NOT NULL DEFAULT 0,
+    retries INTEGER NOT NULL DEFAULT 0,
+    models TEXT[],  -- models that answered (a degraded run shows the budget model here)
+    input_tokens INTEGER NOT NULL DEFAULT 0,
+    cache_read_input_tokens INTEGER NOT NULL DEFAULT 0,
+    cache_creation_input_tokens INTEGER NOT NULL DEFAULT 0,
+    output_tokens INTEGER NOT NULL DEFAULT 0,
+    tokens_used INTEGER NOT NULL DEFAULT 0,
+    cost_usd NUMERIC(12, 6) NOT NULL DEFAULT 0,
+    llm_time_seconds NUMERIC,
+    ttft_seconds NUMERIC,  -- mean time to first token of the streamed calls
+    processing_time_seconds NUMERIC,
+    recorded_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+CREATE INDEX IF NOT EXISTS idx_llm_analysis_usage_run ON llm_analysis_usage(run_id);
+
+CREATE OR REPLACE VIEW v_agent_llm_usage AS
+SELECT
+    run_id,
+    agent_name,
+    COUNT(*) AS analyses,
+    SUM(calls) AS calls,
+    SUM(retries) AS retries,
+    SUM(tokens_used) AS tokens_used,
+    ROUND(AVG(tokens_used)) AS avg_tokens_per_analysis,
+    SUM(cost_usd) AS cost_usd,
+    SUM(processing_time_seconds) AS processing_time_seconds,
+    ROUND(AVG(processing_time_seconds), 2) AS avg_seconds_per_analysis,
+    MAX(processing_time_seconds) AS max_seconds_per_analysis,
+    ROUND(AVG(ttft_seconds), 2) AS avg_ttft_seconds,
+    MIN(recorded_at) AS first_recorded_at
+FROM llm_analysis_usage
+GROUP BY run_id, agent_name;
+
+COMMIT;
@@ -0,0 +1,20 @@
+"""
+PRISM SQL Placeholder Helpers
+"""
+import re
+
+_PLACEHOLDER = re.compile(r"%(s|%)")
+
+
+def to_numbered_placeholders(query: str) -> str:
+    """Rewrite psycopg2 ``%s`` placeholders as server-side ``$1, $2, ...``"""
+    counter = 0
+
+    def replace(match):
+        nonlocal counter
+        if match.group(1) == "%":
+            return "%"
+        counter += 1
+        return f"${counter}"
+
+    return _PLACEHOLDER.sub(replace, query)
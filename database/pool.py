@@ -0,0 +1,249 @@
+"""
+PRISM Database Connection Pool
+Bounded, thread-safe psycopg2 pool shared by every Database instance
+"""
+import atexit
+import threading
+import time
+from typing import Dict, Any, List, Optional
+import psycopg2
+import psycopg2.extensions
+
+
+class PooledConnection(psycopg2.extensions.connection):
+    """psycopg2 connection carrying per-connection prepared-statement state"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.prepared: Dict[str, str] = {}  # SQL text -> prepared statement name
+        self.schema_generation = 0
+
+
+class PoolTimeout(Exception):
+    """Raised when no connection becomes available within the checkout timeout"""
+
+
+class ConnectionPool:
+    """
+    Bounded pool of psycopg2 connections
+
+    - At most ``max_size`` connections are open; callers block (up to
+      ``timeout`` seconds) when all of them are checked out.
+    - Connections idle longer than ``max_idle`` are closed, down to ``min_size``.
+    - Connections idle longer than ``check_after`` are pinged before reuse.
+    - Connections are always returned outside a transaction and carry no
+      session state, so the pool is safe behind PgBouncer in transaction mode.
+    """
+
+    def __init__(self,
+                 dsn: str,
+                 min_size: int = 1,
+                 max_size: int = 10,
+                 timeout: float = 30,
+                 max_idle: float = 300,
+                 check_after: float = 30):
+        if min_size < 0 or max_size < 1 or min_size > max_size:
+            raise ValueError(f"Invalid pool bounds: min_size={min_size}, max_size={max_size}")
+
+        self.dsn = dsn
+        self.min_size = min_size
+        self.max_size = max_size
+        self.timeout = timeout
+        self.max_idle = max_idle
+        self.check_after = check_after
+
+        self._cond = threading.Condition()
+        self._idle: List[tuple] = []  # (connection, returned_at), most recently used last
+        self._size = 0  # open connections, idle + checked out + being created
+        self._closed = False
+
+        self._stats = {
+            'checkouts': 0,
+            'waits': 0,
+            'wait_time_total': 0.0,
+            'wait_time_max': 0.0,
+            'timeouts': 0,
+            'connections_created': 0,
+            'connections_closed': 0,
+            'failed_liveness_checks': 0,
+        }
+
+    def getconn(self):
+        """Check out a live connection, blocking while the pool is exhausted"""
+        started = time.monotonic()
+        deadline = started + self.timeout
+        waited = False
+
+        while True:
+            conn = None
+            returned_at = None
+            create = False
+
+            with self._cond:
+                while True:
+                    if self._closed:
+                        raise psycopg2.InterfaceError("connection pool is closed")
+
+                    self._reap_idle()
+
+                    if self._idle:
+                        conn, returned_at = self._idle.pop()
+                        break
+                    if self._size < self.max_size:
+                        self._size += 1
+                        create = True
+                        break
+
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._stats['timeouts'] += 1
+                        raise PoolTimeout(
+                            f"No database connection available after {self.timeout:.1f}s "
+                            f"(max_size={self.max_size})"
+                        )
+                    waited = True
+                    self._cond.wait(remaining)
+
+            if create:
+                try:
+                    conn = self._connect()
+                except Exception:
+                    with self._cond:
+                        self._size -= 1
+                        self._cond.notify()
+                    raise
+            elif not self._is_alive(conn, returned_at):
+                self._discard(conn)
+                continue
+
+            self._record_checkout(time.monotonic() - started, waited)
+            return conn
+
+    def putconn(self, conn, discard: bool = False):
+        """Return a connection to the pool (or close it if broken or ``discard``)"""
+        if not discard and not conn.closed:
+            try:
+                status = conn.info.transaction_status
+                if status != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                    conn.rollback()
+            except Exception:
+                discard = True
+
+        if discard or conn.closed:
+            self._discard(conn)
+            return
+
+        with self._cond:
+            if self._closed:
+                self._size -= 1
+                self._close_quietly(conn)
+            else:
+                self._idle.append((conn, time.monotonic()))
+            self._cond.notify()
+
+    def close(self):
+        """Close every idle connection and refuse further checkouts"""
+        with self._cond:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._size -= len(idle)
+            self._cond.notify_all()
+        for conn, _ in idle:
+            self._close_quietly(conn)
+
+    def stats(self) -> Dict[str, Any]:
+        """Snapshot of pool size, checkout counts and wait times"""
+        with self._cond:
+            stats = dict(self._stats)
+            stats['size'] = self._size
+            stats['idle'] = len(self._idle)
+            stats['in_use'] = self._size - len(self._idle)
+            stats['min_size'] = self.min_size
+            stats['max_size'] = self.max_size
+        checkouts = stats['checkouts']
+        stats['wait_time_avg'] = stats['wait_time_total'] / checkouts if checkouts else 0.0
+        return stats
+
+    def _connect(self):
+        conn = psycopg2.connect(self.dsn, connection_factory=PooledConnection)
+        with self._cond:
+            self._stats['connections_created'] += 1
+        return conn
+
+    def _is_alive(self, conn, returned_at: Optional[float]) -> bool:
+        """Liveness check on checkout; only round-trips for long-idle connections"""
+        if conn.closed:
+            return False
+        if returned_at is not None and time.monotonic() - returned_at < self.check_after:
+            return True
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except Exception:
+            with self._cond:
+                self._stats['failed_liveness_checks'] += 1
+            return False
+
+    def _reap_idle(self):
+        """Close connections idle past max_idle, keeping min_size open (lock held)"""
+        if not self._idle or self.max_idle is None:
+            return
+        now = time.monotonic()
+        kept = []
+        # Oldest connections sit at the front of the list
+        for conn, returned_at in self._idle:
+            if now - returned_at > self.max_idle and self._size > self.min_size:
+                self._size -= 1
+                self._stats['connections_closed'] += 1
+                self._close_quietly(conn)
+            else:
+                kept.append((conn, returned_at))
+        self._idle = kept
+
+    def _discard(self, conn):
+        self._close_quietly(conn)
+        with self._cond:
+            self._size -= 1
+            self._stats['connections_closed'] += 1
+            self._cond.notify()
+
+    def _record_checkout(self, wait_time: float, waited: bool):
+        with self._cond:
+            self._stats['checkouts'] += 1
+            self._stats['wait_time_total'] += wait_time
+            self._stats['wait_time_max'] = max(self._stats['wait_time_max'], wait_time)
+            if waited:
+                self._stats['waits'] += 1
+
+    @staticmethod
+    def _close_quietly(conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+
+_pools: Dict[str, ConnectionPool] = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(dsn: str, **kwargs) -> ConnectionPool:
+    """Return the process-wide pool for a DSN, creating it on first use"""
+    with _pools_lock:
+        pool = _pools.get(dsn)
+        if pool is None or pool._closed:
+            pool = ConnectionPool(dsn, **kwargs)
+            _pools[dsn] = pool
+        return pool
+
+
+@atexit.register
+def close_all_pools():
+    """Close every shared pool (registered to run at interpreter exit)"""
+    with _pools_lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for pool in pools:
+        pool.close()
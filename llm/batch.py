@@ -0,0 +1,86 @@
+"""
+PRISM LLM Batch Jobs
+Submit many completions as one Message Batch and stream the results back
+"""
+import time
+from typing import Dict, Any, Iterator, List, Optional, Tuple
+from config.settings import LLM_BATCH_POLL_INTERVAL
+from llm.client import LLMClient, LLMResponse
+
+
+class BatchJob:
+    """
+    Message Batches API wrapper around an LLMClient
+
+    Batches trade latency (results within 24h, usually minutes) for half
+    the price and a separate rate limit, which suits bulk enrichment.
+    Successful results are written to the client's response cache, so a
+    later interactive run over the same items is served locally.
+    """
+
+    def __init__(self, llm: LLMClient):
+        self.llm = llm
+        self.batches = llm.client.messages.batches
+
+    def submit(self, requests: List[Tuple[str, Dict[str, Any]]]) -> str:
+        """
+        Create a batch
+
+        Args:
+            requests: (custom_id, params) pairs; params as built by
+                LLMClient.request_params. custom_id must match [a-zA-Z0-9_-]{1,64}
+
+        Returns:
+            Batch id
+        """
+        batch = self.batches.create(requests=[
+            {"custom_id": custom_id, "params": params} for custom_id, params in requests
+        ])
+        print(f"[LLM batch] Submitted {batch.id} with {len(requests)} requests")
+        return batch.id
+
+    def wait(self, batch_id: str, poll_interval: float = LLM_BATCH_POLL_INTERVAL):
+        """Poll until the batch has ended; returns the final batch object"""
+        last_counts = None
+        while True:
+            batch = self.batches.retrieve(batch_id)
+            counts = batch.request_counts
+            summary = (counts.processing, counts.succeeded, counts.errored, counts.canceled, counts.expired)
+            if summary != last_counts:
+                print(f"[LLM batch] {batch_id}: {batch.processing_status} "
+                      f"(processing={counts.processing}, succeeded={counts.succeeded}, "
+                      f"errored={counts.errored}, canceled={counts.canceled}, expired={counts.expired})")
+                last_counts = summary
+            if batch.processing_status == "ended":
+                return batch
+            time.sleep(poll_interval)
+
+    def results(self,
+                batch_id: str,
+                cache_keys: Dict[str, str] = None,
+                validate=None) -> Iterator[Tuple[str, Optional[LLMResponse], Optional[str]]]:
+        """
+        Stream an ended batch's results
+
+        Args:
+            batch_id: Batch id
+            cache_keys: custom_id -> response cache key; matching successes are cached
+            validate: Only cache responses whose text passes this check
+
+        Yields:
+            (custom_id, response, error) tuples; response is None on failure
+        """
+        cache_keys = cache_keys or {}
+        for entry in self.batches.results(batch_id):
+            result = entry.result
+            if result.type != "succeeded":
+                error = getattr(result, "error", None)
+                yield entry.custom_id, None, f"{result.type}: {error}" if error else result.type
+                continue
+
+            response = LLMResponse.from_message(result.message)
+            self.llm.record_call(response, batch=True)
+            key = cache_keys.get(entry.custom_id)
+            if key:
+                self.llm.store_response(key, response, validate)
+            yield entry.custom_id, response, None
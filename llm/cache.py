@@ -0,0 +1,265 @@
+"""
+PRISM LLM Response Cache
+Content-addressed cache for model responses with pluggable stores
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Any, Optional
+from config.settings import (
+    LLM_CACHE_BACKEND, LLM_CACHE_PATH, LLM_CACHE_MAX_ENTRIES
+)
+
+# Shared stores trim back to max_entries every this many puts rather than on each one,
+# so they may briefly hold up to this many entries more
+EVICT_EVERY = 100
+
+
+def cache_key(model: str,
+              system_prompt: Optional[str],
+              prompt: str,
+              temperature: Optional[float],
+              max_tokens: int,
+              **extra: Any) -> str:
+    """
+    Hash of everything that determines a response
+
+    ``extra`` carries any further request options (tools, output schema,
+    prompt prefix) so requests that differ only there never collide.
+    """
+    payload = {
+        'model': model,
+        'system': system_prompt,
+        'prompt': prompt,
+        'temperature': temperature,
+        'max_tokens': max_tokens,
+    }
+    payload.update(extra)
+    encoded = json.dumps(payload, sort_keys=True, default=str).encode("utf-8")
+    return hashlib.sha256(encoded).hexdigest()
+
+
+class MemoryStore:
+    """In-process LRU store (lost when the process exits)"""
+
+    def __init__(self, max_entries: int = LLM_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at is not None and expires_at < time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def put(self, key: str, value: str, ttl: Optional[float], namespace: str = None) -> int:
+        """Store a value; returns how many entries were evicted"""
+        expires_at = time.time() + ttl if ttl else None
+        with self._lock:
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            evicted = 0
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                evicted += 1
+            return evicted
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class SQLiteStore:
+    """Local on-disk LRU store, shared by every process on the machine"""
+
+    def __init__(self, path: str = LLM_CACHE_PATH, max_entries: int = LLM_CACHE_MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._puts = 0
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS llm_responses (
+                    key TEXT PRIMARY KEY,
+                    namespace TEXT,
+                    value TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    expires_at REAL,
+                    last_access REAL NOT NULL
+                )
+            """)
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_llm_responses_last_access ON llm_responses(last_access)"
+            )
+
+    def get(self, key: str) -> Optional[str]:
+        now = time.time()
+        with self._lock, self._conn:
+            row = self._conn.execute(
+                "SELECT value, expires_at FROM llm_responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            value, expires_at = row
+            if expires_at is not None and expires_at < now:
+                self._conn.execute("DELETE FROM llm_responses WHERE key = ?", (key,))
+                return None
+            self._conn.execute("UPDATE llm_responses SET last_access = ? WHERE key = ?", (now, key))
+            return value
+
+    def put(self, key: str, value: str, ttl: Optional[float], namespace: str = None) -> int:
+        now = time.time()
+        expires_at = now + ttl if ttl else None
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO llm_responses "
+                "(key, namespace, value, created_at, expires_at, last_access) VALUES (?, ?, ?, ?, ?, ?)",
+                (key, namespace, value, now, expires_at, now)
+            )
+            self._puts += 1
+            if self._puts % EVICT_EVERY:
+                return 0
+            (count,) = self._conn.execute("SELECT COUNT(*) FROM llm_responses").fetchone()
+            overflow = count - self.max_entries
+            if overflow <= 0:
+                return 0
+            self._conn.execute(
+                "DELETE FROM llm_responses WHERE key IN "
+                "(SELECT key FROM llm_responses ORDER BY last_access ASC LIMIT ?)",
+                (overflow,)
+            )
+            return overflow
+
+    def clear(self):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM llm_responses")
+
+
+class PostgresStore:
+    """Store in the shared llm_response_cache table (see migration 007)"""
+
+    def __init__(self, max_entries: int = LLM_CACHE_MAX_ENTRIES):
+        from database.db import Database
+        self.db = Database()
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._puts = 0
+
+    def get(self, key: str) -> Optional[str]:
+        rows = self.db.execute_query("""
+            UPDATE llm_response_cache
+            SET last_access = NOW()
+            WHERE cache_key = %s
+              AND (expires_at IS NULL OR expires_at > NOW())
+            RETURNING response
+        """, (key,))
+        return rows[0]['response'] if rows else None
+
+    def put(self, key: str, value: str, ttl: Optional[float], namespace: str = None) -> int:
+        self.db.execute_update("""
+            INSERT INTO llm_response_cache (cache_key, namespace, response, expires_at)
+            VALUES (%s, %s, %s, NOW() + make_interval(secs => %s))
+            ON CONFLICT (cache_key) DO UPDATE SET
+                namespace = EXCLUDED.namespace,
+                response = EXCLUDED.response,
+                expires_at = EXCLUDED.expires_at,
+                created_at = NOW(),
+                last_access = NOW()
+        """, (key, namespace, value, ttl))
+        with self._lock:
+            self._puts += 1
+            if self._puts % EVICT_EVERY:
+                return 0
+        return self.db.execute_update("""
+            DELETE FROM llm_response_cache
+            WHERE expires_at < NOW()
+               OR cache_key IN (
+                   SELECT cache_key FROM llm_response_cache
+                   ORDER BY last_access DESC
+                   OFFSET %s
+               )
+        """, (self.max_entries,))
+
+    def clear(self):
+        self.db.execute_update("DELETE FROM llm_response_cache")
+
+
+class ResponseCache:
+    """
+    LLM response cache with TTLs and hit/miss counters
+
+    Values are the JSON-encoded response payload produced by LLMClient.
+    """
+
+    def __init__(self, store):
+        self.store = store
+        self._lock = threading.Lock()
+        self.stats = {'hits': 0, 'misses': 0, 'stores': 0, 'evictions': 0, 'errors': 0}
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        try:
+            value = self.store.get(key)
+        except Exception as e:
+            print(f"[LLM cache] Lookup failed: {e}")
+            self._count('errors')
+            value = None
+        self._count('hits' if value is not None else 'misses')
+        return json.loads(value) if value is not None else None
+
+    def put(self, key: str, payload: Dict[str, Any], ttl: Optional[float], namespace: str = None):
+        try:
+            evicted = self.store.put(key, json.dumps(payload), ttl, namespace)
+        except Exception as e:
+            print(f"[LLM cache] Store failed: {e}")
+            self._count('errors')
+            return
+        self._count('stores')
+        self._count('evictions', evicted or 0)
+
+    def clear(self):
+        self.store.clear()
+
+    def hit_rate(self) -> float:
+        lookups = self.stats['hits'] + self.stats['misses']
+        return self.stats['hits'] / lookups if lookups else 0.0
+
+    def _count(self, name: str, amount: int = 1):
+        with self._lock:
+            self.stats[name] += amount
+
+
+_shared_cache = None
+_shared_cache_lock = threading.Lock()
+
+
+def get_response_cache() -> Optional[ResponseCache]:
+    """Process-wide cache for the configured LLM_CACHE_BACKEND (None when disabled)"""
+    global _shared_cache
+    with _shared_cache_lock:
+        if _shared_cache is None and LLM_CACHE_BACKEND != "none":
+            if LLM_CACHE_BACKEND == "sqlite":
+                store = SQLiteStore()
+            elif LLM_CACHE_BACKEND == "postgres":
+                store = PostgresStore()
+            elif LLM_CACHE_BACKEND == "memory":
+                store = MemoryStore()
+            else:
+                raise ValueError(f"Unknown LLM_CACHE_BACKEND: {LLM_CACHE_BACKEND}")
+            _shared_cache = ResponseCache(store)
+        return _shared_cache
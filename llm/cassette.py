@@ -0,0 +1,112 @@
+"""
+PRISM LLM Cassettes
+Record live LLM traffic to a file and replay it offline
+"""
+import hashlib
+import json
+import os
+import threading
+from typing import Dict, Any, List, Optional
+from config.settings import LLM_CASSETTE_MODE, LLM_CASSETTE_PATH
+
+
+class CassetteMiss(LookupError):
+    """A replayed run made a request the cassette has no recording of"""
+
+
+def request_fingerprint(params: Dict[str, Any]) -> str:
+    """Stable hash of Messages API params (model, prompts, limits, tools)"""
+    payload = json.dumps(params, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class Cassette:
+    """
+    JSONL file of recorded LLM exchanges
+
+    In ``record`` mode every response a provider returns is appended (one
+    line per call, flushed immediately, so an interrupted run keeps what
+    it recorded) with its latency and time to first token. In ``replay``
+    mode the file is loaded once and ``lookup`` hands back the recording
+    for a request; a request recorded several times is replayed in the
+    order it was recorded, repeating the last recording after that.
+    """
+
+    def __init__(self, path: str, mode: str):
+        if mode not in ('record', 'replay'):
+            raise ValueError(f"Unknown cassette mode: {mode}")
+        self.path = path
+        self.mode = mode
+        self._lock = threading.Lock()
+        self._entries: Dict[str, List[Dict[str, Any]]] = {}
+        self._served: Dict[str, int] = {}
+        self.stats = {'recorded': 0, 'replayed': 0, 'misses': 0}
+        if mode == 'replay':
+            self._load()
+        elif os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    @property
+    def recording(self) -> bool:
+        return self.mode == 'record'
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            raise ValueError(f"Cassette not found: {self.path} (record one with LLM_CASSETTE_MODE=record)")
+        with open(self.path, encoding='utf-8') as f:
+            for line in f:
+                if line.strip():
+                    entry = json.loads(line)
+                    self._entries.setdefault(entry['key'], []).append(entry)
+        print(f"[LLM] Replaying {sum(len(e) for e in self._entries.values())} recorded calls from {self.path}")
+
+    def record(self, params: Dict[str, Any], response, latency: float):
+        """Append one exchange (``response`` is an LLMResponse)"""
+        entry = {
+            'key': request_fingerprint(params),
+            'provider': response.provider,
+            'model': params.get('model'),
+            'prompt_head': json.dumps(params.get('messages'), default=str)[:200],
+            'response': dict(response.to_cache(), stop_reason=response.stop_reason),
+            'latency': round(latency, 4),
+            'ttft': round(response.ttft, 4) if response.ttft is not None else None,
+        }
+        line = json.dumps(entry, ensure_ascii=False)
+        with self._lock:
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(line + "\n")
+            self.stats['recorded'] += 1
+
+    def lookup(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Recorded exchange for ``params``
+
+        Raises:
+            CassetteMiss: the request was never recorded
+        """
+        key = request_fingerprint(params)
+        with self._lock:
+            entries = self._entries.get(key)
+            if not entries:
+                self.stats['misses'] += 1
+                raise CassetteMiss(f"No recording for request to {params.get('model')} "
+                                   f"({key[:12]}) in {self.path}")
+            served = self._served.get(key, 0)
+            self._served[key] = served + 1
+            self.stats['replayed'] += 1
+            return entries[min(served, len(entries) - 1)]
+
+
+_shared_cassette = None
+_shared_cassette_lock = threading.Lock()
+
+
+def get_cassette() -> Optional[Cassette]:
+    """Process-wide cassette, or None unless LLM_CASSETTE_MODE is set"""
+    global _shared_cassette
+    if not LLM_CASSETTE_MODE:
+        return None
+    with _shared_cassette_lock:
+        if _shared_cassette is None:
+            _shared_cassette = Cassette(LLM_CASSETTE_PATH, LLM_CASSETTE_MODE)
+        return _shared_cassette
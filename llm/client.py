@@ -0,0 +1,421 @@
+"""
+PRISM LLM Client
+Single entry point for model calls made by agents and enrichment scripts
+"""
+import json
+import time
+from typing import Dict, Any, List, Optional, Callable, Tuple
+from config.settings import (
+    CLAUDE_MODEL, MAX_TOKENS, LLM_CACHE_TTL, LLM_CACHE_TTL_BY_AGENT, LLM_CACHE_BYPASS,
+    LLM_PROMPT_CACHING, LLM_AGENT_TASKS, LLM_REPAIR_MODEL, LLM_REPAIR_MAX_TOKENS, AGENT_TIMEOUT
+)
+from llm.cache import cache_key, get_response_cache
+from llm.deadline import deadline
+from llm.hedging import get_hedger
+from llm.metrics import LLM_USAGE
+from llm.providers import get_router
+from llm.rate_limit import get_rate_limiter
+from llm.retry import get_retry_budget
+from llm.single_flight import get_single_flight
+from llm.structured import OutputSchema, StructuredOutputError
+
+REPAIR_PROMPT = """The JSON below was meant to match the {name} schema, but it has these problems:
+{errors}
+
+Return the corrected data. Keep every value that is already valid and change only what the problems require.
+
+JSON:
+{text}"""
+
+
+class LLMResponse:
+    """Text of a model response plus where it came from and what it cost"""
+
+    def __init__(self, text: str, model: str, cached: bool = False, usage: Dict[str, Any] = None):
+        self.text = text
+        self.model = model
+        self.cached = cached
+        self.usage = usage or {}
+        # Filled in by LLMClient for the call that produced this response
+        self.wall_time = None
+        self.ttft = None
+        self.retries = 0
+        self.provider = None
+        self.fallback = False
+        self.stop_reason = None  # "max_tokens" when the output budget ran out
+        self.coalesced = False  # shared another caller's in-flight request (not billed again)
+
+    def to_cache(self) -> Dict[str, Any]:
+        return {'text': self.text, 'model': self.model, 'usage': self.usage}
+
+    @classmethod
+    def from_message(cls, message) -> "LLMResponse":
+        """Build from an anthropic Message (a forced tool call's input becomes the text)"""
+        usage = {
+            'input_tokens': message.usage.input_tokens,
+            'output_tokens': message.usage.output_tokens,
+            # Prompt-cache reads/writes are billed apart from input_tokens
+            'cache_read_input_tokens': getattr(message.usage, 'cache_read_input_tokens', None) or 0,
+            'cache_creation_input_tokens': getattr(message.usage, 'cache_creation_input_tokens', None) or 0,
+        }
+        tool_calls = [block for block in message.content if block.type == "tool_use"]
+        if tool_calls:
+            text = json.dumps(tool_calls[0].input)
+        else:
+            text = "".join(block.text for block in message.content if block.type == "text")
+        response = cls(text, message.model, usage=usage)
+        response.stop_reason = message.stop_reason
+        return response
+
+    @classmethod
+    def from_cache(cls, payload: Dict[str, Any]) -> "LLMResponse":
+        return cls(payload['text'], payload['model'], cached=True, usage=payload.get('usage'))
+
+    def shared_copy(self) -> "LLMResponse":
+        """This response as handed to a caller that waited on the same request"""
+        response = LLMResponse(self.text, self.model, cached=self.cached, usage=self.usage)
+        response.provider = self.provider
+        response.fallback = self.fallback
+        response.stop_reason = self.stop_reason
+        response.coalesced = True
+        return response
+
+
+def is_json_response(text: str) -> bool:
+    """True if the text (optionally inside a markdown fence) parses as JSON"""
+    text = text.strip()
+    if text.startswith("```"):
+        text = text.split("\n", 1)[-1].rsplit("```", 1)[0]
+    try:
+        json.loads(text)
+        return True
+    except ValueError:
+        return False
+
+
+class LLMClient:
+    """
+    Model client used by BaseAgent and the enrichment scripts
+
+    Identical requests (model, system prompt, prompt, temperature,
+    max_tokens) are answered from the shared response cache while their
+    TTL lasts; ``bypass_cache`` forces a fresh call and overwrites the entry.
+
+    Live calls are routed by task (LLM_ROUTES) to a provider in
+    llm/providers.py; Claude calls go through the process-wide
+    RateLimiter, so clients can be used from many threads at once (see
+    llm/executor.py). Identical requests made at the same time (same
+    cache key, any agent) are coalesced: one goes out and the others wait
+    for its response (llm/single_flight.py). With LLM_HEDGING on, a call
+    that is slow to start answering is duplicated and the first answer
+    kept (llm/hedging.py).
+
+    ``prompt_prefix`` is the stable part of a prompt (instructions, output
+    schema) shared by every item of a run. It is sent ahead of the
+    per-item prompt and, with the system prompt, marked for provider-side
+    prompt caching. Prefixes below the model's minimum (1024 tokens for
+    Sonnet) are simply not cached.
+
+    ``complete_json`` asks for an answer matching an OutputSchema (a
+    forced tool for Claude, ``format`` for Ollama), validates it and, if
+    it still does not fit, makes one cheap repair call instead of
+    discarding it.
+
+    Every live call is bounded by AGENT_TIMEOUT seconds and by any
+    enclosing item or run deadline (llm/deadline.py); running out raises
+    DeadlineExceeded.
+    """
+
+    def __init__(self, agent_name: str, cache_ttl: float = None, task: str = None):
+        self.agent_name = agent_name
+        self.task = task or LLM_AGENT_TASKS.get(agent_name, "default")
+        self.router = get_router()
+        self.cache = get_response_cache()
+        self.flights = get_single_flight()
+        self.hedger = get_hedger()
+        if cache_ttl is None:
+            cache_ttl = LLM_CACHE_TTL_BY_AGENT.get(agent_name, LLM_CACHE_TTL)
+        self.cache_ttl = cache_ttl
+
+    def complete(self,
+                 prompt: str,
+                 system_prompt: str = None,
+                 model: str = CLAUDE_MODEL,
+                 max_tokens: int = MAX_TOKENS,
+                 temperature: float = None,
+                 bypass_cache: bool = False,
+                 validate: Callable[[str], bool] = None,
+                 prompt_prefix: str = None,
+                 on_text: Callable[[str], None] = None,
+                 output_schema: OutputSchema = None) -> LLMResponse:
+        """
+        Get a single-turn completion
+
+        Args:
+            prompt: User prompt
+            system_prompt: Optional system prompt
+            model: Model name
+            max_tokens: Output token limit
+            temperature: Sampling temperature (provider default when None)
+            bypass_cache: Skip the cache lookup (the fresh result is still stored)
+            validate: Only cache responses whose text passes this check
+            prompt_prefix: Stable leading part of the prompt, cached provider-side
+            on_text: Called with each text delta as the response streams in (once
+                with the whole text on a cache hit); raising from it aborts the call
+            output_schema: Make the provider answer with JSON of this shape (the
+                response text is then that JSON)
+
+        Returns:
+            LLMResponse with the response text
+        """
+        started = time.monotonic()
+        key = self.request_key(prompt, system_prompt, model, max_tokens, temperature, prompt_prefix, output_schema)
+
+        response = None
+        if not (bypass_cache or LLM_CACHE_BYPASS):
+            response = self.cached_response(key)
+            if response is not None and on_text:
+                on_text(response.text)
+
+        if response is None:
+            params = self.request_params(prompt, system_prompt, model, max_tokens, temperature,
+                                         prompt_prefix, output_schema)
+            aborted = []
+
+            def relay(text):
+                try:
+                    on_text(text)
+                except BaseException:
+                    aborted.append(True)
+                    raise
+
+            def fetch():
+                fresh = self.hedger.complete(params["model"],
+                                             lambda deliver: self.router.complete(self.task, params, deliver),
+                                             relay if on_text else None,
+                                             on_discard=self.record_discarded)
+                # A fallback provider's answer is not what the request asked for; don't keep it
+                if not fresh.fallback:
+                    self.store_response(key, fresh, validate)
+                return fresh
+
+            with deadline(AGENT_TIMEOUT, f"{self.agent_name} LLM call"):
+                # Callers waiting on this request don't inherit an abort raised by our own on_text
+                response, coalesced = self.flights.do(key, fetch, share_error=lambda error: not aborted)
+            if coalesced:
+                response = response.shared_copy()
+                if on_text:
+                    on_text(response.text)
+
+        response.wall_time = time.monotonic() - started
+        self.record_call(response)
+        return response
+
+    def complete_json(self,
+                      prompt: str,
+                      output_schema: OutputSchema,
+                      system_prompt: str = None,
+                      model: str = CLAUDE_MODEL,
+                      max_tokens: int = MAX_TOKENS,
+                      temperature: float = None,
+                      bypass_cache: bool = False,
+                      prompt_prefix: str = None,
+                      on_text: Callable[[str], None] = None) -> Tuple[Any, LLMResponse]:
+        """
+        Get a completion as data matching ``output_schema``
+
+        Only schema-valid answers are cached. An answer that is still
+        invalid after local coercion gets one repair call on the cheap
+        repair model (LLM_REPAIR_MODEL); a successful repair is cached in
+        place of the original answer, so reruns don't pay for it again.
+
+        Returns:
+            (parsed value, LLMResponse of the original call)
+
+        Raises:
+            StructuredOutputError: the answer could not be repaired
+        """
+        request = (prompt, system_prompt, model, max_tokens, temperature, prompt_prefix, output_schema)
+        response = self.complete(prompt, system_prompt=system_prompt, model=model, max_tokens=max_tokens,
+                                 temperature=temperature, bypass_cache=bypass_cache,
+                                 validate=output_schema.accepts, prompt_prefix=prompt_prefix,
+                                 on_text=on_text, output_schema=output_schema)
+        value = self.parse_output(response.text, output_schema)
+        if not response.fallback and not output_schema.accepts(response.text):
+            # Repaired: cache the fixed answer under the original request
+            repaired = LLMResponse(json.dumps(value), response.model, usage=response.usage)
+            self.store_response(self.request_key(*request), repaired)
+        return value, response
+
+    def parse_output(self, text: str, output_schema: OutputSchema) -> Any:
+        """
+        Parse ``text`` into a schema-valid value, repairing it if needed
+
+        Raises:
+            StructuredOutputError: the text could not be repaired
+        """
+        value, errors = self.check_output(text, output_schema)
+        if errors:
+            value, errors = self.repair_output(text, output_schema, errors)
+        if errors:
+            raise StructuredOutputError(
+                f"{output_schema.name}: {len(errors)} schema error(s) after repair: {errors[0]}",
+                text=text, errors=errors
+            )
+        return value
+
+    def check_output(self, text: str, output_schema: OutputSchema) -> Tuple[Any, List[str]]:
+        """Parse and coerce ``text``; returns (value, schema errors)"""
+        try:
+            value = output_schema.parse(text)
+        except ValueError as e:
+            return None, [f"not valid JSON: {e}"]
+        return value, output_schema.errors(value)
+
+    def repair_output(self, text: str, output_schema: OutputSchema, errors: List[str]) -> Tuple[Any, List[str]]:
+        """
+        Ask the repair model to fix the listed problems in ``text``
+
+        Returns (value, remaining errors), like check_output.
+        """
+        print(f"[LLM] {self.agent_name}: repairing {output_schema.name} ({len(errors)} problem(s): {errors[0]})")
+        prompt = REPAIR_PROMPT.format(
+            name=output_schema.name,
+            errors="\n".join(f"- {error}" for error in errors[:20]),
+            text=text
+        )
+        try:
+            response = self.complete(prompt, model=LLM_REPAIR_MODEL, max_tokens=LLM_REPAIR_MAX_TOKENS,
+                                     temperature=0.0, validate=output_schema.accepts,
+                                     output_schema=output_schema)
+        except Exception as e:
+            return None, errors + [f"repair call failed: {e}"]
+        value, remaining = self.check_output(response.text, output_schema)
+        if remaining:
+            print(f"[LLM] {self.agent_name}: repair of {output_schema.name} left {len(remaining)} problem(s)")
+        return value, remaining
+
+    def record_call(self, response: LLMResponse, batch: bool = False):
+        """Add a finished call to the run's usage accounting (llm/metrics.py)"""
+        LLM_USAGE.record(
+            self.agent_name,
+            response.model,
+            response.usage,
+            wall_time=response.wall_time or 0.0,
+            ttft=response.ttft,
+            retries=response.retries,
+            cached=response.cached,
+            coalesced=response.coalesced,
+            batch=batch
+        )
+
+    def record_discarded(self, model: str, usage: Dict[str, Any], wall_time: float):
+        """Add the billed usage of a request whose answer was thrown away (a lost hedge race)"""
+        LLM_USAGE.record(self.agent_name, model, usage, wall_time=wall_time)
+
+    def request_params(self,
+                       prompt: str,
+                       system_prompt: Optional[str],
+                       model: str,
+                       max_tokens: int,
+                       temperature: Optional[float],
+                       prompt_prefix: Optional[str] = None,
+                       output_schema: Optional[OutputSchema] = None) -> Dict[str, Any]:
+        """Messages API parameters for a single-turn request"""
+        cache_control = {"type": "ephemeral"}
+        if prompt_prefix:
+            content = [{"type": "text", "text": prompt_prefix}, {"type": "text", "text": prompt}]
+            if LLM_PROMPT_CACHING:
+                content[0]["cache_control"] = cache_control
+        else:
+            content = prompt
+        params = {
+            "model": model,
+            "max_tokens": max_tokens,
+            "messages": [{"role": "user", "content": content}]
+        }
+        if system_prompt:
+            if LLM_PROMPT_CACHING:
+                params["system"] = [{"type": "text", "text": system_prompt, "cache_control": cache_control}]
+            else:
+                params["system"] = system_prompt
+        if temperature is not None:
+            params["temperature"] = temperature
+        if output_schema is not None:
+            params["tools"] = [output_schema.tool()]
+            params["tool_choice"] = {"type": "tool", "name": output_schema.name}
+        return params
+
+    def request_key(self, prompt, system_prompt, model, max_tokens, temperature, prompt_prefix=None,
+                    output_schema=None) -> str:
+        """Response cache key for a request"""
+        extra = {}
+        if prompt_prefix:
+            extra['prompt_prefix'] = prompt_prefix
+        if output_schema is not None:
+            extra['output_schema'] = output_schema.tool()
+        return cache_key(model, system_prompt, prompt, temperature, max_tokens, **extra)
+
+    def cached_response(self, key: str) -> Optional[LLMResponse]:
+        """Cached response for ``key``, or None on a miss or when caching is off"""
+        if self.cache is None or self.cache_ttl == 0:
+            return None
+        payload = self.cache.get(key)
+        return LLMResponse.from_cache(payload) if payload is not None else None
+
+    def store_response(self, key: str, response: LLMResponse, validate: Callable[[str], bool] = None):
+        """Cache a fresh response if it passes ``validate``"""
+        if self.cache is None or self.cache_ttl == 0:
+            return
+        if validate is None or validate(response.text):
+            self.cache.put(key, response.to_cache(), self.cache_ttl, namespace=self.agent_name)
+
+    def prompt_cache_stats(self) -> Dict[str, Any]:
+        """
+        Cached vs uncached input tokens of this agent's live calls
+
+        ``input_tokens`` from the API excludes cache reads and writes, so the
+        total prompt size is the sum of all three.
+        """
+        totals = {name: LLM_USAGE.agent_totals(self.agent_name).get(name, 0)
+                  for name in ('calls', 'input_tokens', 'cache_read_input_tokens',
+                               'cache_creation_input_tokens', 'output_tokens')}
+        prompt_tokens = (totals['input_tokens'] + totals['cache_read_input_tokens']
+                         + totals['cache_creation_input_tokens'])
+        totals['cached_input_ratio'] = (
+            totals['cache_read_input_tokens'] / prompt_tokens if prompt_tokens else 0.0
+        )
+        return totals
+
+    def cache_stats(self) -> Dict[str, Any]:
+        """Hit/miss counters of the shared response cache"""
+        if self.cache is None:
+            return {}
+        stats = dict(self.cache.stats)
+        stats['hit_rate'] = self.cache.hit_rate()
+        return stats
+
+    def rate_limit_stats(self) -> Dict[str, Any]:
+        """Throttling counters of the shared rate limiter"""
+        return get_rate_limiter().snapshot()
+
+    def retry_stats(self) -> Dict[str, Any]:
+        """First attempts, retries and denied retries against the run's retry budget"""
+        return get_retry_budget().snapshot()
+
+    def coalescing_stats(self) -> Dict[str, Any]:
+        """Requests made vs requests that waited on an identical in-flight one"""
+        return self.flights.snapshot()
+
+    def hedging_stats(self) -> Dict[str, Any]:
+        """Calls hedged, hedges that answered first, and the current hedge delay per model"""
+        return self.hedger.snapshot()
+
+    def provider_stats(self) -> Dict[str, Dict[str, Any]]:
+        """Health, latency and concurrency of the providers used so far"""
+        return self.router.snapshot()
+
+    @property
+    def client(self):
+        """The anthropic SDK client (for APIs outside the router, e.g. batches)"""
+        return self.router.provider("anthropic").client
@@ -0,0 +1,174 @@
+"""
+PRISM Deadlines
+Time budgets for runs, items and calls, with cooperative cancellation
+"""
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Iterator, Optional
+
+
+class DeadlineExceeded(TimeoutError):
+    """The work's time budget ran out, or the work was cancelled"""
+
+    def __init__(self, message: str, cancelled: bool = False):
+        super().__init__(message)
+        self.cancelled = cancelled
+
+
+class Deadline:
+    """
+    Point in time by which a unit of work must finish
+
+    Nested deadlines never extend their parent: a call inside an item
+    inside a run gets whichever of the three ends first. ``cancel`` ends
+    the deadline (and every deadline nested in it) immediately; work
+    notices at its next ``check``, and anything registered with
+    ``on_cancel`` (e.g. closing an open stream) runs right away.
+    """
+
+    def __init__(self, seconds: Optional[float], name: str, parent: "Deadline" = None):
+        self.name = name
+        self.parent = parent
+        self.expires_at = time.monotonic() + seconds if seconds else None
+        self._cancelled = threading.Event()
+        self._callbacks = []
+        self._lock = threading.Lock()
+
+    def cancel(self):
+        self._cancelled.set()
+        with self._lock:
+            callbacks = list(self._callbacks)
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception:
+                pass
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled.is_set() or (self.parent is not None and self.parent.cancelled)
+
+    def remaining(self) -> Optional[float]:
+        """Seconds left (0 once expired or cancelled); None if unbounded"""
+        if self.cancelled:
+            return 0.0
+        own = None if self.expires_at is None else max(0.0, self.expires_at - time.monotonic())
+        inherited = self.parent.remaining() if self.parent is not None else None
+        if own is None or inherited is None:
+            return own if inherited is None else inherited
+        return min(own, inherited)
+
+    @property
+    def expired(self) -> bool:
+        remaining = self.remaining()
+        return remaining is not None and remaining <= 0
+
+    def binding(self) -> "Deadline":
+        """The deadline that ends first along the chain (for error messages)"""
+        deadline, binding = self, self
+        while deadline is not None:
+            if deadline._cancelled.is_set():
+                return deadline
+            if deadline.expires_at is not None and (
+                    binding.expires_at is None or deadline.expires_at < binding.expires_at):
+                binding = deadline
+            deadline = deadline.parent
+        return binding
+
+    def error(self, detail: str = "") -> DeadlineExceeded:
+        """DeadlineExceeded naming the deadline that ended (``detail`` is appended)"""
+        binding = self.binding()
+        message = f"{binding.name} cancelled" if self.cancelled else f"{binding.name} exceeded its time budget"
+        return DeadlineExceeded(f"{message} ({detail})" if detail else message, cancelled=self.cancelled)
+
+    def check(self):
+        """Raise DeadlineExceeded if the deadline has passed or was cancelled"""
+        if self.expired:
+            raise self.error()
+
+
+# A context variable rather than a thread-local so asyncio tasks (database/async_db.py) see it too
+_current: contextvars.ContextVar = contextvars.ContextVar('prism_deadline', default=None)
+
+
+def current_deadline() -> Optional[Deadline]:
+    """Innermost deadline of this thread or task, if any"""
+    return _current.get()
+
+
+@contextmanager
+def deadline(seconds: Optional[float], name: str) -> Iterator[Deadline]:
+    """
+    Run the block under a time budget of ``seconds`` (None or 0: only the enclosing budgets apply)
+
+    Raises DeadlineExceeded on entry if an enclosing budget is already spent.
+    """
+    parent = current_deadline()
+    scope = Deadline(seconds, name, parent)
+    scope.check()
+    token = _current.set(scope)
+    try:
+        yield scope
+    finally:
+        _current.reset(token)
+
+
+@contextmanager
+def on_cancel(callback: Callable[[], None]) -> Iterator[None]:
+    """Call ``callback`` if the current deadline, or one enclosing it, is cancelled during the block"""
+    chain = []
+    scope = current_deadline()
+    while scope is not None:
+        chain.append(scope)
+        scope = scope.parent
+    for scope in chain:
+        with scope._lock:
+            scope._callbacks.append(callback)
+    try:
+        if chain and chain[0].cancelled:
+            callback()
+        yield
+    finally:
+        for scope in chain:
+            with scope._lock:
+                scope._callbacks.remove(callback)
+
+
+def remaining(default: float = None) -> Optional[float]:
+    """Seconds left on the current deadline, capped at ``default``"""
+    scope = current_deadline()
+    left = scope.remaining() if scope is not None else None
+    if left is None:
+        return default
+    return left if default is None else min(left, default)
+
+
+def check_deadline():
+    """Raise DeadlineExceeded if the current deadline has passed or was cancelled"""
+    scope = current_deadline()
+    if scope is not None:
+        scope.check()
+
+
+def bind_deadline(fn: Callable) -> Callable:
+    """Wrap ``fn`` so it runs under the caller's deadline on another thread"""
+    scope = current_deadline()
+    if scope is None:
+        return fn
+
+    def run(*args, **kwargs):
+        token = _current.set(scope)
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            _current.reset(token)
+    return run
+
+
+def pause(seconds: float):
+    """time.sleep that stops at this thread's deadline (then raises DeadlineExceeded)"""
+    left = remaining()
+    time.sleep(seconds if left is None else min(seconds, left))
+    check_deadline()
@@ -0,0 +1,64 @@
+"""
+PRISM LLM Executor
+Bounded thread pool for running many LLM-bound jobs in parallel
+"""
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Callable, Iterable, Iterator, Tuple, Any, Optional
+from config.settings import LLM_MAX_CONCURRENCY
+from llm.deadline import bind_deadline
+
+
+class LLMExecutor:
+    """
+    Runs LLM-bound jobs N at a time
+
+    Concurrency only bounds how many calls are in flight; the shared
+    RateLimiter inside LLMClient still decides when each call may start,
+    so raising ``max_workers`` never pushes past the RPM/TPM budget.
+    Jobs run under the submitting thread's deadline (llm/deadline.py).
+    """
+
+    def __init__(self, max_workers: int = LLM_MAX_CONCURRENCY):
+        self.max_workers = max_workers
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="prism-llm")
+
+    def submit(self, fn: Callable, *args, **kwargs):
+        return self._pool.submit(bind_deadline(fn), *args, **kwargs)
+
+    def imap_unordered(self,
+                       fn: Callable[[Any], Any],
+                       items: Iterable[Any]) -> Iterator[Tuple[Any, Any, Optional[BaseException]]]:
+        """
+        Run ``fn(item)`` for every item, yielding as each one finishes
+
+        Yields:
+            (item, result, error) tuples; exactly one of result/error is set
+        """
+        fn = bind_deadline(fn)
+        futures = {self._pool.submit(fn, item): item for item in items}
+        try:
+            for future in as_completed(futures):
+                item = futures[future]
+                error = future.exception()
+                yield item, (None if error else future.result()), error
+        finally:
+            # Caller stopped early (break, KeyboardInterrupt): drop queued work
+            for future in futures:
+                future.cancel()
+
+    def shutdown(self, wait: bool = True):
+        self._pool.shutdown(wait=wait, cancel_futures=True)
+
+
+_shared_executor = None
+_shared_executor_lock = threading.Lock()
+
+
+def get_executor() -> LLMExecutor:
+    """Process-wide executor shared by agents and enrichment scripts"""
+    global _shared_executor
+    with _shared_executor_lock:
+        if _shared_executor is None:
+            _shared_executor = LLMExecutor()
+        return _shared_executor
@@ -0,0 +1,256 @@
+"""
+PRISM Fake Anthropic Server
+Offline stand-in for the Messages and Message Batches endpoints
+
+Usage:
+    python -m llm.fake_server --port 8765 --batch-delay 5
+    ANTHROPIC_BASE_URL=http://127.0.0.1:8765 python biorad/data_enrichment_agent_final.py --batch
+
+Replies echo the JSON template found in the prompt (the outermost {...}
+block), so prompts that ask for "JSON in this format" get a parseable
+answer with the template's example values. Requests that force a tool
+get a tool call whose input is the smallest value matching its schema.
+Streaming requests get the same reply as server-sent events.
+"""
+import argparse
+import json
+import re
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Any
+from llm.structured import schema_example
+
+
+def fake_reply_text(params: Dict[str, Any]) -> str:
+    """Reply for a Messages API request: the prompt's JSON template, if any"""
+    content = "\n".join(block.get("text", "") for block in _prompt_blocks(params)[-2:])
+    start, end = content.find("{"), content.rfind("}")
+    if start != -1 and end > start:
+        candidate = content[start:end + 1]
+        try:
+            json.loads(candidate)
+            return candidate
+        except ValueError:
+            pass
+    return "OK"
+
+
+_seen_prefixes = set()
+_seen_prefixes_lock = threading.Lock()
+
+
+def _prompt_blocks(params: Dict[str, Any]):
+    system = params.get("system") or []
+    if isinstance(system, str):
+        system = [{"type": "text", "text": system}]
+    content = params["messages"][-1]["content"]
+    if isinstance(content, str):
+        content = [{"type": "text", "text": content}]
+    return list(system) + list(content)
+
+
+def fake_usage(params: Dict[str, Any], text: str) -> Dict[str, int]:
+    """Token usage with prompt caching simulated at the last cache_control block"""
+    blocks = _prompt_blocks(params)
+    marked = [i for i, block in enumerate(blocks) if block.get("cache_control")]
+    cut = marked[-1] + 1 if marked else 0
+    prefix_tokens = sum(len(block.get("text", "")) for block in blocks[:cut]) // 4
+    rest_tokens = sum(len(block.get("text", "")) for block in blocks[cut:]) // 4 + 1
+    usage = {"input_tokens": rest_tokens, "output_tokens": len(text) // 4 + 1,
+             "cache_read_input_tokens": 0, "cache_creation_input_tokens": 0}
+    if prefix_tokens:
+        prefix_key = json.dumps(blocks[:cut], sort_keys=True)
+        with _seen_prefixes_lock:
+            hit = prefix_key in _seen_prefixes
+            _seen_prefixes.add(prefix_key)
+        usage["cache_read_input_tokens" if hit else "cache_creation_input_tokens"] = prefix_tokens
+    return usage
+
+
+def fake_message(params: Dict[str, Any]) -> Dict[str, Any]:
+    forced = (params.get("tool_choice") or {}).get("name")
+    tools = {tool["name"]: tool for tool in params.get("tools") or []}
+    if forced in tools:
+        tool_input = schema_example(tools[forced]["input_schema"])
+        text = json.dumps(tool_input)
+        content = [{"type": "tool_use", "id": f"toolu_fake_{uuid.uuid4().hex[:20]}",
+                    "name": forced, "input": tool_input}]
+        stop_reason = "tool_use"
+    else:
+        text = fake_reply_text(params)
+        content = [{"type": "text", "text": text}]
+        stop_reason = "end_turn"
+    return {
+        "id": f"msg_fake_{uuid.uuid4().hex[:24]}",
+        "type": "message",
+        "role": "assistant",
+        "model": params.get("model", "fake-model"),
+        "content": content,
+        "stop_reason": stop_reason,
+        "stop_sequence": None,
+        "usage": fake_usage(params, text),
+    }
+
+
+def _iso(ts: float) -> str:
+    return datetime.fromtimestamp(ts, tz=timezone.utc).isoformat().replace("+00:00", "Z")
+
+
+class FakeAnthropicState:
+    """Batches held in memory; each one 'ends' batch_delay seconds after creation"""
+
+    def __init__(self, batch_delay: float = 5.0):
+        self.batch_delay = batch_delay
+        self.batches: Dict[str, Dict[str, Any]] = {}
+        self.lock = threading.Lock()
+
+    def create_batch(self, requests) -> Dict[str, Any]:
+        batch_id = f"msgbatch_fake_{uuid.uuid4().hex[:20]}"
+        with self.lock:
+            self.batches[batch_id] = {"created": time.time(), "requests": requests}
+        return batch_id
+
+    def batch_object(self, batch_id: str, base_url: str) -> Dict[str, Any]:
+        batch = self.batches[batch_id]
+        created = batch["created"]
+        ended = time.time() - created >= self.batch_delay
+        total = len(batch["requests"])
+        return {
+            "id": batch_id,
+            "type": "message_batch",
+            "processing_status": "ended" if ended else "in_progress",
+            "request_counts": {
+                "processing": 0 if ended else total,
+                "succeeded": total if ended else 0,
+                "errored": 0,
+                "canceled": 0,
+                "expired": 0,
+            },
+            "created_at": _iso(created),
+            "expires_at": _iso(created + 24 * 3600),
+            "ended_at": _iso(created + self.batch_delay) if ended else None,
+            "cancel_initiated_at": None,
+            "archived_at": None,
+            "results_url": f"{base_url}/v1/messages/batches/{batch_id}/results" if ended else None,
+        }
+
+
+class FakeAnthropicHandler(BaseHTTPRequestHandler):
+    state: FakeAnthropicState = None
+
+    def log_message(self, format, *args):
+        print(f"[Fake Anthropic] {self.command} {self.path}")
+
+    def _send_json(self, payload: Dict[str, Any], status: int = 200):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_stream(self, message: Dict[str, Any], chunk_chars: int = 200):
+        """Send a message as Messages API server-sent events"""
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.end_headers()
+
+        def event(name: str, payload: Dict[str, Any]):
+            self.wfile.write(f"event: {name}\ndata: {json.dumps(dict(payload, type=name))}\n\n".encode("utf-8"))
+            self.wfile.flush()
+
+        block = message["content"][0]
+        usage = message["usage"]
+        event("message_start", {"message": dict(message, content=[], stop_reason=None,
+                                                usage=dict(usage, output_tokens=1))})
+        if block["type"] == "tool_use":
+            text = json.dumps(block["input"])
+            event("content_block_start", {"index": 0, "content_block": dict(block, input={})})
+            delta = lambda chunk: {"type": "input_json_delta", "partial_json": chunk}
+        else:
+            text = block["text"]
+            event("content_block_start", {"index": 0, "content_block": {"type": "text", "text": ""}})
+            delta = lambda chunk: {"type": "text_delta", "text": chunk}
+        for start in range(0, len(text), chunk_chars):
+            event("content_block_delta", {"index": 0, "delta": delta(text[start:start + chunk_chars])})
+        event("content_block_stop", {"index": 0})
+        event("message_delta", {"delta": {"stop_reason": message["stop_reason"], "stop_sequence": None},
+                                "usage": {"output_tokens": usage["output_tokens"]}})
+        event("message_stop", {})
+
+    def _not_found(self):
+        self._send_json({"type": "error", "error": {"type": "not_found_error", "message": self.path}}, 404)
+
+    def _base_url(self) -> str:
+        return f"http://{self.headers.get('Host')}"
+
+    def _read_json(self) -> Dict[str, Any]:
+        length = int(self.headers.get("Content-Length", 0))
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    def do_POST(self):
+        path = self.path.split("?")[0]
+        if path == "/v1/messages":
+            params = self._read_json()
+            if params.get("stream"):
+                self._send_stream(fake_message(params))
+            else:
+                self._send_json(fake_message(params))
+        elif path == "/v1/messages/batches":
+            batch_id = self.state.create_batch(self._read_json()["requests"])
+            self._send_json(self.state.batch_object(batch_id, self._base_url()))
+        else:
+            self._not_found()
+
+    def do_GET(self):
+        path = self.path.split("?")[0]
+        match = re.fullmatch(r"/v1/messages/batches/([\w-]+)(/results)?", path)
+        if not match or match.group(1) not in self.state.batches:
+            return self._not_found()
+
+        batch_id = match.group(1)
+        if not match.group(2):
+            return self._send_json(self.state.batch_object(batch_id, self._base_url()))
+
+        # Results: one JSON line per request, written as they are produced
+        self.send_response(200)
+        self.send_header("Content-Type", "application/binary")
+        self.end_headers()
+        for request in self.state.batches[batch_id]["requests"]:
+            line = {
+                "custom_id": request["custom_id"],
+                "result": {"type": "succeeded", "message": fake_message(request["params"])},
+            }
+            self.wfile.write(json.dumps(line).encode("utf-8") + b"\n")
+            self.wfile.flush()
+
+
+def serve(host: str = "127.0.0.1", port: int = 8765, batch_delay: float = 5.0) -> ThreadingHTTPServer:
+    """Start the fake server on a background thread and return it"""
+    handler = type("Handler", (FakeAnthropicHandler,), {"state": FakeAnthropicState(batch_delay)})
+    server = ThreadingHTTPServer((host, port), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Fake Anthropic Messages/Batches server')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--batch-delay', type=float, default=5.0, help='Seconds before a batch ends')
+    args = parser.parse_args()
+
+    server = serve(args.host, args.port, args.batch_delay)
+    print(f"[Fake Anthropic] Listening on http://{args.host}:{server.server_address[1]}")
+    print(f"   export ANTHROPIC_BASE_URL=http://{args.host}:{server.server_address[1]}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,251 @@
+"""
+PRISM Hedged Requests
+Duplicate a call that is slower than usual to start answering; keep whichever answers first
+"""
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Dict, Optional
+from config.settings import (
+    LLM_HEDGING, LLM_HEDGE_PERCENTILE, LLM_HEDGE_MIN_SAMPLES, LLM_HEDGE_MIN_DELAY, LLM_HEDGE_MAX_RATIO
+)
+from llm.deadline import DeadlineExceeded, bind_deadline, check_deadline, deadline, remaining
+from llm.rate_limit import get_rate_limiter
+
+# Time-to-first-token samples kept per model
+HEDGE_WINDOW = 200
+
+
+class _Race:
+    """A call's primary attempt and, once fired, its hedge; the first to produce text wins"""
+
+    def __init__(self, on_text: Callable[[str], None] = None, on_discard: Callable[..., None] = None):
+        self.on_text = on_text
+        self.on_discard = on_discard
+        self.lock = threading.Lock()
+        self.winner = None
+        self.scopes = {}
+        self.first_token = {}
+        self.hedge_started = False
+        self.hedge_done = threading.Event()
+        self.hedge_result = None
+        self.hedge_error = None
+
+    def join(self, name: str, scope) -> bool:
+        """Register an attempt's deadline so the winner can cancel it; False if already decided"""
+        with self.lock:
+            if self.winner is not None:
+                return False
+            self.scopes[name] = scope
+            return True
+
+    def claim(self, name: str) -> bool:
+        """Make ``name`` the winner unless another attempt got there first; True if it won"""
+        with self.lock:
+            losers = []
+            if self.winner is None:
+                self.winner = name
+                losers = [scope for other, scope in self.scopes.items() if other != name]
+        for scope in losers:
+            # Closes the loser's stream (llm/deadline.py on_cancel)
+            scope.cancel()
+        return self.winner == name
+
+    def relay(self, name: str, started: float) -> Callable[[str], None]:
+        """Streaming callback for one attempt: only the winner's text reaches the caller"""
+        def deliver(text):
+            if name not in self.first_token:
+                self.first_token[name] = time.monotonic() - started
+            if not self.claim(name):
+                raise DeadlineExceeded(f"{name} request lost the hedge race", cancelled=True)
+            if self.on_text:
+                self.on_text(text)
+        return deliver
+
+    def discard(self, model: str, outcome, started: float):
+        """Account for an attempt whose answer is thrown away: its tokens were still billed"""
+        usage = getattr(outcome, 'usage', None)
+        if usage and self.on_discard:
+            self.on_discard(getattr(outcome, 'model', None) or model, usage, time.monotonic() - started)
+
+
+class Hedger:
+    """
+    Sends a second copy of a call that has produced no text after the
+    usual time to first token
+
+    The delay is the LLM_HEDGE_PERCENTILE of recent first-token times for
+    the model (none until LLM_HEDGE_MIN_SAMPLES calls have been seen, and
+    never under LLM_HEDGE_MIN_DELAY). The first attempt to stream text wins
+    and the other is cancelled, closing its connection; the caller's
+    ``on_text`` only ever sees the winner's text. If the primary attempt
+    fails before producing anything, a hedge in flight gets to answer.
+    The discarded attempt was still billed: its usage (what was streamed
+    before it was cancelled, or its whole answer) goes to ``on_discard``.
+
+    At most LLM_HEDGE_MAX_RATIO of calls are hedged, and none while the
+    rate limiter is throttling: extra load is the last thing a slow or
+    overloaded provider needs.
+    """
+
+    def __init__(self,
+                 enabled: bool = LLM_HEDGING,
+                 percentile: float = LLM_HEDGE_PERCENTILE,
+                 min_samples: int = LLM_HEDGE_MIN_SAMPLES,
+                 min_delay: float = LLM_HEDGE_MIN_DELAY,
+                 max_ratio: float = LLM_HEDGE_MAX_RATIO):
+        self.enabled = enabled
+        self.percentile = percentile
+        self.min_samples = min_samples
+        self.min_delay = min_delay
+        self.max_ratio = max_ratio
+        self._lock = threading.Lock()
+        self._samples: Dict[str, deque] = {}
+        self.stats = {'calls': 0, 'hedged': 0, 'hedge_won': 0, 'hedge_lost': 0,
+                      'skipped_budget': 0, 'skipped_throttled': 0}
+
+    def hedge_delay(self, model: str) -> Optional[float]:
+        """Seconds without a first token before ``model`` calls are hedged; None until enough samples"""
+        with self._lock:
+            samples = sorted(self._samples.get(model, ()))
+        if len(samples) < self.min_samples:
+            return None
+        observed = samples[min(len(samples) - 1, int(self.percentile * len(samples)))]
+        return max(self.min_delay, observed)
+
+    def complete(self,
+                 model: str,
+                 attempt: Callable[[Callable[[str], None]], Any],
+                 on_text: Callable[[str], None] = None,
+                 on_discard: Callable[[str, Dict[str, Any], float], None] = None) -> Any:
+        """
+        Run ``attempt``, hedging it if it is slow to start answering
+
+        Args:
+            model: Model asked (first-token times are tracked per model)
+            attempt: Makes one request; called with the streaming callback to use
+            on_text: The caller's streaming callback
+            on_discard: Called with (model, usage, seconds) for the attempt that lost
+
+        Returns:
+            The winning attempt's response
+        """
+        if not self.enabled:
+            return attempt(on_text)
+        with self._lock:
+            self.stats['calls'] += 1
+
+        race = _Race(on_text, on_discard)
+        timer = None
+        delay = self.hedge_delay(model)
+        if delay is not None:
+            # Bound here, so the hedge runs under this call's deadline rather than the timer thread's
+            hedge = bind_deadline(lambda: self._run_hedge(model, race, attempt))
+            timer = threading.Timer(delay, self._fire, (race, hedge))
+            timer.daemon = True
+            timer.start()
+
+        started = time.monotonic()
+        response, error = None, None
+        try:
+            with deadline(None, f"{model} request") as scope:
+                if race.join('primary', scope):
+                    response = attempt(race.relay('primary', started))
+                    race.claim('primary')
+        except Exception as e:
+            error = e
+        finally:
+            if timer is not None:
+                timer.cancel()
+            with race.lock:
+                if race.winner is None and not race.hedge_started:
+                    race.winner = 'primary'
+        self._observe(model, race, 'primary', started)
+
+        if race.winner == 'primary':
+            self._count(race, won=False)
+            if error is not None:
+                raise error
+            return response
+
+        # The hedge won, or the primary failed before either produced text
+        race.discard(model, response if response is not None else error, started)
+        if not race.hedge_done.wait(remaining()):
+            check_deadline()
+        self._count(race, won=race.hedge_result is not None)
+        if race.hedge_result is not None:
+            return race.hedge_result
+        if error is None or getattr(error, 'cancelled', False):
+            # The primary was only cancelled for the hedge: the hedge's own failure is the real one
+            error = race.hedge_error or error
+        raise error
+
+    def _count(self, race: _Race, won: bool):
+        if race.hedge_started:
+            with self._lock:
+                self.stats['hedge_won' if won else 'hedge_lost'] += 1
+
+    def _fire(self, race: _Race, hedge: Callable[[], None]):
+        with race.lock:
+            if race.winner is not None:
+                return
+            with self._lock:
+                if self.stats['hedged'] >= self.max_ratio * self.stats['calls']:
+                    self.stats['skipped_budget'] += 1
+                    return
+                if get_rate_limiter().throttling():
+                    self.stats['skipped_throttled'] += 1
+                    return
+                self.stats['hedged'] += 1
+            race.hedge_started = True
+        threading.Thread(target=hedge, name="llm-hedge", daemon=True).start()
+
+    def _run_hedge(self, model: str, race: _Race, attempt: Callable[[Callable[[str], None]], Any]):
+        started = time.monotonic()
+        try:
+            with deadline(None, f"hedged {model} request") as scope:
+                if race.join('hedge', scope):
+                    result = attempt(race.relay('hedge', started))
+                    if race.claim('hedge'):
+                        race.hedge_result = result
+                    else:
+                        race.discard(model, result, started)
+        except Exception as e:
+            race.hedge_error = e
+            race.discard(model, e, started)
+        finally:
+            self._observe(model, race, 'hedge', started)
+            race.hedge_done.set()
+
+    def _observe(self, model: str, race: _Race, name: str, started: float):
+        """Record an attempt's time to first token"""
+        sample = race.first_token.get(name)
+        if sample is None and race.winner not in (None, name):
+            # Cancelled before its first token: that time is a lower bound, still worth keeping
+            # so the percentile does not drift down to the winners' times
+            sample = time.monotonic() - started
+        if sample is None:
+            return
+        with self._lock:
+            self._samples.setdefault(model, deque(maxlen=HEDGE_WINDOW)).append(sample)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self.stats)
+            models = list(self._samples)
+        stats['delays'] = {model: self.hedge_delay(model) for model in models}
+        stats['hedge_rate'] = stats['hedged'] / stats['calls'] if stats['calls'] else 0.0
+        return stats
+
+
+_shared_hedger = None
+_shared_hedger_lock = threading.Lock()
+
+
+def get_hedger() -> Hedger:
+    """Process-wide hedger shared by every LLMClient"""
+    global _shared_hedger
+    with _shared_hedger_lock:
+        if _shared_hedger is None:
+            _shared_hedger = Hedger()
+        return _shared_hedger
@@ -0,0 +1,125 @@
+"""
+PRISM Incremental JSON Parsing
+Pull completed array elements out of a model response while it streams
+"""
+import json
+from typing import Any, List
+
+
+class StreamAborted(Exception):
+    """The streamed response is not the JSON asked for; stop reading it"""
+
+    def __init__(self, message: str, text: str = "", items: List[Any] = None):
+        super().__init__(message)
+        self.text = text
+        self.items = items or []
+
+
+class JSONArrayStream:
+    """
+    Incremental parser for a response holding one JSON array
+
+    ``feed`` takes text deltas and returns the elements of the top-level
+    array completed so far, so callers can act on them before the
+    response ends. Leading prose or a markdown fence is skipped; a
+    top-level object is returned as a single element once it closes.
+
+    With ``nested=True`` the elements come from the first array directly
+    inside a top-level object instead, e.g. ``{"alternatives": [...]}``
+    as produced by a forced tool call.
+
+    Raises StreamAborted as soon as the text cannot be the expected JSON:
+    too much text before the first bracket, an element that does not
+    parse, or mismatched brackets.
+    """
+
+    def __init__(self, max_preamble: int = 500, nested: bool = False):
+        self.max_preamble = max_preamble
+        self.nested = nested
+        self._item_level = ["{", "["] if nested else ["["]
+        self._array_done = False
+        self.text = ""
+        self.items: List[Any] = []
+        self.done = False
+        self._pos = 0
+        self._start = None          # offset of the top-level value
+        self._stack = []            # open brackets
+        self._in_string = False
+        self._escape = False
+        self._item_start = None     # offset of the current array element
+
+    def feed(self, chunk: str) -> List[Any]:
+        """Add a text delta; returns the elements it completed"""
+        self.text += chunk
+        completed = []
+        text = self.text
+        while self._pos < len(text) and not self.done:
+            char = text[self._pos]
+            if self._start is None:
+                if char in "[{":
+                    self._start = self._pos
+                    self._stack.append(char)
+                elif self._pos >= self.max_preamble:
+                    self._abort(f"no JSON after {self.max_preamble} characters")
+                self._pos += 1
+                continue
+
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == "\\":
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+                self._pos += 1
+                continue
+
+            at_items = self._stack == self._item_level and not self._array_done
+            if self._item_start is None and at_items and not char.isspace() and char not in ",]":
+                self._item_start = self._pos
+
+            if char == '"':
+                self._in_string = True
+            elif char in "[{":
+                self._stack.append(char)
+            elif char in "]}":
+                if not self._stack or "[{"["]}".index(char)] != self._stack[-1]:
+                    self._abort(f"unexpected '{char}' at offset {self._pos}")
+                if at_items:
+                    self._emit(completed, self._pos)
+                    self._array_done = True
+                self._stack.pop()
+                if not self._stack:
+                    self.done = True
+                    if text[self._start] == "{" and not self.nested:
+                        self._emit_value(completed, text[self._start:self._pos + 1])
+            elif char == "," and at_items:
+                self._emit(completed, self._pos)
+            self._pos += 1
+        return completed
+
+    def close(self) -> List[Any]:
+        """Check the response ended with the top-level value closed"""
+        if self._start is None:
+            self._abort("response contained no JSON")
+        if not self.done:
+            self._abort(f"response ended inside the JSON value (truncated after {len(self.items)} elements)")
+        return self.items
+
+    def _emit(self, completed: List[Any], end: int):
+        if self._item_start is None:
+            return
+        raw = self.text[self._item_start:end]
+        self._item_start = None
+        self._emit_value(completed, raw)
+
+    def _emit_value(self, completed: List[Any], raw: str):
+        try:
+            value = json.loads(raw)
+        except json.JSONDecodeError as e:
+            self._abort(f"malformed element: {e}")
+        self.items.append(value)
+        completed.append(value)
+
+    def _abort(self, reason: str):
+        raise StreamAborted(reason, text=self.text, items=list(self.items))
@@ -0,0 +1,252 @@
+"""
+PRISM LLM Usage Accounting
+Per-call token, latency and cost figures aggregated per agent and per run
+"""
+import atexit
+import json
+import random
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Dict, Any, List, Optional, Tuple
+from config.settings import LLM_PRICING_PER_MTOK, LLM_USAGE_REPORT_PATH
+
+TOKEN_FIELDS = ('input_tokens', 'cache_read_input_tokens', 'cache_creation_input_tokens', 'output_tokens')
+
+# Price multipliers relative to the model's base input price
+CACHE_READ_MULTIPLIER = 0.1
+CACHE_WRITE_MULTIPLIER = 1.25
+BATCH_MULTIPLIER = 0.5
+
+# Latency samples kept per agent for the percentiles (a uniform reservoir over the run)
+LATENCY_SAMPLES = 1000
+
+
+def estimate_cost(model: str, usage: Dict[str, Any], batch: bool = False) -> float:
+    """Dollar cost of one call's usage (0 for models without a price entry)"""
+    prices = LLM_PRICING_PER_MTOK.get(model)
+    if not prices:
+        return 0.0
+    input_price, output_price = prices['input'], prices['output']
+    cost = (
+        usage.get('input_tokens', 0) * input_price
+        + usage.get('cache_read_input_tokens', 0) * input_price * CACHE_READ_MULTIPLIER
+        + usage.get('cache_creation_input_tokens', 0) * input_price * CACHE_WRITE_MULTIPLIER
+        + usage.get('output_tokens', 0) * output_price
+    ) / 1_000_000
+    return cost * BATCH_MULTIPLIER if batch else cost
+
+
+def _sample(samples: List[float], value: float, seen: int):
+    """Reservoir-sample ``value``, the ``seen``-th observation, into ``samples``"""
+    if len(samples) < LATENCY_SAMPLES:
+        samples.append(value)
+        return
+    slot = random.randrange(seen)
+    if slot < LATENCY_SAMPLES:
+        samples[slot] = value
+
+
+def _percentile(samples: List[float], fraction: float) -> Optional[float]:
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+class UsageScope:
+    """Totals of the LLM calls made by one thread while the scope is open"""
+
+    def __init__(self):
+        self.started = time.monotonic()
+        self.ended = None
+        self.calls = 0
+        self.cost_usd = 0.0
+        self.llm_time = 0.0
+        self.retries = 0
+        self.ttfts: List[float] = []
+        self.models: Dict[str, int] = {}
+        self.tokens = dict.fromkeys(TOKEN_FIELDS, 0)
+
+    @property
+    def tokens_used(self) -> int:
+        """Every token billed in the scope (input incl. cache reads/writes, plus output)"""
+        return sum(self.tokens.values())
+
+    @property
+    def ttft_seconds(self) -> Optional[float]:
+        """Mean time to first token of the scope's live calls (None if none streamed)"""
+        return round(sum(self.ttfts) / len(self.ttfts), 3) if self.ttfts else None
+
+    @property
+    def processing_time_seconds(self) -> float:
+        end = self.ended if self.ended is not None else time.monotonic()
+        return round(end - self.started, 3)
+
+
+class UsageTracker:
+    """
+    Run-wide LLM accounting
+
+    LLMClient records every call here (cache hits included, with zero
+    billed tokens). Figures are kept per agent; ``scope`` additionally
+    collects the calls behind a single analysis so they can be stored with it.
+    """
+
+    def __init__(self):
+        self.run_id = uuid.uuid4().hex[:12]
+        self.started = time.time()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._agents: Dict[str, Dict[str, Any]] = {}
+
+    def record(self,
+               agent_name: str,
+               model: str,
+               usage: Dict[str, Any],
+               wall_time: float,
+               ttft: float = None,
+               retries: int = 0,
+               cached: bool = False,
+               coalesced: bool = False,
+               batch: bool = False):
+        """Record one completed call (``coalesced``: shared another caller's request)"""
+        billed = {} if cached or coalesced else usage
+        cost = estimate_cost(model, billed, batch=batch)
+        with self._lock:
+            entry = self._agents.get(agent_name)
+            if entry is None:
+                entry = self._agents[agent_name] = {
+                    'calls': 0,
+                    'cache_hits': 0,
+                    'coalesced': 0,
+                    'retries': 0,
+                    'cost_usd': 0.0,
+                    'wall_time_total': 0.0,
+                    'wall_times': [],
+                    'ttfts': [],
+                    'ttft_calls': 0,
+                    'models': {},
+                    **dict.fromkeys(TOKEN_FIELDS, 0),
+                }
+            entry['calls'] += 1
+            entry['cache_hits'] += int(cached)
+            entry['coalesced'] += int(coalesced)
+            entry['retries'] += retries
+            entry['cost_usd'] += cost
+            entry['wall_time_total'] += wall_time
+            _sample(entry['wall_times'], wall_time, entry['calls'])
+            if ttft is not None:
+                entry['ttft_calls'] += 1
+                _sample(entry['ttfts'], ttft, entry['ttft_calls'])
+            entry['models'][model] = entry['models'].get(model, 0) + 1
+            for name in TOKEN_FIELDS:
+                entry[name] += billed.get(name, 0)
+
+        for scope in getattr(self._local, 'scopes', ()):
+            scope.calls += 1
+            scope.cost_usd += cost
+            scope.llm_time += wall_time
+            scope.retries += retries
+            scope.models[model] = scope.models.get(model, 0) + 1
+            if ttft is not None:
+                scope.ttfts.append(ttft)
+            for name in TOKEN_FIELDS:
+                scope.tokens[name] += billed.get(name, 0)
+
+    @contextmanager
+    def scope(self):
+        """Collect the calls this thread makes until the block exits"""
+        scope = UsageScope()
+        scopes = getattr(self._local, 'scopes', None)
+        if scopes is None:
+            scopes = self._local.scopes = []
+        scopes.append(scope)
+        try:
+            yield scope
+        finally:
+            scope.ended = time.monotonic()
+            scopes.remove(scope)
+
+    def spend(self) -> Tuple[int, float]:
+        """Billed tokens and dollars recorded so far (cheaper than ``snapshot``)"""
+        with self._lock:
+            tokens = sum(entry[name] for entry in self._agents.values() for name in TOKEN_FIELDS)
+            cost = sum(entry['cost_usd'] for entry in self._agents.values())
+        return tokens, cost
+
+    def agent_totals(self, agent_name: str) -> Dict[str, Any]:
+        return self.snapshot()['agents'].get(agent_name, {})
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Per-agent figures plus run totals"""
+        with self._lock:
+            agents = {name: dict(entry, models=dict(entry['models']),
+                                 wall_times=list(entry['wall_times']), ttfts=list(entry['ttfts']))
+                      for name, entry in self._agents.items()}
+        totals = {'calls': 0, 'cache_hits': 0, 'coalesced': 0, 'retries': 0, 'cost_usd': 0.0,
+                  'wall_time_total': 0.0, **dict.fromkeys(TOKEN_FIELDS, 0)}
+        for entry in agents.values():
+            wall_times = entry.pop('wall_times')
+            ttfts = entry.pop('ttfts')
+            entry.pop('ttft_calls')
+            entry['wall_time_p50'] = _percentile(wall_times, 0.50)
+            entry['wall_time_p95'] = _percentile(wall_times, 0.95)
+            entry['ttft_p50'] = _percentile(ttfts, 0.50)
+            entry['ttft_p95'] = _percentile(ttfts, 0.95)
+            for name in totals:
+                totals[name] += entry[name]
+        return {
+            'run_id': self.run_id,
+            'started': self.started,
+            'elapsed_seconds': round(time.time() - self.started, 3),
+            'agents': agents,
+            'totals': totals,
+        }
+
+    def summary(self) -> str:
+        """Text table of calls, tokens, latency and cost per agent"""
+        snapshot = self.snapshot()
+        if not snapshot['agents']:
+            return "No LLM calls recorded"
+
+        def seconds(value):
+            return f"{value:.2f}" if value is not None else "-"
+
+        lines = [
+            f"{'calls':>6} {'cached':>6} {'dedup':>5} {'retry':>5} {'input':>9} {'cache rd':>9} {'cache wr':>9} "
+            f"{'output':>8} {'p50 s':>6} {'p95 s':>6} {'ttft50':>6} {'cost $':>8}  agent"
+        ]
+        rows = sorted(snapshot['agents'].items(), key=lambda item: item[1]['cost_usd'], reverse=True)
+        for name, entry in rows:
+            lines.append(
+                f"{entry['calls']:>6} {entry['cache_hits']:>6} {entry['coalesced']:>5} {entry['retries']:>5} "
+                f"{entry['input_tokens']:>9} {entry['cache_read_input_tokens']:>9} "
+                f"{entry['cache_creation_input_tokens']:>9} {entry['output_tokens']:>8} "
+                f"{seconds(entry['wall_time_p50']):>6} {seconds(entry['wall_time_p95']):>6} "
+                f"{seconds(entry['ttft_p50']):>6} {entry['cost_usd']:>8.4f}  {name}"
+            )
+        totals = snapshot['totals']
+        lines.append(
+            f"Run {snapshot['run_id']}: {totals['calls']} calls ({totals['coalesced']} deduplicated), "
+            f"{sum(totals[name] for name in TOKEN_FIELDS):,} tokens, "
+            f"${totals['cost_usd']:.4f}, {snapshot['elapsed_seconds']:.1f}s elapsed"
+        )
+        return "\n".join(lines)
+
+    def write_report(self, path: str):
+        """Write the snapshot as JSON"""
+        with open(path, 'w') as f:
+            json.dump(self.snapshot(), f, indent=2)
+
+
+LLM_USAGE = UsageTracker()
+
+
+def _write_report_at_exit():
+    if LLM_USAGE_REPORT_PATH and LLM_USAGE.snapshot()['agents']:
+        LLM_USAGE.write_report(LLM_USAGE_REPORT_PATH)
+
+
+atexit.register(_write_report_at_exit)
@@ -0,0 +1,212 @@
+"""
+PRISM Prompt Packing
+Answer several independent items with one request sharing the instructions
+"""
+import json
+import threading
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, wait
+from typing import Dict, Any, Iterable, Iterator, List, Optional, Tuple
+from config.settings import CLAUDE_MODEL, MAX_TOKENS, LLM_PACK_OUTPUT_TOKENS, LLM_PACK_MAX_ITEMS
+from llm.client import LLMClient, LLMResponse
+from llm.executor import LLMExecutor, get_executor
+from llm.structured import OutputSchema
+
+PACK_PROMPT = """The {count} items below are independent. Answer each one exactly as the instructions above ask for a single item, and return one entry per item in "items", copying the item's id.
+
+{items}"""
+
+# Share of the output budget a pack is planned to use; the rest absorbs variance
+PACK_HEADROOM = 0.8
+
+
+def packed_schema(output_schema: OutputSchema) -> OutputSchema:
+    """Schema for a list of ``output_schema`` answers, each tagged with its item id"""
+    item = output_schema.schema
+    tagged = dict(item,
+                  properties=dict(item.get('properties', {}), id={"type": "string"}),
+                  required=["id"] + list(item.get('required', [])))
+    return OutputSchema(f"{output_schema.name}_list", {
+        "type": "object",
+        "properties": {"items": {"type": "array", "items": tagged}},
+        "required": ["items"]
+    }, f"{output_schema.description} for each item")
+
+
+class PromptPacker:
+    """
+    Sends K items per request instead of one
+
+    The instructions (``prompt_prefix``) are paid for once per pack rather
+    than once per item. K is sized so the expected output of a pack fits
+    ``output_budget``, using the output tokens per item observed so far,
+    and shrinks when a pack is cut off by the token limit.
+
+    Every item keeps its single-request cache key: items already cached are
+    answered without a call, and packed answers are cached per item. An
+    item that is missing from a pack's answer or fails validation is
+    re-queued on its own through LLMClient.complete_json (with its repair
+    step), so one bad entry never costs the rest of the pack.
+    """
+
+    def __init__(self,
+                 llm: LLMClient,
+                 output_schema: OutputSchema,
+                 prompt_prefix: str = None,
+                 system_prompt: str = None,
+                 model: str = CLAUDE_MODEL,
+                 max_tokens_per_item: int = MAX_TOKENS,
+                 temperature: float = None,
+                 output_budget: int = LLM_PACK_OUTPUT_TOKENS,
+                 max_items: int = LLM_PACK_MAX_ITEMS,
+                 executor: LLMExecutor = None):
+        self.llm = llm
+        self.output_schema = output_schema
+        self.packed_schema = packed_schema(output_schema)
+        self.prompt_prefix = prompt_prefix
+        self.system_prompt = system_prompt
+        self.model = model
+        self.max_tokens_per_item = max_tokens_per_item
+        self.temperature = temperature
+        self.output_budget = output_budget
+        self.max_items = max_items
+        self.executor = executor or get_executor()
+        self._lock = threading.Lock()
+        # Output tokens per item; until a pack has been seen, assume half the per-item limit
+        self.tokens_per_item = max_tokens_per_item / 2
+        self.stats = {'packs': 0, 'packed_items': 0, 'single_requests': 0, 'requeued': 0,
+                      'truncated_packs': 0, 'cache_hits': 0}
+
+    def pack_size(self) -> int:
+        """Items per request for the current output-token estimate"""
+        with self._lock:
+            estimate = self.tokens_per_item
+        return max(1, min(self.max_items, int(self.output_budget * PACK_HEADROOM / estimate)))
+
+    def item_key(self, prompt: str) -> str:
+        """Cache key of an item asked on its own"""
+        return self.llm.request_key(prompt, self.system_prompt, self.model, self.max_tokens_per_item,
+                                    self.temperature, self.prompt_prefix, self.output_schema)
+
+    def run(self, items: Iterable[Tuple[str, str]]) -> Iterator[Tuple[str, Any, Optional[BaseException]]]:
+        """
+        Answer every (item_id, prompt) pair
+
+        Yields:
+            (item_id, value, error) as answers arrive; exactly one of
+            value/error is set. Values are valid for ``output_schema``.
+        """
+        pending = deque()
+        for item_id, prompt in items:
+            cached = self.llm.cached_response(self.item_key(prompt))
+            if cached is not None:
+                self.stats['cache_hits'] += 1
+                yield item_id, self.output_schema.parse(cached.text), None
+            else:
+                pending.append((item_id, prompt))
+
+        singles = deque()
+        in_flight = {}
+        try:
+            while pending or singles or in_flight:
+                while (pending or singles) and len(in_flight) < self.executor.max_workers:
+                    if singles:
+                        pack = [singles.popleft()]
+                    else:
+                        size = self.pack_size()
+                        pack = [pending.popleft() for _ in range(min(size, len(pending)))]
+                    run = self._run_pack if len(pack) > 1 else self._run_single
+                    in_flight[self.executor.submit(run, pack)] = pack
+
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    pack = in_flight.pop(future)
+                    error = future.exception()
+                    if error is not None:
+                        if len(pack) > 1:
+                            # The whole pack failed (provider error): try its items alone
+                            self.stats['requeued'] += len(pack)
+                            singles.extend(pack)
+                        else:
+                            yield pack[0][0], None, error
+                        continue
+                    answered, failed = future.result()
+                    for item_id, value in answered:
+                        yield item_id, value, None
+                    self.stats['requeued'] += len(failed)
+                    singles.extend(failed)
+        finally:
+            for future in in_flight:
+                future.cancel()
+
+    def pack_prompt(self, pack: List[Tuple[str, str]]) -> str:
+        """One prompt holding every item of ``pack``, each tagged with its id"""
+        items = "\n\n".join(f'<item id="{item_id}">\n{prompt.strip()}\n</item>' for item_id, prompt in pack)
+        return PACK_PROMPT.format(count=len(pack), items=items)
+
+    def _run_single(self, pack: List[Tuple[str, str]]):
+        item_id, prompt = pack[0]
+        with self._lock:
+            self.stats['single_requests'] += 1
+        value, _ = self.llm.complete_json(
+            prompt,
+            self.output_schema,
+            system_prompt=self.system_prompt,
+            model=self.model,
+            max_tokens=self.max_tokens_per_item,
+            temperature=self.temperature,
+            prompt_prefix=self.prompt_prefix
+        )
+        return [(item_id, value)], []
+
+    def _run_pack(self, pack: List[Tuple[str, str]]):
+        max_tokens = min(self.output_budget, self.max_tokens_per_item * len(pack))
+        response = self.llm.complete(
+            self.pack_prompt(pack),
+            system_prompt=self.system_prompt,
+            model=self.model,
+            max_tokens=max_tokens,
+            temperature=self.temperature,
+            # A pack is never asked twice; its items are cached one by one below
+            bypass_cache=True,
+            validate=lambda text: False,
+            prompt_prefix=self.prompt_prefix,
+            output_schema=self.packed_schema
+        )
+        try:
+            entries = self.packed_schema.parse(response.text).get('items', [])
+        except (ValueError, AttributeError):
+            entries = []
+        by_id: Dict[str, Dict[str, Any]] = {
+            str(entry['id']): entry for entry in entries if isinstance(entry, dict) and 'id' in entry
+        }
+
+        answered, failed = [], []
+        for item_id, prompt in pack:
+            entry = by_id.get(item_id)
+            value = {name: field for name, field in entry.items() if name != 'id'} if entry else None
+            if value is None or self.output_schema.errors(value):
+                failed.append((item_id, prompt))
+                continue
+            answered.append((item_id, value))
+            self.llm.store_response(self.item_key(prompt), LLMResponse(json.dumps(value), response.model))
+
+        self._observe(response, len(pack), len(by_id))
+        if failed:
+            print(f"[LLM] {self.llm.agent_name}: pack of {len(pack)} answered {len(answered)}, "
+                  f"re-queuing {len(failed)} alone")
+        return answered, failed
+
+    def _observe(self, response: LLMResponse, pack_size: int, entries: int):
+        """Update the output-tokens-per-item estimate that sizes the next packs"""
+        output_tokens = response.usage.get('output_tokens', 0)
+        with self._lock:
+            self.stats['packs'] += 1
+            self.stats['packed_items'] += pack_size
+            if response.stop_reason == "max_tokens":
+                # Cut off: the pack was too big for the budget, whatever the average said
+                self.stats['truncated_packs'] += 1
+                self.tokens_per_item = max(self.tokens_per_item * 2, output_tokens / max(entries, 1))
+            elif entries and output_tokens:
+                observed = output_tokens / entries
+                self.tokens_per_item = 0.7 * self.tokens_per_item + 0.3 * observed
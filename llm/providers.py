@@ -0,0 +1,564 @@
+"""
+PRISM LLM Providers
+Anthropic, Ollama and fake backends behind one interface, with routing
+"""
+import inspect
+import json
+import threading
+import time
+from typing import Dict, Any, Callable, List, Optional
+import anthropic
+import requests
+from config.settings import (
+    ANTHROPIC_API_KEY, CLAUDE_MODEL, OLLAMA_URL, OLLAMA_MODEL, OLLAMA_NUM_CTX, AGENT_TIMEOUT,
+    LLM_PROVIDER_CONCURRENCY, LLM_ROUTES, LLM_PROVIDER,
+    LLM_PROVIDER_FAILURE_THRESHOLD, LLM_PROVIDER_COOLDOWN, LLM_CASSETTE_MODE, LLM_REPLAY_LATENCY
+)
+from llm.cassette import CassetteMiss, get_cassette
+from llm.deadline import DeadlineExceeded, check_deadline, current_deadline, on_cancel, pause, remaining
+from llm.rate_limit import estimate_tokens, get_rate_limiter, retry_after_seconds
+from llm.retry import FATAL, RATE_LIMITED, RETRYABLE, RetryPolicy
+
+
+class ProviderError(Exception):
+    """A provider could not produce a response (the router may fail over)"""
+
+
+class NoProviderAvailable(ProviderError):
+    """Every provider on a task's route is unhealthy, unconfigured or failed"""
+
+
+# Failures that say nothing about the request itself: count against the
+# provider's health and let the router try the next provider
+TRANSIENT_ERRORS = (
+    ProviderError,
+    anthropic.APIConnectionError,
+    anthropic.RateLimitError,
+    anthropic.InternalServerError,
+)
+
+
+def prompt_text(params: Dict[str, Any]) -> str:
+    """Flatten the user content of Messages API params to plain text"""
+    content = params["messages"][-1]["content"]
+    if isinstance(content, str):
+        return content
+    return "\n\n".join(block.get("text", "") for block in content)
+
+
+def system_text(params: Dict[str, Any]) -> Optional[str]:
+    system = params.get("system")
+    if isinstance(system, list):
+        return "\n\n".join(block.get("text", "") for block in system)
+    return system
+
+
+class Provider:
+    """
+    Base class for LLM backends
+
+    ``complete`` takes Messages API style params (see
+    LLMClient.request_params) and returns an LLMResponse; ``on_text``, if
+    given, receives the response text as it is generated (in one piece for
+    providers that do not stream) and may raise to stop it. Subclasses
+    implement ``_complete``; the base class bounds concurrency and keeps
+    health (consecutive failures open a cooldown during which the router
+    skips the provider) and a latency average. With LLM_CASSETTE_MODE=record
+    every response is also written to the cassette (llm/cassette.py).
+
+    Errors ``classify`` marks as retryable are retried on the same provider
+    (llm/retry.py) before the router sees them; nothing is retried once
+    part of the answer has reached ``on_text``.
+
+    Calls run under the caller's deadline (llm/deadline.py): waiting for a
+    slot, the rate limiter and the request itself all stop when it ends,
+    with DeadlineExceeded. A call that uses up its own AGENT_TIMEOUT
+    budget counts as a provider failure.
+    """
+
+    name = "provider"
+
+    def __init__(self, max_concurrency: int = None):
+        self.max_concurrency = max_concurrency or LLM_PROVIDER_CONCURRENCY.get(self.name, 4)
+        self._slots = threading.BoundedSemaphore(self.max_concurrency)
+        self._lock = threading.Lock()
+        self.consecutive_failures = 0
+        self.unhealthy_until = 0.0
+        self.latency_ewma = None
+        self.retry = RetryPolicy(self.name, self.classify)
+        self.stats = {'calls': 0, 'failures': 0, 'in_flight': 0}
+
+    def available(self) -> bool:
+        """True if the provider is configured at all"""
+        return True
+
+    def healthy(self) -> bool:
+        return time.monotonic() >= self.unhealthy_until
+
+    def default_model(self) -> str:
+        raise NotImplementedError
+
+    def owns_model(self, model: str) -> bool:
+        """Whether ``model`` names one of this provider's models"""
+        raise NotImplementedError
+
+    def classify(self, error: BaseException) -> str:
+        """RETRYABLE, RATE_LIMITED or FATAL for an error from ``_complete``"""
+        return FATAL
+
+    def retry_after(self, error: BaseException, kind: str) -> Optional[float]:
+        """Called before a retry; returns the server's retry-after if it sent one"""
+        return None
+
+    def complete(self, params: Dict[str, Any], on_text: Callable[[str], None] = None):
+        requested = params
+        if not self.owns_model(params["model"]):
+            params = dict(params, model=self.default_model())
+        check_deadline()
+        if not self._slots.acquire(timeout=remaining()):
+            check_deadline()
+            raise DeadlineExceeded(f"{self.name}: no free slot before the deadline")
+        try:
+            with self._lock:
+                self.stats['in_flight'] += 1
+            started = time.monotonic()
+            delivered = []
+
+            def relay(text):
+                delivered.append(len(text))
+                on_text(text)
+
+            def classify(error):
+                # The caller has seen part of this answer; a retry would repeat it
+                return FATAL if delivered else self.classify(error)
+
+            try:
+                response, retries = self.retry.call(lambda: self._complete(params, relay if on_text else None),
+                                                    on_retry=self.retry_after, classify=classify)
+            except TRANSIENT_ERRORS as e:
+                scope = current_deadline()
+                if scope is not None and scope.expired:
+                    # A client-side timeout cut at the deadline: don't let the router fail over
+                    self._record_timeout(scope)
+                    raise scope.error(f"{self.name}: {e}") from e
+                self._record_failure()
+                raise
+            except DeadlineExceeded:
+                self._record_timeout(current_deadline())
+                raise
+            finally:
+                with self._lock:
+                    self.stats['in_flight'] -= 1
+            elapsed = time.monotonic() - started
+            self._record_success(elapsed)
+        finally:
+            self._slots.release()
+        response.provider = self.name
+        response.retries = retries
+        cassette = get_cassette()
+        if cassette is not None and cassette.recording:
+            # Keyed by the request as asked, so replay matches it before any model remapping
+            cassette.record(requested, response, elapsed)
+        return response
+
+    def _complete(self, params: Dict[str, Any], on_text: Callable[[str], None] = None):
+        raise NotImplementedError
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self.stats)
+        stats.update({
+            'healthy': self.healthy(),
+            'consecutive_failures': self.consecutive_failures,
+            'latency_ewma': self.latency_ewma,
+            'max_concurrency': self.max_concurrency,
+        })
+        return stats
+
+    def _record_success(self, elapsed: float):
+        with self._lock:
+            self.stats['calls'] += 1
+            self.consecutive_failures = 0
+            self.latency_ewma = elapsed if self.latency_ewma is None else 0.8 * self.latency_ewma + 0.2 * elapsed
+
+    def _record_timeout(self, scope):
+        # Only the call's own budget running out says the provider is slow;
+        # an item or run budget ending mid-call (or a cancel) does not
+        if scope is None or scope.cancelled:
+            return
+        own = scope
+        while own is not None and own.expires_at is None:
+            # Scopes without a budget of their own (a hedged attempt's) run on the call's
+            own = own.parent
+        if own is not None and scope.binding() is own:
+            self._record_failure()
+
+    def _record_failure(self):
+        with self._lock:
+            self.stats['calls'] += 1
+            self.stats['failures'] += 1
+            self.consecutive_failures += 1
+            if self.consecutive_failures >= LLM_PROVIDER_FAILURE_THRESHOLD:
+                self.unhealthy_until = time.monotonic() + LLM_PROVIDER_COOLDOWN
+                print(f"[LLM] Provider {self.name} marked unhealthy for {LLM_PROVIDER_COOLDOWN:.0f}s "
+                      f"after {self.consecutive_failures} failures")
+
+
+class AnthropicProvider(Provider):
+    """Claude via the Messages API, paced by the shared RateLimiter"""
+
+    name = "anthropic"
+
+    # The SDKs in requirements.txt (anthropic>=0.39) take temperature as a keyword;
+    # 1.x releases dropped it, though the API still reads the field
+    TEMPERATURE_KEYWORD = "temperature" in inspect.signature(anthropic.resources.messages.Messages.stream).parameters
+
+    def __init__(self, max_concurrency: int = None):
+        super().__init__(max_concurrency)
+        self._client = None
+        self.limiter = get_rate_limiter()
+
+    @property
+    def client(self) -> anthropic.Anthropic:
+        if self._client is None:
+            if not ANTHROPIC_API_KEY:
+                raise ValueError("ANTHROPIC_API_KEY environment variable is required")
+            # Retries are ours: the limiter has to see every 429 to adapt
+            self._client = anthropic.Anthropic(api_key=ANTHROPIC_API_KEY, max_retries=0)
+        return self._client
+
+    def available(self) -> bool:
+        return bool(ANTHROPIC_API_KEY)
+
+    def default_model(self) -> str:
+        return CLAUDE_MODEL
+
+    def owns_model(self, model: str) -> bool:
+        return model.startswith("claude")
+
+    def _complete(self, params: Dict[str, Any], on_text: Callable[[str], None] = None):
+        from llm.client import LLMResponse
+
+        # Reserve the prompt plus a share of the output budget; the bucket is
+        # reconciled with the real usage once the response arrives
+        estimated = estimate_tokens(system_text(params), prompt_text(params)) + min(params["max_tokens"], 1024)
+        if not self.limiter.acquire(estimated, timeout=remaining()):
+            check_deadline()
+            raise DeadlineExceeded("anthropic: rate limiter would not admit the call before the deadline")
+        kwargs = dict(params)
+        if "temperature" in kwargs and not self.TEMPERATURE_KEYWORD:
+            kwargs["extra_body"] = {"temperature": kwargs.pop("temperature")}
+        try:
+            message, ttft = self._stream_message(kwargs, on_text)
+        except Exception as e:
+            self.limiter.record_usage(estimated, 0)
+            if self.classify(e) == RATE_LIMITED:
+                # Pause every caller and slow the shared rate, so retries don't add to the overload
+                self.limiter.backoff(retry_after_seconds(e))
+            raise
+
+        self.limiter.record_usage(estimated, message.usage.input_tokens + message.usage.output_tokens)
+        response = LLMResponse.from_message(message)
+        response.ttft = ttft
+        return response
+
+    def classify(self, error: BaseException) -> str:
+        status = getattr(error, "status_code", None)
+        if status in (429, 529):
+            return RATE_LIMITED
+        if isinstance(error, anthropic.APIConnectionError) or status in (408, 409) or (status or 0) >= 500:
+            # Connection drops and client timeouts (APITimeoutError), conflicts, other 5xx
+            return RETRYABLE
+        return FATAL
+
+    def retry_after(self, error: BaseException, kind: str) -> Optional[float]:
+        return retry_after_seconds(error) if kind == RATE_LIMITED else None
+
+    def _stream_message(self, kwargs: Dict[str, Any], on_text: Callable[[str], None] = None):
+        """Run a request as a stream; returns the final message and time to first token"""
+        started = time.monotonic()
+        ttft = None
+        # Leaving the block early (on_text or the deadline raising) closes the connection;
+        # cancelling the deadline closes it at once, even while waiting for the next event
+        with self.client.messages.stream(**kwargs, timeout=remaining(AGENT_TIMEOUT or None)) as stream, \
+                on_cancel(stream.close):
+            try:
+                for event in stream:
+                    check_deadline()
+                    if event.type == "content_block_delta":
+                        if ttft is None:
+                            ttft = time.monotonic() - started
+                        if on_text and event.delta.type == "text_delta":
+                            on_text(event.delta.text)
+                        elif on_text and event.delta.type == "input_json_delta":
+                            # Forced tool call (output schema): its input is the answer
+                            on_text(event.delta.partial_json)
+                message = stream.get_final_message()
+            except Exception:
+                # A read failing because the stream was closed under us is a cancellation;
+                # the tokens billed so far go with it (llm/hedging.py records a lost race's)
+                try:
+                    check_deadline()
+                except DeadlineExceeded as e:
+                    e.usage = self._billed_so_far(stream)
+                    raise
+                raise
+        return message, ttft
+
+    @staticmethod
+    def _billed_so_far(stream) -> Dict[str, int]:
+        """Usage of a stream ended early: the input as reported at its start, plus any output counted"""
+        try:
+            usage = stream.current_message_snapshot.usage
+        except Exception:
+            # Nothing received yet
+            return {}
+        return {
+            'input_tokens': usage.input_tokens or 0,
+            'output_tokens': usage.output_tokens or 0,
+            'cache_read_input_tokens': getattr(usage, 'cache_read_input_tokens', None) or 0,
+            'cache_creation_input_tokens': getattr(usage, 'cache_creation_input_tokens', None) or 0,
+        }
+
+
+class OllamaProvider(Provider):
+    """Local model served by Ollama (/api/generate)"""
+
+    name = "ollama"
+
+    def __init__(self, url: str = OLLAMA_URL, model: str = OLLAMA_MODEL, max_concurrency: int = None):
+        super().__init__(max_concurrency)
+        self.url = url.rstrip("/")
+        self.model = model
+
+    def default_model(self) -> str:
+        return self.model
+
+    def owns_model(self, model: str) -> bool:
+        return not model.startswith("claude")
+
+    def _complete(self, params: Dict[str, Any], on_text: Callable[[str], None] = None):
+        from llm.client import LLMResponse
+
+        payload = {
+            "model": params["model"],
+            "prompt": prompt_text(params),
+            "stream": False,
+            "options": {"num_predict": params["max_tokens"], "num_ctx": OLLAMA_NUM_CTX},
+        }
+        system = system_text(params)
+        if system:
+            payload["system"] = system
+        if params.get("tools"):
+            # Ollama constrains generation to a JSON schema through "format"
+            payload["format"] = params["tools"][0]["input_schema"]
+        if "temperature" in params:
+            payload["options"]["temperature"] = params["temperature"]
+
+        started = time.monotonic()
+        try:
+            reply = requests.post(f"{self.url}/api/generate", json=payload, timeout=remaining(AGENT_TIMEOUT or None))
+            reply.raise_for_status()
+            result = reply.json()
+        except (requests.exceptions.RequestException, ValueError) as e:
+            raise ProviderError(f"Ollama API error: {e}") from e
+
+        usage = {
+            'input_tokens': result.get('prompt_eval_count', 0),
+            'output_tokens': result.get('eval_count', 0),
+        }
+        response = LLMResponse(result.get('response', ''), result.get('model', params["model"]), usage=usage)
+        response.stop_reason = "max_tokens" if result.get('done_reason') == "length" else result.get('done_reason')
+        # Non-streaming: the first token arrives with the whole reply
+        response.ttft = time.monotonic() - started
+        if on_text:
+            on_text(response.text)
+        return response
+
+    def classify(self, error: BaseException) -> str:
+        cause = error.__cause__
+        if isinstance(cause, requests.exceptions.ConnectionError) and not isinstance(cause, requests.exceptions.Timeout):
+            # Nothing listening: fail over now rather than wait for the server to come back
+            return FATAL
+        if isinstance(cause, requests.exceptions.HTTPError):
+            status = cause.response.status_code if cause.response is not None else 500
+            return RETRYABLE if status >= 500 else FATAL
+        return RETRYABLE if isinstance(error, ProviderError) else FATAL
+
+
+class FakeProvider(Provider):
+    """Deterministic offline backend: echoes the prompt's JSON template (see llm/fake_server.py)"""
+
+    name = "fake"
+
+    def default_model(self) -> str:
+        return "fake-model"
+
+    def owns_model(self, model: str) -> bool:
+        return True
+
+    def _complete(self, params: Dict[str, Any], on_text: Callable[[str], None] = None):
+        from llm.client import LLMResponse
+        from llm.fake_server import fake_message
+
+        message = fake_message(params)
+        block = message["content"][0]
+        text = block["text"] if block["type"] == "text" else json.dumps(block["input"])
+        response = LLMResponse(text, message["model"], usage=message["usage"])
+        response.stop_reason = message["stop_reason"]
+        response.ttft = 0.0
+        if on_text:
+            on_text(response.text)
+        return response
+
+
+class ReplayProvider(Provider):
+    """
+    Serves responses recorded in the cassette (LLM_CASSETTE_MODE=replay)
+
+    Each call sleeps for its recorded latency, or LLM_REPLAY_LATENCY
+    seconds if that is a number, so end-to-end timings of a replayed run
+    are comparable to the live one. Streaming callers get the text in
+    chunks spread between the recorded first token and the end. A request
+    that was never recorded fails like any provider error, so callers
+    handle it the way they would a live outage.
+    """
+
+    name = "replay"
+    STREAM_CHUNKS = 20
+
+    def __init__(self, max_concurrency: int = None):
+        super().__init__(max_concurrency)
+        self.cassette = get_cassette()
+
+    def default_model(self) -> str:
+        return CLAUDE_MODEL
+
+    def owns_model(self, model: str) -> bool:
+        return True
+
+    def _complete(self, params: Dict[str, Any], on_text: Callable[[str], None] = None):
+        from llm.client import LLMResponse
+
+        try:
+            entry = self.cassette.lookup(params)
+        except CassetteMiss as e:
+            raise ProviderError(str(e)) from e
+        recorded = entry['response']
+        response = LLMResponse(recorded['text'], recorded['model'], usage=recorded.get('usage'))
+        response.stop_reason = recorded.get('stop_reason')
+
+        latency = entry['latency'] if LLM_REPLAY_LATENCY == "recorded" else float(LLM_REPLAY_LATENCY)
+        ttft = entry.get('ttft')
+        ttft = min(ttft, latency) if ttft is not None and LLM_REPLAY_LATENCY == "recorded" else latency
+        pause(ttft)
+        response.ttft = ttft
+        if on_text:
+            text = response.text
+            size = max(1, -(-len(text) // self.STREAM_CHUNKS))
+            chunks = [text[i:i + size] for i in range(0, len(text), size)] or [""]
+            gap = (latency - ttft) / len(chunks)
+            for chunk in chunks:
+                on_text(chunk)
+                pause(gap)
+        else:
+            pause(latency - ttft)
+        return response
+
+    def snapshot(self) -> Dict[str, Any]:
+        stats = super().snapshot()
+        stats['cassette'] = dict(self.cassette.stats)
+        return stats
+
+
+PROVIDER_CLASSES = {
+    "anthropic": AnthropicProvider,
+    "ollama": OllamaProvider,
+    "fake": FakeProvider,
+    "replay": ReplayProvider,
+}
+
+
+class ProviderRouter:
+    """
+    Sends each request to the first healthy provider on its task's route
+
+    Routes come from LLM_ROUTES (task -> ordered provider names, best
+    first); LLM_PROVIDER forces every task onto a single provider, as does
+    LLM_CASSETTE_MODE=replay (onto the cassette). A
+    provider that errors is skipped for the rest of the request and,
+    after repeated failures, for a cooldown.
+    """
+
+    def __init__(self, routes: Dict[str, List[str]] = None, force: str = LLM_PROVIDER):
+        self.routes = routes or LLM_ROUTES
+        self.force = "replay" if LLM_CASSETTE_MODE == "replay" else force
+        self.providers: Dict[str, Provider] = {}
+        self._lock = threading.Lock()
+
+    def provider(self, name: str) -> Provider:
+        with self._lock:
+            if name not in self.providers:
+                if name not in PROVIDER_CLASSES:
+                    raise ValueError(f"Unknown LLM provider: {name}")
+                self.providers[name] = PROVIDER_CLASSES[name]()
+            return self.providers[name]
+
+    def route(self, task: str) -> List[str]:
+        if self.force:
+            return [self.force]
+        return self.routes.get(task) or self.routes["default"]
+
+    def complete(self, task: str, params: Dict[str, Any], on_text: Callable[[str], None] = None):
+        """Run ``params`` on the best available provider for ``task`` (see Provider.complete)"""
+        delivered = []
+        if on_text:
+            def relay(text):
+                delivered.append(len(text))
+                on_text(text)
+        else:
+            relay = None
+
+        errors = []
+        candidates = [self.provider(name) for name in self.route(task)]
+        configured = [p for p in candidates if p.available()]
+        usable = [p for p in configured if p.healthy()]
+        if not usable:
+            # Everything is cooling down: try the configured ones anyway
+            usable = configured
+
+        for provider in usable:
+            try:
+                response = provider.complete(params, relay)
+                # A stand-in for a configured provider that failed or is cooling down is a
+                # fallback (not cached under the request); route entries that aren't set up don't count
+                response.fallback = provider is not configured[0]
+                return response
+            except TRANSIENT_ERRORS as e:
+                if delivered:
+                    # The caller has seen part of this answer; another one can't continue it
+                    raise
+                errors.append(f"{provider.name}: {e}")
+                print(f"[LLM] {task}: provider {provider.name} failed ({e})")
+
+        raise NoProviderAvailable(
+            f"No provider could serve task '{task}' (route {self.route(task)}): " + "; ".join(errors)
+        )
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            providers = dict(self.providers)
+        return {name: provider.snapshot() for name, provider in providers.items()}
+
+
+_shared_router = None
+_shared_router_lock = threading.Lock()
+
+
+def get_router() -> ProviderRouter:
+    """Process-wide router shared by every LLMClient"""
+    global _shared_router
+    with _shared_router_lock:
+        if _shared_router is None:
+            _shared_router = ProviderRouter()
+        return _shared_router
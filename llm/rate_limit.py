@@ -0,0 +1,164 @@
+"""
+PRISM LLM Rate Limiting
+Token buckets for requests/minute and tokens/minute with adaptive backoff
+"""
+import threading
+import time
+from typing import Dict, Any, Optional
+from config.settings import LLM_REQUESTS_PER_MINUTE, LLM_TOKENS_PER_MINUTE
+
+
+def estimate_tokens(*texts: Optional[str]) -> int:
+    """Cheap token estimate (~4 characters per token)"""
+    return sum(len(text) for text in texts if text) // 4 + 1
+
+
+class TokenBucket:
+    """Classic token bucket; capacity is one minute's allowance"""
+
+    def __init__(self, per_minute: float):
+        self.per_minute = per_minute
+        self.capacity = per_minute
+        self.tokens = per_minute
+        self.updated = time.monotonic()
+
+    def refill(self, now: float):
+        elapsed = now - self.updated
+        self.tokens = min(self.capacity, self.tokens + elapsed * self.per_minute / 60)
+        self.updated = now
+
+    def wait_time(self, amount: float) -> float:
+        """Seconds until ``amount`` is available (0 if available now)"""
+        # A single request larger than the bucket only needs a full bucket
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) * 60 / self.per_minute
+
+
+class RateLimiter:
+    """
+    Shared limiter for every LLM call in the process
+
+    ``acquire`` blocks until both the request bucket and the token bucket
+    can cover the call. On a 429/overloaded response, ``backoff`` pauses
+    every caller for the server's retry-after and cuts the effective rate;
+    the rate recovers gradually as calls succeed again.
+    """
+
+    MIN_RATE_FACTOR = 0.2
+    RECOVERY_STEP = 0.05
+
+    def __init__(self,
+                 requests_per_minute: float = LLM_REQUESTS_PER_MINUTE,
+                 tokens_per_minute: float = LLM_TOKENS_PER_MINUTE):
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self.base_rpm = requests_per_minute
+        self.base_tpm = tokens_per_minute
+        self.rate_factor = 1.0
+        self.paused_until = 0.0
+        self._cond = threading.Condition()
+        self.stats = {
+            'acquired': 0,
+            'throttled': 0,
+            'wait_time_total': 0.0,
+            'rate_limited_responses': 0,
+        }
+
+    def acquire(self, estimated_tokens: int = 1, timeout: float = None) -> bool:
+        """
+        Block until a call of ``estimated_tokens`` may start
+
+        Returns False, without taking anything, if that would take longer
+        than ``timeout`` seconds.
+        """
+        started = time.monotonic()
+        throttled = False
+        with self._cond:
+            while True:
+                now = time.monotonic()
+                self.requests.refill(now)
+                self.tokens.refill(now)
+                wait = max(
+                    self.paused_until - now,
+                    self.requests.wait_time(1),
+                    self.tokens.wait_time(estimated_tokens),
+                )
+                if wait <= 0:
+                    break
+                if timeout is not None and now + wait > started + timeout:
+                    return False
+                throttled = True
+                self._cond.wait(wait)
+
+            self.requests.tokens -= 1
+            self.tokens.tokens -= min(estimated_tokens, self.tokens.capacity)
+            self.stats['acquired'] += 1
+            if throttled:
+                self.stats['throttled'] += 1
+            self.stats['wait_time_total'] += time.monotonic() - started
+        return True
+
+    def record_usage(self, estimated_tokens: int, actual_tokens: int):
+        """Reconcile the token bucket with the tokens a call really used"""
+        with self._cond:
+            self.tokens.tokens -= actual_tokens - estimated_tokens
+            self._recover()
+            self._cond.notify_all()
+
+    def backoff(self, retry_after: Optional[float] = None):
+        """Pause all callers after a 429/529 and lower the sustained rate"""
+        with self._cond:
+            self.stats['rate_limited_responses'] += 1
+            delay = retry_after if retry_after is not None else 60 / max(self.requests.per_minute, 1)
+            self.paused_until = max(self.paused_until, time.monotonic() + delay)
+            self._set_rate_factor(max(self.MIN_RATE_FACTOR, self.rate_factor * 0.5))
+
+    def throttling(self) -> bool:
+        """True while callers are paused or the rate is cut after 429/529s"""
+        with self._cond:
+            return self.rate_factor < 1.0 or time.monotonic() < self.paused_until
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._cond:
+            stats = dict(self.stats)
+            stats['requests_per_minute'] = self.requests.per_minute
+            stats['tokens_per_minute'] = self.tokens.per_minute
+            stats['rate_factor'] = self.rate_factor
+        return stats
+
+    def _recover(self):
+        if self.rate_factor < 1.0:
+            self._set_rate_factor(min(1.0, self.rate_factor + self.RECOVERY_STEP))
+
+    def _set_rate_factor(self, factor: float):
+        self.rate_factor = factor
+        self.requests.per_minute = self.base_rpm * factor
+        self.tokens.per_minute = self.base_tpm * factor
+
+
+def retry_after_seconds(error: Exception) -> Optional[float]:
+    """Read a retry-after header off an API error, if it has one"""
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+    value = headers.get("retry-after")
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
+
+
+_shared_limiter = None
+_shared_limiter_lock = threading.Lock()
+
+
+def get_rate_limiter() -> RateLimiter:
+    """Process-wide limiter shared by every LLMClient"""
+    global _shared_limiter
+    with _shared_limiter_lock:
+        if _shared_limiter is None:
+            _shared_limiter = RateLimiter()
+        return _shared_limiter
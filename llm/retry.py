@@ -0,0 +1,151 @@
+"""
+PRISM Retry Policy
+Classified retries with jittered exponential backoff and a per-run retry budget
+"""
+import random
+import threading
+from typing import Any, Callable, Dict, Optional, Tuple
+from config.settings import (
+    MAX_RETRIES, LLM_RATE_LIMIT_RETRIES, RETRY_BASE_DELAY, RETRY_MAX_DELAY,
+    RETRY_BUDGET_RATIO, RETRY_BUDGET_MIN
+)
+from llm.deadline import pause, remaining
+
+# Error classes returned by a policy's classifier
+RETRYABLE = "retryable"        # transient: connection drop, 5xx, deadlock
+RATE_LIMITED = "rate_limited"  # 429 / 529 overloaded: back off and retry, paced by the rate limiter
+FATAL = "fatal"                # the request itself is wrong, or the time budget is gone
+
+
+class RetryBudget:
+    """
+    Caps retries across the whole run
+
+    At most ``minimum`` retries plus ``ratio`` of the first attempts made so
+    far, so a widespread outage turns into fast failures instead of every
+    call retrying and multiplying the load on a struggling service.
+    """
+
+    def __init__(self, ratio: float = RETRY_BUDGET_RATIO, minimum: int = RETRY_BUDGET_MIN):
+        self.ratio = ratio
+        self.minimum = minimum
+        self._lock = threading.Lock()
+        self.stats = {'attempts': 0, 'retries': 0, 'denied': 0}
+
+    def record_attempt(self):
+        with self._lock:
+            self.stats['attempts'] += 1
+
+    def try_spend(self) -> bool:
+        """Take one retry from the budget; False if it is used up"""
+        with self._lock:
+            if self.stats['retries'] >= self.minimum + self.ratio * self.stats['attempts']:
+                self.stats['denied'] += 1
+                return False
+            self.stats['retries'] += 1
+            return True
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self.stats)
+        stats['allowance'] = int(self.minimum + self.ratio * stats['attempts'])
+        return stats
+
+
+class RetryPolicy:
+    """
+    Runs a call, retrying the errors ``classify`` marks as retryable
+
+    Delays grow exponentially from ``base_delay`` up to ``max_delay`` with
+    full jitter, so callers that failed together do not retry together; a
+    server-provided retry-after is respected as a floor. A retry is only
+    made if the RetryBudget allows it (by default the current run's, see
+    start_retry_budget) and the current deadline (llm/deadline.py) leaves
+    room for the wait.
+    """
+
+    def __init__(self,
+                 name: str,
+                 classify: Callable[[BaseException], str],
+                 max_retries: int = MAX_RETRIES,
+                 rate_limit_retries: int = LLM_RATE_LIMIT_RETRIES,
+                 base_delay: float = RETRY_BASE_DELAY,
+                 max_delay: float = RETRY_MAX_DELAY,
+                 budget: RetryBudget = None):
+        self.name = name
+        self.classify = classify
+        self.limits = {RETRYABLE: max_retries, RATE_LIMITED: rate_limit_retries}
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._budget = budget
+
+    @property
+    def budget(self) -> RetryBudget:
+        # Looked up per call: policies outlive runs, budgets don't
+        return self._budget or get_retry_budget()
+
+    def delay(self, retry: int, retry_after: float = None) -> float:
+        """Seconds to wait before retry number ``retry`` (1-based)"""
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (retry - 1)))
+        return max(delay, retry_after or 0.0)
+
+    def call(self,
+             fn: Callable[[], Any],
+             on_retry: Callable[[BaseException, str], Optional[float]] = None,
+             classify: Callable[[BaseException], str] = None) -> Tuple[Any, int]:
+        """
+        Run ``fn`` until it succeeds or fails for good
+
+        Args:
+            fn: The call to make
+            on_retry: Called with (error, kind) before each wait; may
+                return a server retry-after in seconds
+            classify: Classifier for this call only (defaults to the policy's)
+
+        Returns:
+            (result, number of retries made)
+        """
+        classify = classify or self.classify
+        budget = self.budget
+        budget.record_attempt()
+        retries = {RETRYABLE: 0, RATE_LIMITED: 0}
+        while True:
+            try:
+                return fn(), sum(retries.values())
+            except Exception as e:
+                kind = classify(e)
+                if kind == FATAL or retries[kind] >= self.limits[kind]:
+                    raise
+                retries[kind] += 1
+                retry_after = on_retry(e, kind) if on_retry else None
+                wait = self.delay(retries[kind], retry_after)
+                left = remaining()
+                if left is not None and wait >= left:
+                    raise
+                if not budget.try_spend():
+                    print(f"[Retry] {self.name}: retry budget for this run is used up, not retrying ({e})")
+                    raise
+                print(f"[Retry] {self.name}: {kind.replace('_', ' ')} ({type(e).__name__}: {str(e)[:120]}), "
+                      f"retry {retries[kind]}/{self.limits[kind]} in {wait:.1f}s")
+                pause(wait)
+
+
+_shared_budget = None
+_shared_budget_lock = threading.Lock()
+
+
+def get_retry_budget() -> RetryBudget:
+    """Retry budget of the current run, shared by LLM and database retries"""
+    global _shared_budget
+    with _shared_budget_lock:
+        if _shared_budget is None:
+            _shared_budget = RetryBudget()
+        return _shared_budget
+
+
+def start_retry_budget() -> RetryBudget:
+    """Give a new run a fresh retry budget (without one, the process counts as one run)"""
+    global _shared_budget
+    with _shared_budget_lock:
+        _shared_budget = RetryBudget()
+        return _shared_budget
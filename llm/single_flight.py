@@ -0,0 +1,111 @@
+"""
+PRISM LLM Request Coalescing
+Identical calls made at the same time share one in-flight request
+"""
+import threading
+from typing import Callable, Dict, Any, Tuple
+from llm.deadline import DeadlineExceeded, check_deadline, remaining
+
+
+class Flight:
+    """One in-flight call and the callers waiting on it"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.shared_error = True
+
+
+class SingleFlight:
+    """
+    Runs at most one call per key at a time
+
+    The first caller for a key (the leader) runs ``fn``; callers that
+    arrive with the same key while it is running wait and get the
+    leader's result (or exception) instead of making their own call.
+    The key is forgotten as soon as the call ends, so later callers rely
+    on the response cache, not on this class.
+
+    An error the leader caused itself (``share_error`` returns False, e.g.
+    its own streaming callback aborted the call) is not passed on, and
+    neither is the leader running out of time: the waiting callers retry,
+    one of them becoming the new leader. Waiters give up at their own
+    deadline.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._flights: Dict[str, Flight] = {}
+        self.stats = {'leaders': 0, 'coalesced': 0, 'retried': 0}
+
+    def do(self,
+           key: str,
+           fn: Callable[[], Any],
+           share_error: Callable[[BaseException], bool] = None) -> Tuple[Any, bool]:
+        """
+        Run ``fn`` unless an identical call is already in flight
+
+        Returns:
+            (result, coalesced) where ``coalesced`` is True if the result
+            came from another caller's call
+        """
+        while True:
+            with self._lock:
+                flight = self._flights.get(key)
+                leader = flight is None
+                if leader:
+                    flight = self._flights[key] = Flight()
+                    self.stats['leaders'] += 1
+
+            if leader:
+                return self._lead(key, flight, fn, share_error), False
+
+            if not flight.done.wait(remaining()):
+                # Our own deadline ran out first; the leader carries on for the others
+                check_deadline()
+                raise DeadlineExceeded("gave up waiting on an identical in-flight call")
+            if flight.error is None:
+                with self._lock:
+                    self.stats['coalesced'] += 1
+                return flight.result, True
+            if flight.shared_error:
+                with self._lock:
+                    self.stats['coalesced'] += 1
+                raise flight.error
+            with self._lock:
+                self.stats['retried'] += 1
+
+    def _lead(self, key: str, flight: Flight, fn: Callable[[], Any],
+              share_error: Callable[[BaseException], bool] = None) -> Any:
+        try:
+            flight.result = fn()
+            return flight.result
+        except BaseException as e:
+            flight.error = e
+            flight.shared_error = not isinstance(e, DeadlineExceeded) and (share_error is None or share_error(e))
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.done.set()
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self.stats, in_flight=len(self._flights))
+        calls = stats['leaders'] + stats['coalesced']
+        stats['dedup_rate'] = stats['coalesced'] / calls if calls else 0.0
+        return stats
+
+
+_shared_flights = None
+_shared_flights_lock = threading.Lock()
+
+
+def get_single_flight() -> SingleFlight:
+    """Process-wide coalescing layer shared by every LLMClient"""
+    global _shared_flights
+    with _shared_flights_lock:
+        if _shared_flights is None:
+            _shared_flights = SingleFlight()
+        return _shared_flights
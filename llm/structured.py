@@ -0,0 +1,208 @@
+"""
+PRISM Structured Output
+Output schemas for model calls, with validation and cheap local repair
+"""
+import json
+import re
+from typing import Dict, Any, List, Optional
+
+_TYPES = {
+    'object': dict,
+    'array': list,
+    'string': str,
+    'boolean': bool,
+    'null': type(None),
+}
+
+
+class StructuredOutputError(ValueError):
+    """A response could not be made to match its output schema"""
+
+    def __init__(self, message: str, text: str = "", errors: List[str] = None):
+        super().__init__(message)
+        self.text = text
+        self.errors = errors or []
+
+
+def _type_matches(value: Any, name: str) -> bool:
+    if name == 'integer':
+        return isinstance(value, int) and not isinstance(value, bool)
+    if name == 'number':
+        return isinstance(value, (int, float)) and not isinstance(value, bool)
+    return isinstance(value, _TYPES[name])
+
+
+def validate(value: Any, schema: Dict[str, Any], path: str = "$") -> List[str]:
+    """
+    Check ``value`` against the subset of JSON Schema the output schemas use
+
+    Supports type (single or list), properties, required, items, enum,
+    minimum and maximum. Returns one message per problem (empty if valid).
+    """
+    errors = []
+    types = schema.get('type')
+    if types:
+        types = [types] if isinstance(types, str) else types
+        if not any(_type_matches(value, name) for name in types):
+            return [f"{path}: expected {'/'.join(types)}, got {type(value).__name__}"]
+
+    if 'enum' in schema and value not in schema['enum']:
+        errors.append(f"{path}: {value!r} is not one of {schema['enum']}")
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        if 'minimum' in schema and value < schema['minimum']:
+            errors.append(f"{path}: {value} is below the minimum {schema['minimum']}")
+        if 'maximum' in schema and value > schema['maximum']:
+            errors.append(f"{path}: {value} is above the maximum {schema['maximum']}")
+
+    if isinstance(value, dict):
+        for name in schema.get('required', []):
+            if name not in value:
+                errors.append(f"{path}.{name}: required field missing")
+        for name, subschema in schema.get('properties', {}).items():
+            if name in value:
+                errors.extend(validate(value[name], subschema, f"{path}.{name}"))
+    elif isinstance(value, list) and 'items' in schema:
+        for i, item in enumerate(value):
+            errors.extend(validate(item, schema['items'], f"{path}[{i}]"))
+    return errors
+
+
+_NUMBER = re.compile(r'^[^\d\-]*(-?[\d,]*\.?\d+)\s*(%|[kKmM])?\b.*$')
+
+
+def _to_number(text: str, integer: bool) -> Optional[float]:
+    match = _NUMBER.match(text.strip())
+    if not match:
+        return None
+    number = float(match.group(1).replace(',', ''))
+    suffix = (match.group(2) or '').lower()
+    number *= {'k': 1_000, 'm': 1_000_000}.get(suffix, 1)
+    return int(round(number)) if integer else number
+
+
+def coerce(value: Any, schema: Dict[str, Any]) -> Any:
+    """
+    Fix the mistakes models make most often, without another call
+
+    Numbers sent as strings ("$50,000", "20%", "1.2M"), booleans as
+    "true"/"yes", enum values in the wrong case or with a trailing
+    explanation, a lone object where an array was asked for, and null for
+    an array. Anything it cannot fix is returned unchanged for validate().
+    """
+    types = schema.get('type')
+    types = [types] if isinstance(types, str) else (types or [])
+
+    if isinstance(value, str) and ('number' in types or 'integer' in types) and 'string' not in types:
+        number = _to_number(value, integer='number' not in types)
+        if number is not None:
+            value = number
+    elif isinstance(value, float) and 'integer' in types and 'number' not in types and value.is_integer():
+        value = int(value)
+    elif isinstance(value, str) and 'boolean' in types and 'string' not in types:
+        lowered = value.strip().lower()
+        if lowered in ('true', 'yes', 'y', '1'):
+            value = True
+        elif lowered in ('false', 'no', 'n', '0'):
+            value = False
+    elif 'array' in types and 'null' not in types and not isinstance(value, list):
+        value = [] if value is None else [value]
+
+    if isinstance(value, str) and 'enum' in schema and value not in schema['enum']:
+        lowered = value.strip().lower()
+        for option in schema['enum']:
+            if isinstance(option, str) and (lowered == option.lower() or lowered.startswith(option.lower() + ' ')):
+                value = option
+                break
+
+    if isinstance(value, dict):
+        properties = schema.get('properties', {})
+        value = {name: coerce(item, properties[name]) if name in properties else item
+                 for name, item in value.items()}
+    elif isinstance(value, list) and 'items' in schema:
+        value = [coerce(item, schema['items']) for item in value]
+    return value
+
+
+def extract_json(text: str) -> Any:
+    """
+    Parse the JSON value in a model reply
+
+    Tolerates markdown fences and prose around the value. Raises
+    ValueError if nothing in the text parses.
+    """
+    text = text.strip()
+    if "```" in text:
+        fenced = re.search(r"```(?:json)?\s*(.*?)```", text, re.DOTALL)
+        if fenced:
+            text = fenced.group(1).strip()
+    try:
+        return json.loads(text)
+    except ValueError:
+        pass
+    starts = [i for i in (text.find('{'), text.find('[')) if i != -1]
+    if starts:
+        start = min(starts)
+        end = text.rfind('}' if text[start] == '{' else ']')
+        if end > start:
+            return json.loads(text[start:end + 1])
+    raise ValueError(f"No JSON found in response: {text[:100]!r}")
+
+
+class OutputSchema:
+    """
+    Declared shape of one kind of model answer
+
+    Sent as a forced tool (Claude) or as the ``format`` option (Ollama) so
+    the provider emits matching JSON, then used to coerce and validate
+    what comes back.
+    """
+
+    def __init__(self, name: str, schema: Dict[str, Any], description: str = ""):
+        self.name = name
+        self.schema = schema
+        self.description = description or f"Record the {name.replace('_', ' ')}"
+
+    def tool(self) -> Dict[str, Any]:
+        """Anthropic tool definition that makes the model fill in this schema"""
+        return {"name": self.name, "description": self.description, "input_schema": self.schema}
+
+    def item_schema(self, key: str) -> "OutputSchema":
+        """Schema of the elements of the array property ``key``"""
+        return OutputSchema(f"{self.name}_{key}_item", self.schema['properties'][key]['items'])
+
+    def parse(self, text: str) -> Any:
+        """JSON value of ``text``, coerced towards the schema (not validated)"""
+        value = extract_json(text)
+        if self.schema.get('type') == 'object' and isinstance(value, list):
+            # Some providers answer an array-of-X schema with the bare array
+            arrays = [name for name, prop in self.schema.get('properties', {}).items()
+                      if prop.get('type') == 'array']
+            if len(arrays) == 1:
+                value = {arrays[0]: value}
+        return coerce(value, self.schema)
+
+    def errors(self, value: Any) -> List[str]:
+        return validate(value, self.schema)
+
+    def accepts(self, text: str) -> bool:
+        """True if ``text`` parses to a valid value (used to gate caching)"""
+        try:
+            return not self.errors(self.parse(text))
+        except ValueError:
+            return False
+
+
+def schema_example(schema: Dict[str, Any]) -> Any:
+    """Smallest value that satisfies ``schema`` (for offline fakes)"""
+    if 'enum' in schema:
+        return schema['enum'][0]
+    types = schema.get('type', 'object')
+    kind = types[0] if isinstance(types, list) else types
+    if kind == 'object':
+        properties = schema.get('properties', {})
+        return {name: schema_example(properties.get(name, {})) for name in schema.get('required', [])}
+    if kind == 'array':
+        return [schema_example(schema['items'])] if 'items' in schema else []
+    if kind in ('number', 'integer'):
+        return schema.get('minimum', 0)
+    return {'string': 'example', 'boolean': False, 'null': None}[kind]
@@ -20,17 +20,25 @@ import time
 import argparse
 from datetime import datetime
 from typing import List, Dict, Any
-import requests
+import sys
 from pathlib import Path
 
-# Ollama API Configuration
-OLLAMA_API = "http://localhost:11434/api/generate"
-MODEL = "llama3.1:8b"  # Using your installed model
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
 
-# PRISM Categorization System
-ENRICHMENT_PROMPT = """You are a software asset management expert analyzing enterprise software.
+from config.settings import OLLAMA_MODEL
+from llm.client import LLMClient
+from llm.providers import ProviderError
+from llm.packing import PromptPacker
+from llm.structured import OutputSchema, StructuredOutputError
 
-Analyze this software product and return a JSON object with:
+# Ollama model (OLLAMA_URL / OLLAMA_MODEL in config/settings.py)
+MODEL = OLLAMA_MODEL
+llm = LLMClient('Local Enrichment', task='categorisation')
+
+# PRISM Categorization System (shared by every product; sent once per packed request)
+ENRICHMENT_INSTRUCTIONS = """You are a software asset management expert analyzing enterprise software.
+
+Analyze the software product described after these instructions and return a JSON object with:
 
 1. **category** (string): Primary category from:
    - productivity
@@ -63,114 +71,101 @@ Analyze this software product and return a JSON object with:
 
 9. **cost_optimization_notes** (string): Brief notes on cost optimization opportunities
 
-Software to analyze:
+Return ONLY valid JSON, no other text."""
+
+PRODUCT_PROMPT = """Software to analyze:
 Name: {name}
 Vendor: {vendor}
 Description: {description}
-Annual Cost: {cost}
+Annual Cost: {cost}"""
+
+# Output token budgets: local models answer more slowly and have a smaller context
+MAX_TOKENS_PER_PRODUCT = 1000
+PACK_OUTPUT_TOKENS = 4000
+
+# Shape of the ENRICHMENT_INSTRUCTIONS answer; passed to Ollama as "format" (a forced tool on Claude fallback)
+ENRICHMENT_SCHEMA = OutputSchema("software_categorisation", {
+    "type": "object",
+    "properties": {
+        "category": {"type": "string", "enum": [
+            "productivity", "collaboration", "development", "data_analytics", "security",
+            "infrastructure", "sales_marketing", "finance_ops", "hr_recruiting", "customer_support",
+            "design_creative", "project_management", "other"
+        ]},
+        "subcategory": {"type": "string"},
+        "features": {"type": "array", "items": {"type": "string"}},
+        "use_cases": {"type": "array", "items": {"type": "string"}},
+        "user_personas": {"type": "array", "items": {"type": "string"}},
+        "integration_potential": {"type": "string", "enum": ["high", "medium", "low"]},
+        "consolidation_priority": {"type": "string", "enum": ["high", "medium", "low"]},
+        "estimated_users": {"type": "integer", "minimum": 0},
+        "cost_optimization_notes": {"type": "string"}
+    },
+    "required": ["category", "subcategory", "features", "use_cases", "user_personas",
+                 "integration_potential", "consolidation_priority", "estimated_users",
+                 "cost_optimization_notes"]
+}, "Record the software categorisation")
 
-Return ONLY valid JSON, no other text."""
 
+def enrich_software(name: str, vendor: str = "", description: str = "", cost: float = 0) -> Dict[str, Any]:
+    """Enrich a single software product using Ollama."""
 
-def call_ollama(prompt: str, model: str = MODEL, temperature: float = 0.1) -> str:
-    """Call local Ollama API for inference."""
+    print(f"  Processing: {name}...", end=" ", flush=True)
+    start_time = time.time()
 
-    payload = {
-        "model": model,
-        "prompt": prompt,
-        "stream": False,
-        "options": {
-            "temperature": temperature,
-            "top_p": 0.9,
-            "num_predict": 1000
-        }
-    }
+    prompt = build_prompt(name, vendor, description, cost)
 
+    # Categorisation route: Ollama first, Claude as fallback
     try:
-        response = requests.post(OLLAMA_API, json=payload, timeout=120)
-        response.raise_for_status()
-
-        result = response.json()
-        return result.get('response', '')
-
-    except requests.exceptions.RequestException as e:
-        print(f"❌ Ollama API error: {e}")
+        enrichment, response = llm.complete_json(prompt, ENRICHMENT_SCHEMA, model=MODEL,
+                                                 max_tokens=MAX_TOKENS_PER_PRODUCT, temperature=0.1,
+                                                 prompt_prefix=ENRICHMENT_INSTRUCTIONS)
+    except ProviderError as e:
+        print(f"❌ Failed ({e})")
         return None
-
-
-def extract_json_from_response(response: str) -> Dict[str, Any]:
-    """Extract and parse JSON from Ollama response."""
-
-    # Try to find JSON in response
-    try:
-        # Look for JSON between ```json and ```
-        if '```json' in response:
-            start = response.find('```json') + 7
-            end = response.find('```', start)
-            json_str = response[start:end].strip()
-        elif '```' in response:
-            start = response.find('```') + 3
-            end = response.find('```', start)
-            json_str = response[start:end].strip()
-        else:
-            # Assume entire response is JSON
-            json_str = response.strip()
-
-        # Remove any leading/trailing text
-        if '{' in json_str:
-            start_idx = json_str.find('{')
-            end_idx = json_str.rfind('}') + 1
-            json_str = json_str[start_idx:end_idx]
-
-        return json.loads(json_str)
-
-    except json.JSONDecodeError as e:
-        print(f"⚠️  JSON parse error: {e}")
-        print(f"Response: {response[:200]}...")
+    except StructuredOutputError as e:
+        print(f"❌ Parse error ({e})")
         return None
 
+    if response.fallback:
+        print(f"(via {response.provider})", end=" ", flush=True)
 
-def enrich_software(name: str, vendor: str = "", description: str = "", cost: float = 0) -> Dict[str, Any]:
-    """Enrich a single software product using Ollama."""
+    elapsed = time.time() - start_time
+    print(f"✅ {elapsed:.1f}s")
 
-    print(f"  Processing: {name}...", end=" ", flush=True)
-    start_time = time.time()
+    return add_metadata(enrichment, name, vendor, elapsed)
 
-    # Build prompt
-    prompt = ENRICHMENT_PROMPT.format(
+
+def build_prompt(name: str, vendor: str = "", description: str = "", cost: float = 0) -> str:
+    """Per-product part of the prompt (follows ENRICHMENT_INSTRUCTIONS)."""
+    return PRODUCT_PROMPT.format(
         name=name,
         vendor=vendor or "Unknown",
         description=description or "No description",
         cost=f"${cost:,.2f}" if cost > 0 else "Unknown"
     )
 
-    # Call Ollama
-    response = call_ollama(prompt)
-
-    if not response:
-        print("❌ Failed")
-        return None
-
-    # Parse JSON
-    enrichment = extract_json_from_response(response)
 
-    if not enrichment:
-        print("❌ Parse error")
-        return None
-
-    elapsed = time.time() - start_time
-    print(f"✅ {elapsed:.1f}s")
-
-    # Add metadata
+def add_metadata(enrichment: Dict[str, Any], name: str, vendor: str, elapsed: float) -> Dict[str, Any]:
+    """Record where and when an enrichment was produced."""
     enrichment['original_name'] = name
     enrichment['original_vendor'] = vendor
     enrichment['enriched_at'] = datetime.now().isoformat()
     enrichment['enrichment_source'] = 'ollama_' + MODEL
     enrichment['processing_time_seconds'] = elapsed
-
     return enrichment
 
 
+def product_fields(product: Dict[str, str]) -> Dict[str, Any]:
+    """Name, vendor, description and cost of a CSV row (either column naming)."""
+    return {
+        'name': product.get('Software Name', product.get('name', '')),
+        'vendor': product.get('Vendor', product.get('vendor', '')),
+        'description': product.get('Description', product.get('description', '')),
+        'cost': float(product.get('Annual Cost', product.get('cost', 0)) or 0),
+    }
+
+
 def process_csv(input_file: str, output_file: str = None, limit: int = None):
     """Process CSV file with software list."""
 
@@ -201,24 +196,29 @@ def process_csv(input_file: str, output_file: str = None, limit: int = None):
 
     print(f"📊 Found {len(products)} products to process\n")
 
-    # Process each product
+    # Several products per request; products whose packed answer fails are retried alone
     enriched_products = []
     start_time = time.time()
-
-    for i, product in enumerate(products, 1):
-        print(f"[{i}/{len(products)}]", end=" ")
-
-        result = enrich_software(
-            name=product.get('Software Name', product.get('name', '')),
-            vendor=product.get('Vendor', product.get('vendor', '')),
-            description=product.get('Description', product.get('description', '')),
-            cost=float(product.get('Annual Cost', product.get('cost', 0)) or 0)
-        )
-
-        if result:
-            # Merge with original data
-            result['original_data'] = product
-            enriched_products.append(result)
+    packer = PromptPacker(llm, ENRICHMENT_SCHEMA, prompt_prefix=ENRICHMENT_INSTRUCTIONS, model=MODEL,
+                          max_tokens_per_item=MAX_TOKENS_PER_PRODUCT, temperature=0.1,
+                          output_budget=PACK_OUTPUT_TOKENS)
+    items = ((str(idx), build_prompt(**product_fields(product))) for idx, product in enumerate(products))
+
+    for i, (item_id, enrichment, error) in enumerate(packer.run(items), 1):
+        product = products[int(item_id)]
+        fields = product_fields(product)
+        print(f"[{i}/{len(products)}]  {fields['name']}...", end=" ")
+
+        if error:
+            print(f"❌ Failed ({error})")
+            continue
+        print("✅")
+
+        # Packed products share a request: record the average time per product so far
+        result = add_metadata(enrichment, fields['name'], fields['vendor'], (time.time() - start_time) / i)
+        # Merge with original data
+        result['original_data'] = product
+        enriched_products.append(result)
 
         # Progress update
         if i % 10 == 0:
@@ -243,6 +243,8 @@ def process_csv(input_file: str, output_file: str = None, limit: int = None):
     print(f"   Success rate: {success_count/len(products)*100:.1f}%")
     print(f"   Total time: {total_time/60:.1f} minutes")
     print(f"   Average time: {total_time/len(products):.1f} seconds per product")
+    print(f"   Packed requests: {packer.stats['packs']} ({packer.stats['packed_items']} products), "
+          f"{packer.stats['single_requests']} single, {packer.stats['requeued']} re-queued")
     print(f"   Cost: $0.00 (vs ~${len(products)*0.012:.2f} with Claude API)")
     print(f"   Output: {output_file}")
     print(f"{'='*60}\n")
@@ -6,37 +6,131 @@ from agents.vendor_intelligence import VendorIntelligenceAgent
 from agents.alternative_discovery import AlternativeDiscoveryAgent
 from agents.cost_optimization import CostOptimizationAgent
 from agents.report_generation import ReportGenerationAgent
+from agents.governor import get_governor
+from config.settings import AGENT_ITEM_TIMEOUT, AGENT_RUN_TIMEOUT, LLM_HEDGING
 from database.db import Database
+from llm.deadline import DeadlineExceeded, deadline
+from llm.executor import get_executor
+from llm.hedging import get_hedger
+from llm.metrics import LLM_USAGE
 
 
 def analyze_full_portfolio():
-    """Run complete portfolio analysis"""
+    """
+    Run complete portfolio analysis
+    
+    Each vendor/software item gets AGENT_ITEM_TIMEOUT seconds and the
+    analysis steps together AGENT_RUN_TIMEOUT seconds (llm/deadline.py);
+    an item that runs out is reported and the run moves on. Items still
+    queued when the run budget is spent are skipped, and the report is
+    generated from whatever finished.
+    
+    The run governor (agents/governor.py) also holds the run to its token
+    and dollar budgets: items go highest annual spend first, calls move to
+    a cheaper model as budgets run low, and low-spend items are skipped
+    and listed in the report.
+    """
     print("=" * 60)
     print("PRISM - Portfolio Risk Intelligence & Savings Management")
     print("=" * 60)
     print()
     
+    outcome = {'timed_out': 0}
+    governor = get_governor()
+    governor.start()
+    with deadline(AGENT_RUN_TIMEOUT, "portfolio run") as run:
+        try:
+            _run_analyses(outcome)
+        except DeadlineExceeded as e:
+            print(f"\n⏱  {e}; remaining analysis steps skipped")
+        except KeyboardInterrupt:
+            # Workers stop at their next LLM event or query instead of finishing their item
+            run.cancel()
+            raise
+    
+    print()
+    print("📄 Step 4: Generating executive report...")
+    print("-" * 60)
+    
+    report_agent = ReportGenerationAgent()
+    with deadline(AGENT_ITEM_TIMEOUT, "executive report"):
+        report = report_agent.generate_executive_report()
+    
+    # Save report to file
+    with open("PRISM_Executive_Report.md", "w") as f:
+        f.write(report + governor.skipped_markdown())
+    
+    print()
+    print("=" * 60)
+    if outcome['timed_out']:
+        print(f"⚠️  ANALYSIS COMPLETE ({outcome['timed_out']} items ran out of time)")
+    else:
+        print("✅ ANALYSIS COMPLETE!")
+    print("=" * 60)
+    print(f"\n📄 Report saved to: PRISM_Executive_Report.md")
+    
+    print("\nLLM usage (tokens, latency, cost per agent):")
+    print(LLM_USAGE.summary())
+    try:
+        Database().save_llm_run_usage(LLM_USAGE.snapshot())
+    except Exception as e:
+        print(f"Error saving LLM usage for run {LLM_USAGE.run_id}: {e}")
+    print(governor.summary())
+    if LLM_HEDGING:
+        hedging = get_hedger().snapshot()
+        print(f"Hedged {hedging['hedged']} of {hedging['calls']} calls, {hedging['hedge_won']} answered first "
+              f"({hedging['skipped_budget']} skipped for budget, {hedging['skipped_throttled']} while throttled)")
+    print("\nKey findings:")
+    print(report[:500] + "...\n")
+
+
+def _run_analyses(outcome: dict):
+    """Steps 1-3 (run under the run deadline); counts items that ran out of time in ``outcome``"""
     db = Database()
     
     # Initialize agents
     vendor_agent = VendorIntelligenceAgent()
     alternative_agent = AlternativeDiscoveryAgent()
     cost_agent = CostOptimizationAgent()
-    report_agent = ReportGenerationAgent()
+    governor = get_governor()
+    
+    def report_error(label, error):
+        if isinstance(error, DeadlineExceeded):
+            outcome['timed_out'] += 1
+            print(f"⏱  {label}: {error}")
+        else:
+            print(f"Error {label}: {error}")
     
     print("📊 Step 1: Analyzing vendors...")
     print("-" * 60)
     
-    # Get all unique vendors
-    vendors_query = "SELECT DISTINCT vendor_name FROM software_assets"
+    # Get all unique vendors (highest spend first) and their existing intelligence in two queries
+    vendors_query = """
+        SELECT vendor_name, SUM(total_annual_cost) AS total_annual_cost
+        FROM software_assets
+        GROUP BY vendor_name
+        ORDER BY total_annual_cost DESC
+    """
     vendors = db.execute_query(vendors_query)
+    existing_vendors = db.get_vendors_by_names([v['vendor_name'] for v in vendors])
+    
+    # Agent calls run concurrently; the shared rate limiter paces the API
+    executor = get_executor()
     
-    for vendor_row in vendors:
+    def analyze_vendor(vendor_row):
         vendor_name = vendor_row['vendor_name']
-        try:
-            vendor_agent.analyze_vendor(vendor_name)
-        except Exception as e:
-            print(f"Error analyzing {vendor_name}: {e}")
+        if not governor.admit(f"vendor {vendor_name}", vendor_row['total_annual_cost']):
+            return None
+        with deadline(AGENT_ITEM_TIMEOUT, f"vendor {vendor_name}"):
+            return vendor_agent.analyze_vendor(
+                vendor_name,
+                existing_vendor=existing_vendors.get(vendor_name),
+                preloaded=True
+            )
+    
+    for vendor_row, _, error in executor.imap_unordered(analyze_vendor, vendors):
+        if error:
+            report_error(f"analyzing {vendor_row['vendor_name']}", error)
     
     print()
     print("🔍 Step 2: Finding alternatives for replacement candidates...")
@@ -45,11 +139,17 @@ def analyze_full_portfolio():
     # Get replacement candidates
     candidates = db.get_replacement_candidates()
     
-    for software in candidates[:5]:  # Limit to top 5 for demo
-        try:
-            alternative_agent.find_alternatives(software['id'])
-        except Exception as e:
-            print(f"Error finding alternatives for {software['software_name']}: {e}")
+    def find_alternatives(software):
+        if not governor.admit(f"alternatives for {software['software_name']}", software['total_annual_cost']):
+            return None
+        with deadline(AGENT_ITEM_TIMEOUT, f"alternatives for {software['software_name']}"):
+            return alternative_agent.find_alternatives(software['id'], software=software)
+    
+    # Limit to top 5 (by replacement priority) for demo; within them the highest spend goes first
+    top_candidates = sorted(candidates[:5], key=lambda software: software['total_annual_cost'] or 0, reverse=True)
+    for software, _, error in executor.imap_unordered(find_alternatives, top_candidates):
+        if error:
+            report_error(f"finding alternatives for {software['software_name']}", error)
     
     print()
     print("💰 Step 3: Analyzing cost optimization opportunities...")
@@ -63,29 +163,27 @@ def analyze_full_portfolio():
     """
     software_with_usage = db.execute_query(usage_query)
     
-    for sw in software_with_usage:
-        try:
-            cost_agent.analyze_costs(sw['id'])
-        except Exception as e:
-            print(f"Error analyzing costs: {e}")
+    # Batch-load rows and latest usage instead of two queries per software
+    software_ids = [sw['id'] for sw in software_with_usage]
+    software_rows = db.get_software_by_ids(software_ids)
+    latest_usage = db.get_latest_usage_by_software_ids(software_ids)
     
-    print()
-    print("📄 Step 4: Generating executive report...")
-    print("-" * 60)
-    
-    report = report_agent.generate_executive_report()
-    
-    # Save report to file
-    with open("PRISM_Executive_Report.md", "w") as f:
-        f.write(report)
+    def analyze_costs(entry):
+        software_id, software = entry
+        if not governor.admit(f"costs for {software.get('software_name', software_id)}",
+                              software.get('total_annual_cost')):
+            return None
+        with deadline(AGENT_ITEM_TIMEOUT, f"costs for {software.get('software_name', software_id)}"):
+            return cost_agent.analyze_costs(
+                software_id,
+                software=software,
+                usage=latest_usage.get(software_id)
+            )
     
-    print()
-    print("=" * 60)
-    print("✅ ANALYSIS COMPLETE!")
-    print("=" * 60)
-    print(f"\n📄 Report saved to: PRISM_Executive_Report.md")
-    print("\nKey findings:")
-    print(report[:500] + "...\n")
+    by_spend = sorted(software_rows.items(), key=lambda entry: entry[1].get('total_annual_cost') or 0, reverse=True)
+    for _, _, error in executor.imap_unordered(analyze_costs, by_spend):
+        if error:
+            report_error("analyzing costs", error)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+"""
+Behaviour tests for database/pool.py - no Postgres needed
+Connections are stand-ins that record what the pool does with them
+
+Run with pytest, or directly: python scripts/python/test_database_pool.py
+"""
+
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+import psycopg2.extensions
+from database.pool import ConnectionPool, PoolTimeout
+
+
+class FakeConnection:
+    """Just enough of a psycopg2 connection for the pool"""
+
+    class _Info:
+        transaction_status = psycopg2.extensions.TRANSACTION_STATUS_IDLE
+
+    class _Cursor:
+        def __init__(self, conn):
+            self.conn = conn
+
+        def __enter__(self):
+            return self
+
+        def __exit__(self, *exc):
+            return False
+
+        def execute(self, query):
+            if not self.conn.alive:
+                raise psycopg2.OperationalError("server closed the connection unexpectedly")
+
+    def __init__(self):
+        self.closed = 0
+        self.alive = True
+        self.rollbacks = 0
+        self.info = self._Info()
+
+    def cursor(self):
+        return self._Cursor(self)
+
+    def rollback(self):
+        self.rollbacks += 1
+        self.info.transaction_status = psycopg2.extensions.TRANSACTION_STATUS_IDLE
+
+    def close(self):
+        self.closed = 1
+
+
+class FakePool(ConnectionPool):
+    def __init__(self, **kwargs):
+        super().__init__("postgresql://fake", **kwargs)
+        self.created = []
+
+    def _connect(self):
+        conn = FakeConnection()
+        self.created.append(conn)
+        with self._cond:
+            self._stats['connections_created'] += 1
+        return conn
+
+
+def test_reuses_returned_connections():
+    pool = FakePool(max_size=2)
+    first = pool.getconn()
+    pool.putconn(first)
+    second = pool.getconn()
+    assert second is first
+    stats = pool.stats()
+    assert stats['connections_created'] == 1
+    assert stats['checkouts'] == 2
+    assert stats['in_use'] == 1
+
+
+def test_times_out_when_exhausted():
+    pool = FakePool(max_size=1, timeout=0.05)
+    pool.getconn()
+    try:
+        pool.getconn()
+    except PoolTimeout:
+        pass
+    else:
+        raise AssertionError("second checkout should time out")
+    assert pool.stats()['timeouts'] == 1
+    assert len(pool.created) == 1
+
+
+def test_waiter_gets_the_returned_connection():
+    pool = FakePool(max_size=1, timeout=5)
+    conn = pool.getconn()
+    threading.Timer(0.05, pool.putconn, (conn,)).start()
+    assert pool.getconn() is conn
+    stats = pool.stats()
+    assert stats['waits'] == 1
+    assert stats['wait_time_max'] >= 0.04
+
+
+def test_replaces_dead_connections_on_checkout():
+    pool = FakePool(max_size=2, check_after=0)
+    conn = pool.getconn()
+    pool.putconn(conn)
+    conn.alive = False
+    replacement = pool.getconn()
+    assert replacement is not conn
+    assert conn.closed
+    stats = pool.stats()
+    assert stats['failed_liveness_checks'] == 1
+    assert stats['size'] == 1
+
+
+def test_reaps_idle_connections_down_to_min_size():
+    pool = FakePool(min_size=1, max_size=3, max_idle=0.01)
+    conns = [pool.getconn() for _ in range(3)]
+    for conn in conns:
+        pool.putconn(conn)
+    time.sleep(0.02)
+    pool.getconn()
+    stats = pool.stats()
+    assert stats['connections_closed'] == 2
+    assert stats['size'] == 1
+
+
+def test_rolls_back_connections_returned_mid_transaction():
+    pool = FakePool(max_size=1)
+    conn = pool.getconn()
+    conn.info.transaction_status = psycopg2.extensions.TRANSACTION_STATUS_INTRANS
+    pool.putconn(conn)
+    assert conn.rollbacks == 1
+    assert pool.getconn() is conn
+
+
+def test_closed_pool_refuses_checkouts():
+    pool = FakePool(max_size=1)
+    conn = pool.getconn()
+    pool.putconn(conn)
+    pool.close()
+    assert conn.closed
+    try:
+        pool.getconn()
+    except psycopg2.InterfaceError:
+        pass
+    else:
+        raise AssertionError("checkout from a closed pool should fail")
+
+
+def main():
+    tests = [value for name, value in sorted(globals().items()) if name.startswith("test_")]
+    failed = 0
+    for test in tests:
+        try:
+            test()
+            print(f"✅ {test.__name__}")
+        except Exception as e:
+            failed += 1
+            print(f"❌ {test.__name__}: {type(e).__name__}: {e}")
+    print(f"\n{len(tests) - failed}/{len(tests)} passed")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
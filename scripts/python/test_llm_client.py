@@ -0,0 +1,252 @@
+#!/usr/bin/env python3
+"""
+Behaviour tests for the llm package - no API key or network needed
+Live calls and batches go to llm/fake_server.py on a local port
+
+Run with pytest, or directly: python scripts/python/test_llm_client.py
+"""
+
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+# Before config.settings is imported: never reach the real API, keep the cache in memory
+FAKE_PORT = 8765
+os.environ["ANTHROPIC_BASE_URL"] = f"http://127.0.0.1:{FAKE_PORT}"
+os.environ.setdefault("ANTHROPIC_API_KEY", "sk-ant-test")
+os.environ["LLM_CACHE_BACKEND"] = "memory"
+os.environ["LLM_PROVIDER"] = ""
+os.environ["LLM_CASSETTE_MODE"] = ""
+
+from llm import fake_server
+from llm.batch import BatchJob
+from llm.cache import EVICT_EVERY, MemoryStore, ResponseCache, SQLiteStore
+from llm.client import LLMClient
+from llm.deadline import DeadlineExceeded, deadline
+from llm.json_stream import JSONArrayStream, StreamAborted
+from llm.metrics import LLM_USAGE
+from llm.retry import FATAL, RETRYABLE, RetryBudget, RetryPolicy
+
+_server = None
+_server_lock = threading.Lock()
+
+
+def fake_api():
+    """Start the fake Messages API once for every test that needs it"""
+    global _server
+    with _server_lock:
+        if _server is None:
+            _server = fake_server.serve(port=FAKE_PORT, batch_delay=0)
+            threading.Thread(target=_server.serve_forever, daemon=True).start()
+    return _server
+
+
+class Flaky:
+    """Callable failing ``failures`` times with ``error`` before returning "done\""""
+
+    def __init__(self, failures: int, error: Exception = None):
+        self.failures = failures
+        self.error = error or ConnectionError("connection reset")
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        if self.calls <= self.failures:
+            raise self.error
+        return "done"
+
+
+def classify(error):
+    return RETRYABLE if isinstance(error, ConnectionError) else FATAL
+
+
+# ---------------------------------------------------------------- cache
+
+
+def test_cache_hits_misses_and_ttl():
+    cache = ResponseCache(MemoryStore(max_entries=10))
+    assert cache.get("k") is None
+    cache.put("k", {"text": "hello"}, ttl=0.05)
+    assert cache.get("k") == {"text": "hello"}
+    time.sleep(0.06)
+    assert cache.get("k") is None
+    assert cache.stats['hits'] == 1
+    assert cache.stats['misses'] == 2
+
+
+def test_memory_store_evicts_least_recently_used():
+    store = MemoryStore(max_entries=2)
+    store.put("a", "1", None)
+    store.put("b", "2", None)
+    store.get("a")
+    assert store.put("c", "3", None) == 1
+    assert store.get("b") is None
+    assert store.get("a") == "1"
+
+
+def test_sqlite_store_trims_every_evict_every_puts():
+    store = SQLiteStore(os.path.join(tempfile.mkdtemp(), "cache.db"), max_entries=10)
+    evicted = sum(store.put(f"k{i}", "v", None) for i in range(EVICT_EVERY))
+    (count,) = store._conn.execute("SELECT COUNT(*) FROM llm_responses").fetchone()
+    assert evicted == EVICT_EVERY - 10
+    assert count == 10
+    assert store.get(f"k{EVICT_EVERY - 1}") == "v"
+
+
+def test_client_serves_repeat_requests_from_cache():
+    fake_api()
+    llm = LLMClient("Cache Test Agent")
+    first = llm.complete("Reply with {\"answer\": 42}", bypass_cache=True)
+    second = llm.complete("Reply with {\"answer\": 42}")
+    assert not first.cached and second.cached
+    assert second.text == first.text == '{"answer": 42}'
+    totals = LLM_USAGE.agent_totals("Cache Test Agent")
+    assert totals['calls'] == 2
+    assert totals['cache_hits'] == 1
+    assert totals['output_tokens'] == first.usage['output_tokens']
+
+
+# ---------------------------------------------------------------- retry / budget
+
+
+def test_retries_transient_errors_until_success():
+    policy = RetryPolicy("test", classify, max_retries=3, base_delay=0, budget=RetryBudget(minimum=10))
+    flaky = Flaky(failures=2)
+    assert policy.call(flaky) == ("done", 2)
+    assert flaky.calls == 3
+
+
+def test_fatal_errors_are_not_retried():
+    policy = RetryPolicy("test", classify, base_delay=0, budget=RetryBudget(minimum=10))
+    flaky = Flaky(failures=1, error=ValueError("bad request"))
+    try:
+        policy.call(flaky)
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("fatal error should propagate")
+    assert flaky.calls == 1
+
+
+def test_retry_budget_stops_retries_across_calls():
+    budget = RetryBudget(ratio=0.0, minimum=1)
+    policy = RetryPolicy("test", classify, max_retries=3, base_delay=0, budget=budget)
+    assert policy.call(Flaky(failures=1)) == ("done", 1)
+    flaky = Flaky(failures=1)
+    try:
+        policy.call(flaky)
+    except ConnectionError:
+        pass
+    else:
+        raise AssertionError("retry past the budget should fail fast")
+    assert flaky.calls == 1
+    assert budget.snapshot()['denied'] == 1
+
+
+def test_no_retry_wait_past_the_deadline():
+    policy = RetryPolicy("test", classify, budget=RetryBudget(minimum=10))
+    policy.delay = lambda retry, retry_after=None: 10
+    started = time.monotonic()
+    try:
+        with deadline(0.5, "test call"):
+            policy.call(Flaky(failures=1))
+    except (ConnectionError, DeadlineExceeded):
+        pass
+    else:
+        raise AssertionError("call should fail rather than wait past its deadline")
+    assert time.monotonic() - started < 0.5
+
+
+# ---------------------------------------------------------------- json_stream
+
+
+def test_stream_yields_elements_as_they_complete():
+    parser = JSONArrayStream()
+    assert parser.feed('Here you go:\n```json\n[{"name": "A"}, {"na') == [{"name": "A"}]
+    assert parser.feed('me": "B, [x]"}') == []
+    assert parser.feed(', 3]\n```') == [{"name": "B, [x]"}, 3]
+    assert parser.close() == [{"name": "A"}, {"name": "B, [x]"}, 3]
+
+
+def test_nested_stream_reads_the_inner_array():
+    parser = JSONArrayStream(nested=True)
+    items = parser.feed('{"alternatives": [{"id": 1}, {"id": 2}], "note": "x"}')
+    assert items == [{"id": 1}, {"id": 2}]
+    assert parser.close() == items
+
+
+def test_stream_aborts_on_prose_and_keeps_what_arrived():
+    try:
+        JSONArrayStream(max_preamble=20).feed("I'm sorry, I can't produce that list.")
+    except StreamAborted as e:
+        assert "no JSON" in str(e)
+    else:
+        raise AssertionError("prose should abort the stream")
+
+    parser = JSONArrayStream()
+    parser.feed('[{"a": 1}, {"a": 2')
+    try:
+        parser.close()
+    except StreamAborted as e:
+        assert e.items == [{"a": 1}]
+    else:
+        raise AssertionError("truncated array should abort on close")
+
+
+def test_stream_aborts_on_mismatched_brackets():
+    try:
+        JSONArrayStream().feed('[{"a": 1]')
+    except StreamAborted as e:
+        assert "unexpected ']'" in str(e)
+    else:
+        raise AssertionError("mismatched bracket should abort")
+
+
+# ---------------------------------------------------------------- batch flow
+
+
+def test_batch_results_are_billed_and_cached():
+    fake_api()
+    llm = LLMClient("Batch Test Agent")
+    job = BatchJob(llm)
+    prompts = {f"item-{i}": f"Reply with {{\"item\": {i}}}" for i in range(3)}
+    requests, keys = [], {}
+    for custom_id, prompt in prompts.items():
+        requests.append((custom_id, llm.request_params(prompt, None, "claude-sonnet-4-5", 256, None)))
+        keys[custom_id] = llm.request_key(prompt, None, "claude-sonnet-4-5", 256, None)
+
+    batch_id = job.submit(requests)
+    assert job.wait(batch_id, poll_interval=0.01).processing_status == "ended"
+    results = {custom_id: (response, error) for custom_id, response, error in job.results(batch_id, keys)}
+
+    assert set(results) == set(prompts)
+    for custom_id, (response, error) in results.items():
+        assert error is None
+        assert response.text == prompts[custom_id][len("Reply with "):]
+    assert LLM_USAGE.agent_totals("Batch Test Agent")['calls'] == 3
+
+    # A later interactive run over the same item is served from the cache
+    again = llm.complete(prompts["item-1"], model="claude-sonnet-4-5", max_tokens=256)
+    assert again.cached and again.text == '{"item": 1}'
+
+
+def main():
+    tests = [value for name, value in globals().items() if name.startswith("test_")]
+    failed = 0
+    for test in tests:
+        try:
+            test()
+            print(f"✅ {test.__name__}")
+        except Exception as e:
+            failed += 1
+            print(f"❌ {test.__name__}: {type(e).__name__}: {e}")
+    print(f"\n{len(tests) - failed}/{len(tests)} passed")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()